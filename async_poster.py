@@ -0,0 +1,496 @@
+"""
+Асинхронный автопостер для встраивания в asyncio-сервисы: запросы через aiohttp,
+опрос каналов и доставка постов - конкурентные задачи в одном потоке
+"""
+
+import json
+import time
+import asyncio
+import logging
+import threading
+from datetime import datetime, timedelta
+from config import *
+from main import TwitchAutoPoster, chunked, HELIX_BATCH_SIZE
+from http_client import PlatformSession
+from twitch_auth import TwitchTokenManager
+from rate_limit import RateLimitGovernor, endpoint_name
+from circuit_breaker import CircuitBreakers, CircuitOpenError
+from scheduler import AdaptivePollScheduler, parse_started_at
+from channel_state import ChannelStateTable
+from state_snapshot import StateSnapshot, SnapshotFlusher
+from fanout import DeliveryReport, DeliveryResult, destination_deadline
+from dedupe import StreamDedupeIndex
+from render import MessageRenderer
+from channels import ChannelsFile
+from metrics import POLL_CYCLE_SECONDS, HTTP_REQUEST_SECONDS, HTTP_RESPONSES, DETECTION_SECONDS
+
+try:
+    import aiohttp
+except ImportError:  # Необязательная зависимость: нужна только асинхронному постеру
+    aiohttp = None
+
+logger = logging.getLogger(__name__)
+
+class AsyncResponse:
+    """Прочитанный ответ с тем же интерфейсом, что у requests: его ждут регулятор и код постинга"""
+    
+    def __init__(self, status_code, headers, content, elapsed):
+        self.status_code = status_code
+        self.headers = headers
+        self.content = content
+        self.elapsed = timedelta(seconds=elapsed)
+    
+    def json(self):
+        return json.loads(self.content)
+
+class AsyncPlatformSession:
+    """Неблокирующая сессия платформы: пул соединений, таймауты, квоты и автоматы защиты"""
+    
+    def __init__(self, platform, pool_size, timeout, governor=None, breakers=None):
+        self.platform = platform
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self.governor = governor
+        self.breakers = breakers
+        self.session = None
+    
+    def client(self):
+        """Сессия aiohttp создается внутри работающего цикла событий"""
+        if self.session is None or self.session.closed:
+            connect, read = self.timeout
+            self.session = aiohttp.ClientSession(
+                connector=aiohttp.TCPConnector(limit=self.pool_size),
+                timeout=aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+            )
+        return self.session
+    
+    async def request(self, method, url, params=None, data=None, headers=None):
+        """Запрос с ожиданием квоты и повтором после ответа "слишком часто" """
+        endpoint = endpoint_name(url)
+        breaker = self.breakers.get(self.platform, endpoint) if self.breakers else None
+        if breaker and not breaker.allow():
+            raise CircuitOpenError(f"{self.platform}/{endpoint} временно недоступен")
+        if params is not None:
+            params = [(name, str(value)) for name, value in params]
+        if data is not None:
+            # requests пропускает поля со значением None, aiohttp - нет
+            data = {name: str(value) for name, value in data.items() if value is not None}
+        
+        try:
+            for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+                if self.governor:
+                    wait = self.governor.reserve(self.platform, endpoint)
+                    if wait > 0:
+                        await asyncio.sleep(wait)
+                response = await self.timed_request(endpoint, method, url, params, data, headers)
+                if not self.governor or not self.governor.observe(self.platform, endpoint, response):
+                    break
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            if breaker:
+                breaker.record_failure()
+            raise
+        if breaker:
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        return response
+    
+    async def timed_request(self, endpoint, method, url, params, data, headers):
+        """Запрос с учетом длительности и кода ответа в метриках"""
+        started = time.perf_counter()
+        try:
+            async with self.client().request(method, url, params=params, data=data,
+                                             headers=headers) as response:
+                content = await response.read()
+        except Exception:
+            HTTP_RESPONSES.inc(self.platform, endpoint, "error")
+            raise
+        finally:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, self.platform, endpoint)
+        HTTP_RESPONSES.inc(self.platform, endpoint, str(response.status))
+        return AsyncResponse(response.status, response.headers, content, time.perf_counter() - started)
+    
+    async def get(self, url, **kwargs):
+        return await self.request("GET", url, **kwargs)
+    
+    async def post(self, url, **kwargs):
+        return await self.request("POST", url, **kwargs)
+    
+    async def close(self):
+        """Закрытие соединений"""
+        if self.session is not None:
+            await self.session.close()
+
+class AsyncTwitchAutoPoster:
+    """Асинхронный вариант TwitchAutoPoster: те же методы-хуки, но корутины.
+    Опрос, новые стримы и назначения обрабатываются конкурентно, отмена задачи run() останавливает постер"""
+    
+    # Логика без ввода-вывода общая с синхронным постером
+    multi_channel = TwitchAutoPoster.multi_channel
+    last_stream_status = TwitchAutoPoster.last_stream_status
+    channel_keys = TwitchAutoPoster.channel_keys
+    has_channel = TwitchAutoPoster.has_channel
+    reload_channels = TwitchAutoPoster.reload_channels
+    channel_key = TwitchAutoPoster.channel_key
+    stream_id = TwitchAutoPoster.stream_id
+    build_payloads = TwitchAutoPoster.build_payloads
+    telegram_payload = TwitchAutoPoster.telegram_payload
+    channel_destinations = TwitchAutoPoster.channel_destinations
+    restore_states = TwitchAutoPoster.restore_states
+    
+    def __init__(self, logins=None, user_ids=None):
+        if aiohttp is None:
+            raise RuntimeError("Для AsyncTwitchAutoPoster нужен aiohttp: pip install aiohttp")
+        self.governor = RateLimitGovernor()
+        self.breakers = CircuitBreakers() if CIRCUIT_BREAKER_ENABLED else None
+        self.twitch = AsyncPlatformSession("twitch", TWITCH_POOL_SIZE, TWITCH_TIMEOUT, self.governor)
+        self.telegram = AsyncPlatformSession("telegram", TELEGRAM_POOL_SIZE, TELEGRAM_TIMEOUT,
+                                             self.governor, self.breakers)
+        self.vk = AsyncPlatformSession("vk", VK_POOL_SIZE, VK_TIMEOUT, self.governor, self.breakers)
+        # Токен обновляется редко, поэтому менеджер с кэшем на диске работает в потоке
+        self.token_manager = TwitchTokenManager(PlatformSession("twitch", 1, TWITCH_TIMEOUT, self.governor))
+        self.twitch_token = None
+        self.last_post_time = None
+        
+        self.channels = {}
+        self.channels_file = None
+        if logins is None and user_ids is None:
+            channels_file = ChannelsFile()
+            if channels_file.exists():
+                self.channels_file = channels_file
+            else:
+                logins = TWITCH_STREAMER_LOGINS
+                user_ids = TWITCH_STREAMER_IDS
+        # Упорядоченные множества (dict): проверка и удаление канала за O(1) при любом их числе
+        self.logins = dict.fromkeys(login.lower() for login in (logins or []))
+        self.user_ids = dict.fromkeys(str(user_id) for user_id in (user_ids or []))
+        # Снимок сбрасывается на диск своим потоком, как в синхронном постере
+        self.states = ChannelStateTable(storage=StateSnapshot() if STATE_SNAPSHOT_ENABLED else None)
+        self.snapshot_flusher = SnapshotFlusher(self.states) if STATE_SNAPSHOT_ENABLED else None
+        self.dedupe = StreamDedupeIndex()
+        self.renderer = MessageRenderer()
+        self.destinations = list(POST_DESTINATIONS)
+        self.state_lock = threading.RLock()
+        # Фото, очередь постов, рассылка, обновление постов, EventSub и шардинг - только в синхронном постере
+        self.media = None
+        self.broadcaster = None
+        self.live_updater = None
+        self.eventsub = None
+        self.shard = None
+        self.stopping = None
+        
+        self.scheduler = None
+        if ADAPTIVE_POLLING:
+            self.scheduler = AdaptivePollScheduler(states=self.states)
+        elif self.channels_file:
+            self.scheduler = AdaptivePollScheduler.fixed(states=self.states)
+        if self.scheduler:
+            for key in self.channel_keys():
+                self.scheduler.add_channel(key)
+        if self.channels_file:
+            self.reload_channels()
+        if STATE_SNAPSHOT_ENABLED:
+            self.restore_states()
+    
+    async def __aenter__(self):
+        return self
+    
+    async def __aexit__(self, *exc):
+        await self.close()
+        return False
+    
+    async def get_twitch_token(self):
+        """Получение токена доступа к Twitch API"""
+        try:
+            token = await asyncio.to_thread(self.token_manager.refresh)
+            if token:
+                self.twitch_token = token
+                logger.info("✅ Токен Twitch получен успешно")
+                return True
+            logger.error(f"❌ Ошибка получения токена Twitch: {self.token_manager.last_error}")
+            return False
+        except Exception as e:
+            logger.error(f"❌ Ошибка при получении токена Twitch: {e}")
+            return False
+    
+    async def ensure_twitch_token(self):
+        """Токен из кэша, а если он истек или отозван - новый"""
+        token = await asyncio.to_thread(self.token_manager.get_token)
+        if token:
+            self.twitch_token = token
+            return True
+        return await self.get_twitch_token()
+    
+    async def twitch_request(self, method, url, **kwargs):
+        """Запрос к Helix с повтором после обновления токена при 401"""
+        for attempt in range(2):
+            headers = {
+                "Client-ID": TWITCH_CLIENT_ID,
+                "Authorization": f"Bearer {self.twitch_token}"
+            }
+            response = await self.twitch.request(method, url, headers=headers, **kwargs)
+            if response.status_code != 401 or attempt:
+                return response
+            logger.info("🔑 Токен Twitch недействителен, обновляем...")
+            await asyncio.to_thread(self.token_manager.invalidate)
+            if not await self.get_twitch_token():
+                return response
+    
+    async def check_stream_status(self):
+        """Проверка статуса стрима"""
+        self.reload_channels()
+        if not await self.ensure_twitch_token():
+            return False
+        
+        if self.multi_channel:
+            return await self.check_channels_status()
+        
+        key = TWITCH_STREAMER_LOGIN.lower()
+        try:
+            response = await self.twitch_request("GET", f"{TWITCH_API_URL}/streams",
+                                                 params=[("user_login", TWITCH_STREAMER_LOGIN)])
+            if response.status_code != 200:
+                logger.error(f"❌ Ошибка проверки статуса стрима: {response.status_code}")
+                return False
+            data = response.json()["data"]
+            await self.update_channel(key, data[0] if data else None)
+            return bool(data)
+        except Exception as e:
+            logger.error(f"❌ Ошибка при проверке статуса стрима: {e}")
+            return False
+        finally:
+            if self.scheduler:
+                self.scheduler.schedule(key)
+    
+    async def fetch_batch(self, batch):
+        """Стримы одной пачки до 100 каналов с учетом пагинации; None при ошибке"""
+        streams = []
+        cursor = None
+        while True:
+            params = batch + [("first", HELIX_BATCH_SIZE)]
+            if cursor:
+                params.append(("after", cursor))
+            try:
+                response = await self.twitch_request("GET", f"{TWITCH_API_URL}/streams", params=params)
+            except Exception as e:
+                logger.error(f"❌ Ошибка при запросе пачки стримов: {e}")
+                return None
+            if response.status_code != 200:
+                logger.error(f"❌ Ошибка проверки пачки стримов: {response.status_code}")
+                return None
+            data = response.json()
+            streams.extend(data["data"])
+            cursor = data.get("pagination", {}).get("cursor")
+            if not cursor:
+                return streams
+    
+    async def fetch_streams(self, logins=(), user_ids=()):
+        """Активные стримы: пачки запрашиваются одновременно, темп задает регулятор квоты"""
+        filters = [("user_login", login) for login in logins]
+        filters += [("user_id", user_id) for user_id in user_ids]
+        batches = list(chunked(filters, HELIX_BATCH_SIZE))
+        results = await asyncio.gather(*(self.fetch_batch(batch) for batch in batches))
+        
+        streams = []
+        failed = []
+        for batch, result in zip(batches, results):
+            if result is None:
+                failed.extend(batch)
+            else:
+                streams.extend(result)
+        return streams, failed
+    
+    async def check_channels_status(self):
+        """Проверка статуса отслеживаемых каналов, которым подошла очередь"""
+        keys = self.scheduler.due() if self.scheduler else self.channel_keys()
+        streams, failed = await self.fetch_streams(
+            [key for key in keys if key not in self.user_ids],
+            [key for key in keys if key in self.user_ids]
+        )
+        
+        # Каналы из неудачных запросов не трогаем, чтобы не получить ложный оффлайн
+        unknown = {value.lower() for _, value in failed}
+        live = {self.channel_key(stream_info): stream_info for stream_info in streams}
+        await asyncio.gather(*(self.update_channel(key, live.get(key)) for key in keys if key not in unknown))
+        if self.scheduler:
+            for key in keys:
+                self.scheduler.schedule(key)
+        return set(live)
+    
+    async def update_channel(self, key, stream_info):
+        """Смена статуса канала; stream_info=None означает оффлайн"""
+        is_live = stream_info is not None
+        if is_live:
+            was_live = self.states.transition(key, True, self.stream_id(stream_info),
+                                              parse_started_at(stream_info.get("started_at")))
+        else:
+            was_live = self.states.transition(key, False)
+        if self.scheduler and is_live and not was_live:
+            self.scheduler.record_start(key, stream_info.get("started_at"))
+        
+        if is_live and not was_live:
+            started = parse_started_at(stream_info.get("started_at"))
+            if started:
+                DETECTION_SECONDS.observe(max(time.time() - started, 0))
+            logger.info(f"🎥 Стрим {key} начался: {stream_info['title']}", extra={"channel": key})
+            await self.post_to_socials(stream_info)
+        elif not is_live and was_live:
+            logger.info(f"🔴 Стрим {key} закончился", extra={"channel": key})
+        return is_live != was_live
+    
+    async def post_to_socials(self, stream_info):
+        """Постинг в социальные сети: назначения - одновременно, у каждого свой дедлайн"""
+        key = self.channel_key(stream_info)
+        stream_id = self.stream_id(stream_info)
+        # Индекс в SQLite может ждать блокировку до busy_timeout - не в цикле событий
+        if not await asyncio.to_thread(self.dedupe.claim, stream_id, key):
+            logger.info("⏰ Пост об этом стриме уже был, пропускаем",
+                        extra={"channel": key, "stream_id": stream_id})
+            return
+        
+        payloads = self.build_payloads(stream_info)
+        report = DeliveryReport()
+        results = await asyncio.gather(*(
+            self.timed_deliver(destination, payload) for destination, payload in payloads.items()
+        ))
+        for result in results:
+            report.add(result)
+        logger.info(report.summary(),
+                    extra={"channel": key, "stream_id": stream_id, "latency": report.duration})
+        self.last_post_time = datetime.now()
+        self.states.mark_posted(key, self.last_post_time.timestamp())
+        return report
+    
+    async def timed_deliver(self, destination, payload):
+        """Доставка в назначение с дедлайном и замером длительности"""
+        started = time.monotonic()
+        deadline = destination_deadline(destination)
+        try:
+            ok = await asyncio.wait_for(self.deliver(destination, payload), deadline)
+            return DeliveryResult(destination, bool(ok), time.monotonic() - started)
+        except asyncio.TimeoutError:
+            return DeliveryResult(destination, False, time.monotonic() - started,
+                                  error="превышен дедлайн", timed_out=True)
+        except Exception as e:
+            return DeliveryResult(destination, False, time.monotonic() - started, error=e)
+    
+    async def deliver(self, destination, payload):
+        """Отправка поста в одно назначение; True при успехе"""
+        platform = destination.split(":", 1)[0]
+        if platform == "telegram":
+            return bool(await self.post_to_telegram(payload["message"], chat_id=payload.get("chat_id")))
+        if platform == "vk":
+            return bool(await self.post_to_vk(payload["message"], group_id=payload.get("group_id")))
+        logger.warning(f"⚠️ Неизвестное назначение: {destination}")
+        return False
+    
+    async def post_to_telegram(self, message, chat_id=None):
+        """Постинг в Telegram; возвращает message_id"""
+        try:
+            url = f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
+            data = {
+                "chat_id": chat_id or TELEGRAM_CHANNEL_ID,
+                "text": message,
+                "parse_mode": self.renderer.renderer_for("telegram").parse_mode
+            }
+            response = await self.telegram.post(url, data=data)
+            if response.status_code == 200:
+                logger.info("✅ Пост в Telegram успешно опубликован",
+                            extra={"platform": "telegram", "latency": response.elapsed.total_seconds()})
+                return response.json()["result"]["message_id"]
+            
+            error_details = response.json() if response.content else "Нет деталей"
+            logger.error(f"❌ Ошибка постинга в Telegram: {response.status_code}, детали: {error_details}",
+                         extra={"platform": "telegram", "status": response.status_code})
+            if response.status_code == 400:
+                logger.info("🔄 Пробуем отправить без HTML разметки...")
+                data["parse_mode"] = None
+                retry_response = await self.telegram.post(url, data=data)
+                if retry_response.status_code == 200:
+                    logger.info("✅ Пост в Telegram отправлен без HTML разметки")
+                    return retry_response.json()["result"]["message_id"]
+                logger.error(f"❌ Повторная ошибка: {retry_response.status_code}")
+            return False
+        except Exception as e:
+            logger.error(f"❌ Ошибка при постинге в Telegram: {e}")
+            return False
+    
+    async def post_to_vk(self, message, group_id=None, attachments=None):
+        """Постинг в VK; возвращает post_id"""
+        try:
+            group_id = group_id or (VK_GROUP_IDS[0] if VK_GROUP_IDS else None)
+            if not group_id or not VK_ACCESS_TOKEN:
+                logger.warning("⚠️ VK не настроен, пропускаем")
+                return True
+            
+            data = {
+                "owner_id": f"-{group_id}",
+                "message": message,
+                "access_token": VK_ACCESS_TOKEN,
+                "v": VK_API_VERSION
+            }
+            if attachments:
+                data["attachments"] = attachments
+            response = await self.vk.post(f"{VK_API_URL}/wall.post", data=data)
+            if response.status_code == 200:
+                result = response.json()
+                if "response" in result:
+                    logger.info("✅ Пост в VK успешно опубликован",
+                                extra={"platform": "vk", "destination": f"vk:{group_id}",
+                                       "latency": response.elapsed.total_seconds()})
+                    return result["response"]["post_id"]
+                logger.error(f"❌ Ошибка постинга в VK: {result}", extra={"platform": "vk"})
+            else:
+                logger.error(f"❌ Ошибка постинга в VK: {response.status_code}",
+                             extra={"platform": "vk", "status": response.status_code})
+            return False
+        except Exception as e:
+            logger.error(f"❌ Ошибка при постинге в VK: {e}")
+            return False
+    
+    @property
+    def poll_interval(self):
+        """Пауза до следующего опроса"""
+        if self.scheduler:
+            return max(self.scheduler.next_wakeup() - time.time(), 1)
+        return POLL_INTERVAL
+    
+    async def run(self):
+        """Основной цикл; завершается после stop() или при отмене задачи"""
+        logger.info("🚀 Запуск асинхронного Twitch AutoPoster...")
+        self.stopping = asyncio.Event()
+        if self.snapshot_flusher and not self.snapshot_flusher.is_alive():
+            self.snapshot_flusher.start()
+        try:
+            while not self.stopping.is_set():
+                try:
+                    with POLL_CYCLE_SECONDS.time():
+                        await self.check_stream_status()
+                    if self.scheduler:
+                        await asyncio.to_thread(self.scheduler.flush)
+                except Exception as e:
+                    logger.error(f"❌ Неожиданная ошибка: {e}")
+                try:
+                    await asyncio.wait_for(self.stopping.wait(), self.poll_interval)
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            await self.close()
+    
+    def stop(self):
+        """Остановка цикла run() после текущей проверки"""
+        if self.stopping:
+            self.stopping.set()
+    
+    async def close(self):
+        """Закрытие соединений, сохранение истории опроса и состояния каналов"""
+        if self.scheduler:
+            await asyncio.to_thread(self.scheduler.flush, True)
+        if self.snapshot_flusher:
+            await asyncio.to_thread(self.snapshot_flusher.stop)
+        await asyncio.to_thread(self.states.close)
+        await asyncio.to_thread(self.dedupe.close)
+        for session in (self.twitch, self.telegram, self.vk):
+            await session.close()
+        self.token_manager.session.close()
@@ -0,0 +1,247 @@
+"""
+Локальные заглушки Twitch (OAuth и Helix), Telegram Bot API и VK API для бенчмарков
+с настраиваемой задержкой и долей ошибок
+"""
+
+import json
+import time
+import random
+import threading
+from urllib.parse import urlsplit, parse_qs
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+
+class Platform:
+    """Настройки и статистика одной заглушки"""
+    
+    def __init__(self, name, latency=0.0, jitter=0.0, error_rate=0.0):
+        self.name = name
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.requests = {}
+        self.lock = threading.Lock()
+    
+    def count(self, endpoint):
+        with self.lock:
+            self.requests[endpoint] = self.requests.get(endpoint, 0) + 1
+    
+    def delay(self):
+        """Искусственная задержка ответа"""
+        pause = self.latency + random.uniform(0, self.jitter)
+        if pause > 0:
+            time.sleep(pause)
+    
+    def failed(self):
+        """Случайная ошибка сервера"""
+        return self.error_rate and random.random() < self.error_rate
+
+class World:
+    """Состояние "мира": ростер каналов, расписание начала стримов и полученные посты"""
+    
+    def __init__(self, channels, go_live_count, go_live_window, closed_groups=()):
+        now = time.time()
+        self.logins = [f"bench{i}" for i in range(channels)]
+        self.user_ids = {login: str(100000 + i) for i, login in enumerate(self.logins)}
+        live = random.sample(self.logins, min(go_live_count, channels))
+        self.go_live = {login: now + random.uniform(0, go_live_window) for login in live}
+        self.posts = {}
+        self.message_id = 0
+        # Группы VK, куда wall.post (и отдельный, и внутри execute) завершается ошибкой доступа
+        self.closed_groups = {int(group) for group in closed_groups}
+        self.rejected = 0
+        self.lock = threading.Lock()
+    
+    def stream(self, login):
+        """Данные стрима в формате Helix или None, если канал оффлайн"""
+        started = self.go_live.get(login)
+        if started is None or started > time.time():
+            return None
+        return {
+            "id": f"{login}-{int(started)}",
+            "user_id": self.user_ids[login],
+            "user_login": login,
+            "user_name": login.capitalize(),
+            "game_name": "Benchmark",
+            "type": "live",
+            "title": f"Benchmark stream {login}",
+            "viewer_count": random.randint(1, 1000),
+            "started_at": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime(started)),
+            "language": "ru",
+            "thumbnail_url": f"https://example.invalid/{login}-{{width}}x{{height}}.jpg"
+        }
+    
+    def record_post(self, platform, text):
+        """Учет поста: время первого поста для канала из ссылки twitch.tv/<login>"""
+        now = time.time()
+        marker = "twitch.tv/"
+        login = None
+        if marker in text:
+            login = text.split(marker, 1)[1].split()[0].strip(".,)\\")
+        with self.lock:
+            self.message_id += 1
+            if login:
+                self.posts.setdefault((platform, login), now)
+            return self.message_id
+    
+    def closed(self, owner_id):
+        """Закрыта ли группа VK для публикации; отказы учитываются"""
+        if -int(owner_id) not in self.closed_groups:
+            return False
+        with self.lock:
+            self.rejected += 1
+        return True
+    
+    def latencies(self):
+        """Задержки от начала стрима до поста по каждой платформе, сек"""
+        result = {}
+        with self.lock:
+            for (platform, login), posted in self.posts.items():
+                if login in self.go_live:
+                    result.setdefault(platform, []).append(posted - self.go_live[login])
+        return result
+
+class MockHandler(BaseHTTPRequestHandler):
+    """Общий обработчик: маршрут выбирается по платформе сервера"""
+    
+    protocol_version = "HTTP/1.1"
+    
+    def log_message(self, format, *args):
+        pass
+    
+    def send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def read_form(self):
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        if "application/x-www-form-urlencoded" in self.headers.get("Content-Type", ""):
+            return {key: values[0] for key, values in parse_qs(body.decode('utf-8')).items()}
+        return {}
+    
+    def handle_request(self, method):
+        platform = self.server.platform
+        url = urlsplit(self.path)
+        endpoint = url.path.rstrip("/").rsplit("/", 1)[-1]
+        form = self.read_form() if method == "POST" else {}
+        
+        if url.path == "/_stats":
+            self.send_json(self.server.stats())
+            return
+        
+        platform.count(endpoint)
+        platform.delay()
+        if platform.failed():
+            self.send_json({"error": "injected"}, 500)
+            return
+        getattr(self, f"route_{platform.name}")(method, endpoint, parse_qs(url.query), form)
+    
+    def do_GET(self):
+        self.handle_request("GET")
+    
+    def do_POST(self):
+        self.handle_request("POST")
+    
+    def route_twitch(self, method, endpoint, query, form):
+        world = self.server.world
+        if endpoint == "token":
+            self.send_json({"access_token": "bench-token", "expires_in": 3600, "token_type": "bearer"})
+        elif endpoint == "validate":
+            self.send_json({"client_id": "bench", "expires_in": 3600})
+        elif endpoint == "users":
+            users = [
+                {"id": world.user_ids[login], "login": login}
+                for login in query.get("login", []) if login in world.user_ids
+            ]
+            self.send_json({"data": users})
+        elif endpoint == "streams":
+            by_id = {user_id: login for login, user_id in world.user_ids.items()}
+            logins = query.get("user_login", []) + [by_id.get(i, "") for i in query.get("user_id", [])]
+            streams = [stream for stream in map(world.stream, logins) if stream]
+            # Как Helix: страница не длиннее first (по умолчанию 20, не больше 100) и курсор дальше
+            first = min(int(query.get("first", ["20"])[0]), 100)
+            offset = int(query.get("after", ["0"])[0] or 0)
+            pagination = {"cursor": str(offset + first)} if offset + first < len(streams) else {}
+            headers = {
+                "Ratelimit-Limit": "800",
+                "Ratelimit-Remaining": "799",
+                "Ratelimit-Reset": str(int(time.time()) + 60)
+            }
+            self.send_json({"data": streams[offset:offset + first], "pagination": pagination}, headers=headers)
+        else:
+            self.send_json({"error": "not found"}, 404)
+    
+    def route_telegram(self, method, endpoint, query, form):
+        world = self.server.world
+        text = form.get("text") or form.get("caption") or ""
+        message_id = world.record_post("telegram", text)
+        self.send_json({"ok": True, "result": {"message_id": message_id, "photo": [{"file_id": "f"}]}})
+    
+    def route_vk(self, method, endpoint, query, form):
+        world = self.server.world
+        if endpoint == "wall.post":
+            if world.closed(form.get("owner_id", 0)):
+                self.send_json({"error": {"error_code": 15, "error_msg": "Access denied"}})
+                return
+            post_id = world.record_post("vk", form.get("message", ""))
+            self.send_json({"response": {"post_id": post_id}})
+        elif endpoint == "execute":
+            # Пакет из API.wall.post({...}): объекты параметров - JSON
+            decoder = json.JSONDecoder()
+            code = form.get("code", "")
+            responses, errors = [], []
+            marker = "API.wall.post("
+            index = code.find(marker)
+            while index != -1:
+                params, end = decoder.raw_decode(code, index + len(marker))
+                if world.closed(params["owner_id"]):
+                    responses.append(False)
+                    errors.append({"method": "wall.post", "error_code": 15, "error_msg": "Access denied"})
+                else:
+                    responses.append({"post_id": world.record_post("vk", params.get("message", ""))})
+                index = code.find(marker, end)
+            result = {"response": responses}
+            if errors:
+                result["execute_errors"] = errors
+            self.send_json(result)
+        else:
+            self.send_json({"response": 1})
+
+class MockServer(ThreadingHTTPServer):
+    """HTTP-сервер заглушки одной платформы"""
+    
+    daemon_threads = True
+    
+    def __init__(self, platform, world, host="127.0.0.1", port=0):
+        super().__init__((host, port), MockHandler)
+        self.platform = platform
+        self.world = world
+    
+    @property
+    def url(self):
+        return f"http://{self.server_address[0]}:{self.server_port}"
+    
+    def stats(self):
+        with self.platform.lock:
+            requests = dict(self.platform.requests)
+        return {"requests": requests, "latencies": self.world.latencies(),
+                "posts": self.world.message_id, "rejected": self.world.rejected}
+    
+    def start(self):
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+        return self
+
+def start_mocks(channels, go_live_count, go_live_window, latency=0.0, jitter=0.0, error_rate=0.0,
+                closed_groups=()):
+    """Запуск заглушек всех платформ; возвращает {платформа: сервер}"""
+    world = World(channels, go_live_count, go_live_window, closed_groups)
+    return {
+        name: MockServer(Platform(name, latency, jitter, error_rate), world).start()
+        for name in ("twitch", "telegram", "vk")
+    }
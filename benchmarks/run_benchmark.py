@@ -0,0 +1,233 @@
+"""
+Офлайн-бенчмарк автопостера на локальных заглушках Twitch, Telegram и VK
+
+Каждый масштаб (число каналов) запускается в отдельном процессе, потому что
+config.py читает переменные окружения один раз при импорте. Заглушки работают
+в дочернем процессе, чтобы их CPU и память не смешивались с замерами постера.
+
+Пример:
+    python benchmarks/run_benchmark.py --channels 1,100,10000 --duration 30
+    python benchmarks/run_benchmark.py --latency 50 --jitter 100 --error-rate 0.05
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import tempfile
+import subprocess
+import contextlib
+import multiprocessing
+import urllib.request
+
+try:
+    import resource
+except ImportError:
+    # Windows: пиковая память процесса не измеряется
+    resource = None
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from mock_servers import start_mocks
+
+def percentile(values, share):
+    """Перцентиль по отсортированной выборке (ближайший ранг)"""
+    if not values:
+        return None
+    values = sorted(values)
+    index = min(len(values) - 1, max(0, int(round(share * len(values))) - 1))
+    return values[index]
+
+def serve_mocks(connection, options):
+    """Процесс заглушек: отдает адреса и работает до закрытия канала связи"""
+    servers = start_mocks(
+        options["channels"], options["go_live"], options["go_live_window"],
+        options["latency"], options["jitter"], options["error_rate"], options["vk_closed_groups"]
+    )
+    connection.send({name: server.url for name, server in servers.items()})
+    try:
+        connection.recv()
+    except EOFError:
+        pass
+
+def fetch_stats(url):
+    with urllib.request.urlopen(f"{url}/_stats", timeout=10) as response:
+        return json.loads(response.read())
+
+def benchmark_env(urls, options, workdir):
+    """Переменные окружения постера, направленные на заглушки"""
+    env = {
+        "TWITCH_AUTH_URL": f"{urls['twitch']}/oauth2",
+        "TWITCH_API_URL": f"{urls['twitch']}/helix",
+        "TELEGRAM_API_URL": urls["telegram"],
+        "VK_API_URL": f"{urls['vk']}/method",
+        "TWITCH_CLIENT_ID": "bench",
+        "TWITCH_CLIENT_SECRET": "bench",
+        "TWITCH_STREAMER_LOGINS": ",".join(f"bench{i}" for i in range(options["channels"])),
+        "TELEGRAM_BOT_TOKEN": "bench",
+        "TELEGRAM_CHANNEL_ID": "@bench",
+        "VK_ACCESS_TOKEN": "bench",
+        # Закрытые группы публикуются вместе с открытой и получают отказ доступа
+        "VK_GROUP_IDS": ",".join(["1"] + [str(group) for group in options["vk_closed_groups"]]),
+        "VK_BATCH_ENABLED": "1" if options["vk_batch"] else "0",
+        "POST_DESTINATIONS": "telegram,vk",
+        "POLL_INTERVAL": str(options["poll_interval"]),
+        "OUTBOX_ENABLED": "1" if options["outbox"] else "0",
+        "ADAPTIVE_POLLING": "0",
+        "EVENTSUB_ENABLED": "0",
+        "LIVE_UPDATES": "0",
+        "TELEGRAM_SEND_PHOTO": "0",
+        "VK_SEND_PHOTO": "0",
+        "TWITCH_TOKEN_CACHE": os.path.join(workdir, "token.json"),
+        "DEDUPE_PATH": os.path.join(workdir, "dedupe.db"),
+        "OUTBOX_PATH": os.path.join(workdir, "outbox.db"),
+        "POLL_HISTORY_PATH": os.path.join(workdir, "poll_history.json"),
+        "MEDIA_CACHE_DIR": os.path.join(workdir, "media_cache"),
+        "MESSAGE_TEMPLATES_PATH": os.path.join(workdir, "templates.json"),
+        "CHANNELS_PATH": os.path.join(workdir, "channels.json"),
+    }
+    if not options["real_limits"]:
+        # Лимиты платформ меряют ожидание, а не сам постер
+        env["TELEGRAM_RATE_LIMIT"] = "10000"
+        env["VK_RATE_LIMIT"] = "10000"
+    return env
+
+def run_worker(options):
+    """Один прогон: заглушки, постер и замеры для заданного числа каналов"""
+    parent, child = multiprocessing.Pipe()
+    mocks = multiprocessing.Process(target=serve_mocks, args=(child, options), daemon=True)
+    mocks.start()
+    urls = parent.recv()
+    
+    with tempfile.TemporaryDirectory() as workdir:
+        os.environ.update(benchmark_env(urls, options, workdir))
+        sys.path.insert(0, ROOT)
+        import main
+        
+        cycles = []
+        cpu_start = time.process_time()
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            poster = main.TwitchAutoPoster()
+            poster.start_services()
+            deadline = time.monotonic() + options["duration"]
+            while time.monotonic() < deadline:
+                started = time.perf_counter()
+                poster.check_stream_status()
+                elapsed = time.perf_counter() - started
+                cycles.append(elapsed)
+                time.sleep(max(poster.poll_interval - elapsed, 0))
+            # Даем очереди постов дослать то, что уже взято в работу
+            if poster.outbox:
+                drain_until = time.monotonic() + options["poll_interval"] * 2
+                while poster.outbox.depth() and time.monotonic() < drain_until:
+                    time.sleep(0.1)
+            cpu = time.process_time() - cpu_start
+            poster.stop()
+    
+    twitch = fetch_stats(urls["twitch"])
+    vk = fetch_stats(urls["vk"])
+    parent.send("stop")
+    mocks.join(timeout=5)
+    
+    latencies = twitch["latencies"]
+    delays = latencies.get("telegram", []) + latencies.get("vk", [])
+    return {
+        "channels": options["channels"],
+        "go_live": options["go_live"],
+        "cycles": len(cycles),
+        "helix_per_cycle": twitch["requests"].get("streams", 0) / max(len(cycles), 1),
+        "cycle_p50_ms": percentile(cycles, 0.5) * 1000,
+        "cycle_p99_ms": percentile(cycles, 0.99) * 1000,
+        "posts": vk["posts"],
+        "vk_rejected": vk["rejected"],
+        "announced": len(delays),
+        "latency_p50_ms": (percentile(delays, 0.5) or 0) * 1000,
+        "latency_p90_ms": (percentile(delays, 0.9) or 0) * 1000,
+        "latency_p99_ms": (percentile(delays, 0.99) or 0) * 1000,
+        "cpu_s": cpu,
+        "cpu_per_cycle_ms": cpu / max(len(cycles), 1) * 1000,
+        # ru_maxrss в Linux - в килобайтах
+        "max_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024 if resource else None,
+    }
+
+def print_table(results):
+    columns = [
+        ("channels", "каналов", "{:d}"),
+        ("cycles", "циклов", "{:d}"),
+        ("helix_per_cycle", "helix/цикл", "{:.1f}"),
+        ("cycle_p50_ms", "цикл p50 мс", "{:.1f}"),
+        ("cycle_p99_ms", "цикл p99 мс", "{:.1f}"),
+        ("announced", "постов", "{:d}"),
+        ("vk_rejected", "отказов VK", "{:d}"),
+        ("latency_p50_ms", "старт→пост p50", "{:.0f}"),
+        ("latency_p90_ms", "p90", "{:.0f}"),
+        ("latency_p99_ms", "p99", "{:.0f}"),
+        ("cpu_per_cycle_ms", "CPU/цикл мс", "{:.1f}"),
+        ("max_rss_mb", "RSS МБ", "{:.1f}"),
+    ]
+    cells = [[title for _, title, _ in columns]]
+    for result in results:
+        cells.append([fmt.format(result[key]) if result[key] is not None else "-" for key, _, fmt in columns])
+    widths = [max(len(row[i]) for row in cells) for i in range(len(columns))]
+    for row in cells:
+        print("  ".join(cell.rjust(width) for cell, width in zip(row, widths)))
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Офлайн-бенчмарк Twitch AutoPoster")
+    parser.add_argument("--channels", default="1,100,10000", help="Число каналов через запятую")
+    parser.add_argument("--duration", type=float, default=20, help="Длительность прогона, сек")
+    parser.add_argument("--poll-interval", type=int, default=2, help="POLL_INTERVAL постера, сек")
+    parser.add_argument("--go-live", type=int, help="Сколько каналов начинают стрим (по умолчанию 1%%, от 1 до 100)")
+    parser.add_argument("--latency", type=float, default=0, help="Задержка ответа заглушек, мс")
+    parser.add_argument("--jitter", type=float, default=0, help="Случайная добавка к задержке, мс")
+    parser.add_argument("--error-rate", type=float, default=0, help="Доля ответов 500")
+    parser.add_argument("--outbox", action="store_true", help="Доставка через очередь постов")
+    parser.add_argument("--vk-closed-groups", default="",
+                        help="Группы VK через запятую, где публикация завершается ошибкой доступа")
+    parser.add_argument("--vk-batch", action="store_true", help="Пакетная публикация в VK через execute")
+    parser.add_argument("--real-limits", action="store_true", help="Не поднимать лимиты Telegram и VK")
+    parser.add_argument("--json", action="store_true", help="Вывод в JSON")
+    parser.add_argument("--worker", type=int, help=argparse.SUPPRESS)
+    return parser.parse_args()
+
+def worker_options(args, channels):
+    go_live = args.go_live or min(max(channels // 100, 1), 100)
+    return {
+        "channels": channels,
+        "go_live": go_live,
+        # Стримы начинаются в первой половине прогона, чтобы все успели попасть в пост
+        "go_live_window": args.duration / 2,
+        "duration": args.duration,
+        "poll_interval": args.poll_interval,
+        "latency": args.latency / 1000,
+        "jitter": args.jitter / 1000,
+        "error_rate": args.error_rate,
+        "outbox": args.outbox,
+        "vk_closed_groups": [int(group) for group in args.vk_closed_groups.split(",") if group.strip()],
+        "vk_batch": args.vk_batch,
+        "real_limits": args.real_limits,
+    }
+
+def main():
+    args = parse_args()
+    if args.worker is not None:
+        print(json.dumps(run_worker(worker_options(args, args.worker))))
+        return
+    
+    results = []
+    for channels in [int(value) for value in args.channels.split(",") if value.strip()]:
+        command = [sys.executable, os.path.abspath(__file__), "--worker", str(channels)] + sys.argv[1:]
+        output = subprocess.run(command, check=True, capture_output=True, text=True).stdout
+        results.append(json.loads(output.strip().splitlines()[-1]))
+        if not args.json:
+            print(f"✅ {channels} каналов: готово", file=sys.stderr)
+    
+    if args.json:
+        print(json.dumps(results, indent=2, ensure_ascii=False))
+    else:
+        print_table(results)
+
+if __name__ == "__main__":
+    main()
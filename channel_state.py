@@ -0,0 +1,278 @@
+"""
+Компактная таблица состояния каналов: колонки в массивах и хеш-индекс с открытой адресацией,
+десятки байт на канал вместо словарей и объектов
+"""
+
+import time
+import logging
+import threading
+from array import array
+from hashlib import blake2b
+
+logger = logging.getLogger(__name__)
+
+# Пустая ячейка индекса
+EMPTY = -1
+
+# Множитель фибоначчиева хеширования: соседние user id расходятся по всему индексу
+GOLDEN = 0x9E3779B97F4A7C15
+MASK64 = (1 << 64) - 1
+
+# Старший бит отличает хеши строк от числовых id
+TEXT_FLAG = 1 << 63
+
+# Колонки таблицы и типы их элементов (коды модуля array)
+COLUMNS = (
+    ("codes", "Q"),
+    ("stream", "Q"),
+    ("started_at", "d"),
+    ("changed_at", "d"),
+    ("posted_at", "d"),
+    ("next_poll", "d"),
+    ("live", "B"),
+)
+
+def key_code(value):
+    """64-битный код ключа: числовой user id (или id трансляции) как есть, строка - по хешу"""
+    value = str(value)
+    if value.isdigit() and int(value) < TEXT_FLAG:
+        return int(value)
+    return int.from_bytes(blake2b(value.encode(), digest_size=8).digest(), "big") | TEXT_FLAG
+
+def memory_columns(capacity):
+    """Колонки на capacity каналов в памяти процесса; индекс вдвое длиннее"""
+    columns = {name: array(typecode, [0]) * capacity for name, typecode in COLUMNS}
+    columns["slots"] = array("i", [EMPTY]) * (capacity * 2)
+    return columns
+
+class ChannelStateTable:
+    """Состояние каналов по колонкам: онлайн, последний id трансляции, начало стрима,
+    смена статуса, последний пост и следующий опрос; строка канала ищется по ключу за O(1).
+    С storage колонки лежат в отображенном в память файле и переживают перезапуск"""
+    
+    def __init__(self, capacity=1024, storage=None):
+        self.lock = threading.RLock()
+        self.storage = storage
+        capacity = 1 << max(4, (capacity - 1).bit_length())
+        if storage:
+            columns, size, clean = storage.open(capacity)
+        else:
+            columns, size, clean = memory_columns(capacity), 0, True
+        self.attach(columns, size)
+        # Ключи строк (ссылки на строки, которые и так хранит постер); после перезапуска
+        # строка получает ключ при первом обращении к каналу
+        self.keys = [None] * size
+        if not clean:
+            # Файл не сброшен на диск целиком: индекс мог разойтись со строками
+            self.rehash()
+            logger.warning(f"⚠️ Состояние каналов восстановлено после сбоя, индекс перестроен ({size})")
+    
+    def attach(self, columns, size):
+        """Подключение колонок (в памяти или в файле)"""
+        for name, column in columns.items():
+            setattr(self, name, column)
+        self.capacity = len(self.codes)
+        self.bits = (len(self.slots) - 1).bit_length()
+        self.size = size
+    
+    def __len__(self):
+        return self.size
+    
+    def __contains__(self, key):
+        return self.row(key) != EMPTY
+    
+    def home(self, code):
+        """Начальная ячейка индекса для кода ключа"""
+        return ((code * GOLDEN) & MASK64) >> (64 - self.bits)
+    
+    def probe(self, code):
+        """Ячейка с кодом или первая пустая на пути линейного пробирования"""
+        mask = len(self.slots) - 1
+        slot = self.home(code)
+        while True:
+            row = self.slots[slot]
+            if row == EMPTY or self.codes[row] == code:
+                return slot
+            slot = (slot + 1) & mask
+    
+    def row(self, key):
+        """Номер строки канала или EMPTY"""
+        with self.lock:
+            return self.slots[self.probe(key_code(key))]
+    
+    def add(self, key):
+        """Строка канала; создается при первом обращении"""
+        code = key_code(key)
+        with self.lock:
+            slot = self.probe(code)
+            row = self.slots[slot]
+            if row != EMPTY:
+                self.keys[row] = key
+                return row
+            if self.size == self.capacity:
+                self.grow()
+                slot = self.probe(code)
+            row = self.size
+            self.codes[row] = code
+            self.slots[slot] = row
+            self.keys.append(key)
+            self.resize(self.size + 1)
+            return row
+    
+    def grow(self):
+        """Удвоение емкости; индекс заполнен не больше чем наполовину, иначе пробирование удлиняется"""
+        capacity = self.capacity * 2
+        if self.storage:
+            columns = self.storage.grow(capacity, self.size)
+        else:
+            columns = memory_columns(capacity)
+            for name, _ in COLUMNS:
+                columns[name][:self.size] = getattr(self, name)[:self.size]
+        self.attach(columns, self.size)
+        self.rehash()
+    
+    def rehash(self):
+        """Перестройка индекса по строкам"""
+        self.slots[:] = array("i", [EMPTY]) * len(self.slots)
+        for row in range(self.size):
+            self.slots[self.probe(self.codes[row])] = row
+    
+    def resize(self, size):
+        """Число строк; в файле хранится в заголовке"""
+        self.size = size
+        if self.storage:
+            self.storage.set_size(size)
+    
+    def remove(self, key):
+        """Удаление канала: последняя строка переезжает на место удаленной"""
+        return self.remove_code(key_code(key))
+    
+    def remove_code(self, code):
+        with self.lock:
+            slot = self.probe(code)
+            row = self.slots[slot]
+            if row == EMPTY:
+                return False
+            self.delete_slot(slot)
+            last = self.size - 1
+            if row != last:
+                for column in self.columns():
+                    column[row] = column[last]
+                self.slots[self.probe(self.codes[row])] = row
+                self.keys[row] = self.keys[last]
+            for column in self.columns():
+                column[last] = 0
+            self.keys.pop()
+            self.resize(last)
+            return True
+    
+    def retain(self, keys):
+        """Удаление строк каналов, которых больше нет среди keys; возвращает их число"""
+        wanted = {key_code(key) for key in keys}
+        with self.lock:
+            stale = [code for code in self.codes[:self.size] if code not in wanted]
+            for code in stale:
+                self.remove_code(code)
+            return len(stale)
+    
+    def delete_slot(self, slot):
+        """Освобождение ячейки со сдвигом следующих за ней назад, чтобы не рвать цепочки поиска"""
+        mask = len(self.slots) - 1
+        self.slots[slot] = EMPTY
+        current = (slot + 1) & mask
+        while self.slots[current] != EMPTY:
+            row = self.slots[current]
+            home = self.home(self.codes[row])
+            # Элемент сдвигается, если его исходная ячейка не лежит между освобожденной и текущей
+            if (current - home) & mask >= (current - slot) & mask:
+                self.slots[slot] = row
+                self.slots[current] = EMPTY
+                slot = current
+            current = (current + 1) & mask
+    
+    def columns(self):
+        return (self.codes, self.live, self.stream, self.started_at,
+                self.changed_at, self.posted_at, self.next_poll)
+    
+    def is_live(self, key):
+        with self.lock:
+            row = self.row(key)
+            return row != EMPTY and bool(self.live[row])
+    
+    def transition(self, key, is_live, stream_id=None, started_at=None, now=None):
+        """Запись статуса канала; возвращает прежний статус"""
+        with self.lock:
+            row = self.add(key)
+            was_live = bool(self.live[row])
+            if is_live and was_live and stream_id is not None and self.stream[row] \
+                    and self.stream[row] != key_code(stream_id):
+                # Пока канал не опрашивали, прежний стрим закончился и начался новый
+                was_live = False
+            if is_live != was_live:
+                self.live[row] = int(is_live)
+                self.changed_at[row] = now or time.time()
+            if is_live:
+                if stream_id is not None:
+                    self.stream[row] = key_code(stream_id)
+                if started_at:
+                    self.started_at[row] = started_at
+            return was_live
+    
+    def mark_posted(self, key, when):
+        with self.lock:
+            self.posted_at[self.add(key)] = when
+    
+    def set_next_poll(self, key, when):
+        with self.lock:
+            self.next_poll[self.add(key)] = when
+    
+    def get(self, key):
+        """Состояние канала словарем (для отладки и логов) или None"""
+        with self.lock:
+            row = self.row(key)
+            if row == EMPTY:
+                return None
+            return {
+                "live": bool(self.live[row]),
+                "stream": self.stream[row],
+                "started_at": self.started_at[row],
+                "changed_at": self.changed_at[row],
+                "posted_at": self.posted_at[row],
+                "next_poll": self.next_poll[row],
+            }
+    
+    def next_poll_at(self, key):
+        """Запомненное время следующего опроса канала (0 - не запланирован)"""
+        with self.lock:
+            row = self.row(key)
+            return self.next_poll[row] if row != EMPTY else 0.0
+    
+    def due(self, now):
+        """Ключи каналов, опрос которых запланирован не позже now"""
+        with self.lock:
+            next_poll, keys = self.next_poll, self.keys
+            return [keys[row] for row in range(self.size)
+                    if 0 < next_poll[row] <= now and keys[row] is not None]
+    
+    def earliest_poll(self):
+        """Ближайший запланированный опрос или None"""
+        with self.lock:
+            next_poll, keys = self.next_poll, self.keys
+            return min((next_poll[row] for row in range(self.size)
+                        if next_poll[row] and keys[row] is not None), default=None)
+    
+    def nbytes(self):
+        """Память колонок и индекса, байт"""
+        with self.lock:
+            return sum(memoryview(column).nbytes for column in self.columns() + (self.slots,))
+    
+    def flush(self):
+        """Сброс отображенного файла на диск"""
+        if self.storage:
+            with self.lock:
+                self.storage.flush()
+    
+    def close(self):
+        if self.storage:
+            with self.lock:
+                self.storage.close()
@@ -0,0 +1,160 @@
+"""
+Настройки каналов из файла (канал -> назначения, шаблоны, интервал опроса)
+с перезагрузкой на лету при изменении файла
+"""
+
+import os
+import json
+import logging
+from config import CHANNELS_PATH
+
+logger = logging.getLogger(__name__)
+
+PLATFORMS = ("telegram", "vk")
+
+class ChannelConfig:
+    """Проверенные настройки одного канала"""
+    
+    __slots__ = ("login", "user_id", "destinations", "templates", "poll_interval", "priority")
+    
+    def __init__(self, login, user_id=None, destinations=None, templates=None, poll_interval=None,
+                 priority=0):
+        if not isinstance(login, str) or not login.strip():
+            raise ValueError(f"некорректный логин канала: {login!r}")
+        self.login = login.strip().lower()
+        self.user_id = str(user_id) if user_id not in (None, "") else None
+        if self.user_id is not None and not self.user_id.isdigit():
+            raise ValueError(f"{self.login}: user_id должен быть числом, а не {user_id!r}")
+        
+        self.destinations = None
+        if destinations is not None:
+            if isinstance(destinations, str):
+                destinations = destinations.split(",")
+            self.destinations = tuple(self.parse_destination(d) for d in destinations if d.strip())
+        
+        # Шаблоны по языкам: {язык|*: шаблон или {message, game, viewers}}
+        if templates is not None and not isinstance(templates, dict):
+            raise ValueError(f"{self.login}: templates должен быть объектом {{язык: шаблон}}")
+        self.templates = templates or {}
+        
+        self.poll_interval = None
+        if poll_interval is not None:
+            try:
+                self.poll_interval = float(poll_interval)
+            except (TypeError, ValueError):
+                raise ValueError(f"{self.login}: некорректный poll_interval {poll_interval!r}")
+            if self.poll_interval < 1:
+                raise ValueError(f"{self.login}: poll_interval должен быть не меньше 1 секунды")
+        
+        # Порядок в рассылке по чатам Telegram: меньше - раньше
+        if isinstance(priority, bool) or not isinstance(priority, int):
+            raise ValueError(f"{self.login}: priority должен быть целым числом, а не {priority!r}")
+        self.priority = priority
+    
+    def parse_destination(self, destination):
+        """Назначение telegram, vk (все группы VK_GROUP_IDS) или vk:<id группы>"""
+        platform, _, target = destination.strip().lower().partition(":")
+        target = target.lstrip("-")
+        if platform not in PLATFORMS or (target and (platform != "vk" or not target.isdigit())):
+            raise ValueError(f"{self.login}: неизвестное назначение {destination!r}")
+        return f"{platform}:{target}" if target else platform
+    
+    @property
+    def key(self):
+        """Ключ состояния канала: ID, если задан, иначе логин"""
+        return self.user_id or self.login
+    
+    @classmethod
+    def from_dict(cls, login, data, defaults=None):
+        """Канал из записи файла; незаданные поля берутся из defaults"""
+        if data is None:
+            data = {}
+        if not isinstance(data, dict):
+            raise ValueError(f"{login}: настройки канала должны быть объектом")
+        values = dict(defaults or {}, **data)
+        unknown = (set(values) - set(cls.__slots__)) | ({"login"} & set(values))
+        if unknown:
+            raise ValueError(f"{login}: неизвестные поля {', '.join(sorted(unknown))}")
+        return cls(login, **values)
+    
+    def as_tuple(self):
+        return (self.login, self.user_id, self.destinations,
+                json.dumps(self.templates, sort_keys=True), self.poll_interval, self.priority)
+    
+    def __eq__(self, other):
+        return isinstance(other, ChannelConfig) and self.as_tuple() == other.as_tuple()
+    
+    def __repr__(self):
+        return f"<ChannelConfig {self.key}>"
+
+class ChannelChanges:
+    """Разница между двумя версиями файла каналов"""
+    
+    def __init__(self, added=(), removed=(), changed=()):
+        self.added = list(added)
+        self.removed = list(removed)
+        self.changed = list(changed)
+    
+    def __bool__(self):
+        return bool(self.added or self.removed or self.changed)
+    
+    def summary(self):
+        return f"+{len(self.added)} -{len(self.removed)} ~{len(self.changed)}"
+
+def parse_channels(data):
+    """Каналы из содержимого файла вида {defaults: {...}, channels: {логин: {...}}}"""
+    if not isinstance(data, dict) or not isinstance(data.get("channels", {}), dict):
+        raise ValueError("ожидается объект с полем channels: {логин: настройки}")
+    defaults = data.get("defaults") or {}
+    channels = {}
+    for login, settings in data.get("channels", {}).items():
+        channel = ChannelConfig.from_dict(login, settings, defaults)
+        if channel.key in channels:
+            raise ValueError(f"канал {channel.key} указан дважды")
+        channels[channel.key] = channel
+    return channels
+
+def diff_channels(old, new):
+    """Добавленные, удаленные и измененные каналы по ключу"""
+    return ChannelChanges(
+        added=[new[key] for key in new if key not in old],
+        removed=[old[key] for key in old if key not in new],
+        changed=[new[key] for key in new if key in old and new[key] != old[key]]
+    )
+
+class ChannelsFile:
+    """Файл каналов: перечитывается только когда меняются время изменения или размер"""
+    
+    def __init__(self, path=CHANNELS_PATH):
+        self.path = path
+        self.stamp = None
+        self.channels = {}
+    
+    def exists(self):
+        return bool(self.path) and os.path.exists(self.path)
+    
+    def current_stamp(self):
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            return None
+        return (stat.st_mtime_ns, stat.st_size)
+    
+    def reload(self):
+        """Перечитывание файла при изменении; ChannelChanges или None, если менять нечего"""
+        stamp = self.current_stamp()
+        if stamp is None or stamp == self.stamp:
+            return None
+        self.stamp = stamp
+        
+        try:
+            with open(self.path, encoding='utf-8') as f:
+                channels = parse_channels(json.load(f))
+        except (OSError, ValueError) as e:
+            # Ошибка в файле не должна остановить работу: остаются прежние настройки
+            logger.error(f"❌ Файл каналов {self.path} не применен: {e}")
+            return None
+        
+        changes = diff_channels(self.channels, channels)
+        self.channels = channels
+        return changes
@@ -0,0 +1,194 @@
+"""
+Автоматы защиты назначений: после серии сбоев метод API перестает вызываться,
+работа для него откладывается до пробного запроса после паузы
+"""
+
+import time
+import logging
+import threading
+from collections import deque
+from config import CIRCUIT_FAILURE_THRESHOLD, CIRCUIT_PROBE_INTERVAL
+from metrics import CIRCUIT_STATE
+
+logger = logging.getLogger(__name__)
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Значение метрики состояния
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+class CircuitOpenError(Exception):
+    """Запрос не отправлен: контур назначения разомкнут"""
+
+class CircuitBreaker:
+    """Контур одного метода: closed - запросы идут, open - отклоняются сразу,
+    half_open - идет один пробный запрос"""
+    
+    def __init__(self, platform, endpoint, failure_threshold=CIRCUIT_FAILURE_THRESHOLD,
+                 probe_interval=CIRCUIT_PROBE_INTERVAL):
+        self.platform = platform
+        self.endpoint = endpoint
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probing = False
+        self.lock = threading.Lock()
+    
+    def probe_due(self, now):
+        """Истекла ли пауза разомкнутого контура"""
+        return self.state == OPEN and now - self.opened_at >= self.probe_interval
+    
+    def allow(self):
+        """Можно ли отправить запрос; по истечении паузы пропускается один пробный"""
+        with self.lock:
+            if self.state == CLOSED:
+                return True
+            if self.state == HALF_OPEN or not self.probe_due(time.monotonic()):
+                return False
+            self.set_state(HALF_OPEN)
+            self.probing = True
+            return True
+    
+    def blocked(self):
+        """Отклонит ли контур запрос сейчас (без перехода в half_open)"""
+        with self.lock:
+            if self.state == OPEN:
+                return not self.probe_due(time.monotonic())
+            return self.state == HALF_OPEN and self.probing
+    
+    def record_success(self):
+        """Успешный ответ замыкает контур"""
+        with self.lock:
+            if self.state != CLOSED:
+                logger.info(f"🟢 {self.platform}/{self.endpoint} снова доступен",
+                            extra={"platform": self.platform})
+            self.failures = 0
+            self.probing = False
+            self.set_state(CLOSED)
+    
+    def record_failure(self):
+        """Сбой: ошибка соединения, таймаут или ответ 5xx"""
+        with self.lock:
+            self.failures += 1
+            # Неудачная проба размыкает контур снова, не дожидаясь порога
+            if self.state == HALF_OPEN:
+                logger.warning(f"🔴 Проба {self.platform}/{self.endpoint} не прошла, "
+                               f"следующая через {self.probe_interval:.0f}с",
+                               extra={"platform": self.platform})
+            elif self.state == CLOSED and self.failures >= self.failure_threshold:
+                logger.warning(f"🔴 {self.platform}/{self.endpoint} недоступен после {self.failures} сбоев, "
+                               f"проба через {self.probe_interval:.0f}с",
+                               extra={"platform": self.platform})
+            else:
+                return
+            self.opened_at = time.monotonic()
+            self.probing = False
+            self.set_state(OPEN)
+    
+    def set_state(self, state):
+        """Смена состояния (под блокировкой контура)"""
+        self.state = state
+        CIRCUIT_STATE.set(STATE_VALUES[state], self.platform, self.endpoint)
+
+class CircuitBreakers:
+    """Контуры по парам (платформа, метод API)"""
+    
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, probe_interval=CIRCUIT_PROBE_INTERVAL):
+        self.failure_threshold = failure_threshold
+        self.probe_interval = probe_interval
+        self.breakers = {}
+        self.lock = threading.Lock()
+    
+    def get(self, platform, endpoint):
+        """Контур метода; создается при первом обращении"""
+        with self.lock:
+            breaker = self.breakers.get((platform, endpoint))
+            if breaker is None:
+                breaker = self.breakers[(platform, endpoint)] = CircuitBreaker(
+                    platform, endpoint, self.failure_threshold, self.probe_interval
+                )
+            return breaker
+    
+    def for_platform(self, platform):
+        """Контуры всех методов платформы"""
+        with self.lock:
+            return [breaker for (name, _), breaker in self.breakers.items() if name == platform]
+    
+    def blocked(self, platform):
+        """Разомкнут ли хоть один контур платформы: тогда работа для нее откладывается"""
+        return any(breaker.blocked() for breaker in self.for_platform(platform))
+    
+    def closed(self, platform):
+        """Все контуры платформы замкнуты"""
+        return all(breaker.state == CLOSED for breaker in self.for_platform(platform))
+
+class ParkingLot(threading.Thread):
+    """Отложенная работа для недоступных платформ: пока контур разомкнут, она не тратит
+    соединений; когда подходит время пробы, выпускается одна задача, после восстановления - все"""
+    
+    def __init__(self, breakers, interval=1.0):
+        super().__init__(daemon=True)
+        self.breakers = breakers
+        self.interval = interval
+        self.parked = {}
+        self.probed_at = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+    
+    def blocked(self, platform):
+        """Откладывать ли работу для платформы"""
+        return self.breakers.blocked(platform)
+    
+    def park(self, platform, work, front=False):
+        """Откладывание задачи (функции без аргументов) до восстановления платформы;
+        front - в начало очереди, например после неудачной пробы"""
+        with self.lock:
+            queue = self.parked.setdefault(platform, deque())
+            if front:
+                queue.appendleft(work)
+            else:
+                queue.append(work)
+    
+    def depth(self):
+        """Число отложенных задач"""
+        with self.lock:
+            return sum(len(queue) for queue in self.parked.values())
+    
+    def release(self, platform, now):
+        """Задачи, которые пора выпустить"""
+        with self.lock:
+            queue = self.parked.get(platform)
+            if not queue or self.blocked(platform):
+                return []
+            if self.breakers.closed(platform):
+                self.parked.pop(platform)
+                return list(queue)
+            # Проба: одна задача, следующая - не раньше чем через паузу
+            if now - self.probed_at.get(platform, float("-inf")) < self.breakers.probe_interval:
+                return []
+            self.probed_at[platform] = now
+            return [queue.popleft()]
+    
+    def run(self):
+        """Периодический выпуск отложенной работы"""
+        while not self.stopped.wait(self.interval):
+            with self.lock:
+                platforms = list(self.parked)
+            for platform in platforms:
+                works = self.release(platform, time.monotonic())
+                if len(works) > 1:
+                    logger.info(f"▶️ {platform} доступен, отправляем отложенное: {len(works)}",
+                                extra={"platform": platform})
+                for work in works:
+                    try:
+                        work()
+                    except Exception as e:
+                        logger.error(f"❌ Ошибка отложенной задачи {platform}: {e}")
+    
+    def stop(self):
+        """Остановка; отложенная работа в памяти теряется"""
+        self.stopped.set()
@@ -3,11 +3,32 @@ from dotenv import load_dotenv
 
 load_dotenv()  # Загружаем переменные из .env
 
+def _timeout(prefix, connect, read):
+    """Пара таймаутов (connect, read) для платформы"""
+    return (
+        float(os.getenv(f'{prefix}_CONNECT_TIMEOUT', connect)),
+        float(os.getenv(f'{prefix}_READ_TIMEOUT', read)),
+    )
+
 # Twitch Config
 TWITCH_CLIENT_ID = os.getenv('TWITCH_CLIENT_ID')
 TWITCH_CLIENT_SECRET = os.getenv('TWITCH_CLIENT_SECRET')
 TWITCH_STREAMER_LOGIN = os.getenv('TWITCH_STREAMER_LOGIN') # Ваш ник на Twitch
 
+# Мультиканальный режим: список логинов и/или ID через запятую
+TWITCH_STREAMER_LOGINS = [
+    login.strip().lower()
+    for login in os.getenv('TWITCH_STREAMER_LOGINS', '').split(',')
+    if login.strip()
+]
+TWITCH_STREAMER_IDS = [
+    user_id.strip()
+    for user_id in os.getenv('TWITCH_STREAMER_IDS', '').split(',')
+    if user_id.strip()
+]
+# Файл каналов (JSON): назначения, шаблоны и интервал опроса по каналам, перечитывается на лету
+CHANNELS_PATH = os.getenv('CHANNELS_PATH', 'channels.json')
+
 # Telegram Config
 TELEGRAM_BOT_TOKEN = os.getenv('TELEGRAM_BOT_TOKEN')
 TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_ID')
@@ -16,7 +37,192 @@ TELEGRAM_CHANNEL_ID = os.getenv('TELEGRAM_CHANNEL_ID')
 VK_GROUP_ID = os.getenv('VK_GROUP_ID')
 VK_ACCESS_TOKEN = os.getenv('VK_ACCESS_TOKEN')
 VK_API_VERSION = '5.131'
+# Несколько групп VK через запятую (по умолчанию - VK_GROUP_ID)
+VK_GROUP_IDS = [
+    group_id.strip().lstrip('-')
+    for group_id in os.getenv('VK_GROUP_IDS', VK_GROUP_ID or '').split(',')
+    if group_id.strip()
+]
+
+# Адреса API (можно подменить на локальные заглушки)
+TWITCH_AUTH_URL = os.getenv('TWITCH_AUTH_URL', 'https://id.twitch.tv/oauth2')
+TWITCH_API_URL = os.getenv('TWITCH_API_URL', 'https://api.twitch.tv/helix')
+TELEGRAM_API_URL = os.getenv('TELEGRAM_API_URL', 'https://api.telegram.org')
+VK_API_URL = os.getenv('VK_API_URL', 'https://api.vk.com/method')
+
+# HTTP: размеры пулов keep-alive соединений и таймауты (connect, read) в секундах
+TWITCH_POOL_SIZE = int(os.getenv('TWITCH_POOL_SIZE', 10))
+TELEGRAM_POOL_SIZE = int(os.getenv('TELEGRAM_POOL_SIZE', 10))
+VK_POOL_SIZE = int(os.getenv('VK_POOL_SIZE', 10))
+TWITCH_TIMEOUT = _timeout('TWITCH', 3.05, 10)
+TELEGRAM_TIMEOUT = _timeout('TELEGRAM', 3.05, 15)
+VK_TIMEOUT = _timeout('VK', 3.05, 15)
+MEDIA_POOL_SIZE = int(os.getenv('MEDIA_POOL_SIZE', 4))
+MEDIA_TIMEOUT = _timeout('MEDIA', 3.05, 30)
+
+# Лимиты запросов: Helix - баллов в минуту, Telegram и VK - запросов в секунду
+TWITCH_RATE_LIMIT = int(os.getenv('TWITCH_RATE_LIMIT', 800))
+TELEGRAM_RATE_LIMIT = float(os.getenv('TELEGRAM_RATE_LIMIT', 30))
+VK_RATE_LIMIT = float(os.getenv('VK_RATE_LIMIT', 3))
+RATE_LIMIT_MAX_RETRIES = int(os.getenv('RATE_LIMIT_MAX_RETRIES', 3))
+RATE_LIMIT_MAX_WAIT = float(os.getenv('RATE_LIMIT_MAX_WAIT', 60))
+
+# Кэш токена Twitch: файл, запас до истечения и период проверки через /validate (сек)
+TWITCH_TOKEN_CACHE = os.getenv('TWITCH_TOKEN_CACHE', '.twitch_token.json')
+TWITCH_TOKEN_REFRESH_MARGIN = int(os.getenv('TWITCH_TOKEN_REFRESH_MARGIN', 300))
+TWITCH_TOKEN_VALIDATE_INTERVAL = int(os.getenv('TWITCH_TOKEN_VALIDATE_INTERVAL', 3600))
+
+# Интервал опроса Helix в секундах
+POLL_INTERVAL = int(os.getenv('POLL_INTERVAL', 60))
+
+# Адаптивный опрос: интервалы (сек), джиттер (доля) и файл истории начала стримов
+ADAPTIVE_POLLING = os.getenv('ADAPTIVE_POLLING', '').lower() in ('1', 'true', 'yes')
+POLL_MIN_INTERVAL = int(os.getenv('POLL_MIN_INTERVAL', 20))
+POLL_MAX_INTERVAL = int(os.getenv('POLL_MAX_INTERVAL', 300))
+POLL_LIVE_INTERVAL = int(os.getenv('POLL_LIVE_INTERVAL', 300))
+POLL_JITTER = float(os.getenv('POLL_JITTER', 0.1))
+POLL_HISTORY_PATH = os.getenv('POLL_HISTORY_PATH', 'poll_history.json')
+POLL_HISTORY_SAVE_INTERVAL = float(os.getenv('POLL_HISTORY_SAVE_INTERVAL', 60))
+
+# EventSub: прием stream.online/stream.offline через webhook, опрос остается запасным
+EVENTSUB_ENABLED = os.getenv('EVENTSUB_ENABLED', '').lower() in ('1', 'true', 'yes')
+EVENTSUB_CALLBACK_URL = os.getenv('EVENTSUB_CALLBACK_URL')  # Публичный https-адрес
+EVENTSUB_SECRET = os.getenv('EVENTSUB_SECRET', '')
+EVENTSUB_HOST = os.getenv('EVENTSUB_HOST', '0.0.0.0')
+EVENTSUB_PORT = int(os.getenv('EVENTSUB_PORT', 8080))
+EVENTSUB_FALLBACK_INTERVAL = int(os.getenv('EVENTSUB_FALLBACK_INTERVAL', 600))
+
+def _eventsub_error(callback_url, secret):
+    """Почему Twitch не примет подписки с такими настройками (None - настройки подходят)"""
+    if not callback_url or not callback_url.lower().startswith('https://'):
+        return 'EVENTSUB_CALLBACK_URL должен быть публичным https-адресом'
+    # Twitch требует секрет из 10-100 ASCII-символов
+    if not 10 <= len(secret) <= 100 or not secret.isascii():
+        return 'EVENTSUB_SECRET должен содержать от 10 до 100 ASCII-символов'
+    return None
+
+EVENTSUB_CONFIG_ERROR = _eventsub_error(EVENTSUB_CALLBACK_URL, EVENTSUB_SECRET)
+
+# Куда постить: telegram, vk (через запятую)
+POST_DESTINATIONS = [
+    destination.strip().lower()
+    for destination in os.getenv('POST_DESTINATIONS', 'vk').split(',')
+    if destination.strip()
+]
+
+# Индекс объявленных стримов: срок хранения (дни) и размер кэша в памяти
+DEDUPE_PATH = os.getenv('DEDUPE_PATH', 'dedupe.db')
+DEDUPE_RETENTION = float(os.getenv('DEDUPE_RETENTION_DAYS', 7)) * 86400
+DEDUPE_CACHE_SIZE = int(os.getenv('DEDUPE_CACHE_SIZE', 10000))
+
+# Фото-посты в Telegram и VK с превью стрима: размер, кэш на диске (МБ) и время свежести (сек)
+TELEGRAM_SEND_PHOTO = os.getenv('TELEGRAM_SEND_PHOTO', '').lower() in ('1', 'true', 'yes')
+THUMBNAIL_WIDTH = int(os.getenv('THUMBNAIL_WIDTH', 1280))
+THUMBNAIL_HEIGHT = int(os.getenv('THUMBNAIL_HEIGHT', 720))
+VK_SEND_PHOTO = os.getenv('VK_SEND_PHOTO', '').lower() in ('1', 'true', 'yes')
+MEDIA_CACHE_DIR = os.getenv('MEDIA_CACHE_DIR', 'media_cache')
+MEDIA_CACHE_MAX_MB = int(os.getenv('MEDIA_CACHE_MAX_MB', 100))
+MEDIA_FRESH_SECONDS = int(os.getenv('MEDIA_FRESH_SECONDS', 300))
+
+# Обновление опубликованных постов во время стрима: не чаще раза за окно (сек)
+LIVE_UPDATES = os.getenv('LIVE_UPDATES', '').lower() in ('1', 'true', 'yes')
+LIVE_UPDATE_WINDOW = int(os.getenv('LIVE_UPDATE_WINDOW', 300))
+
+# Рассылка в несколько чатов Telegram: список чатов, общий темп (сообщений в секунду),
+# пауза между сообщениями в личный чат и в группу/канал (сек), число параллельных отправок
+# и сколько ждать рассылки одного поста (сек); не дошедшее за это время доставит повтор из очереди
+TELEGRAM_BROADCAST_CHATS = [
+    chat.strip()
+    for chat in os.getenv('TELEGRAM_BROADCAST_CHATS', '').split(',')
+    if chat.strip()
+]
+TELEGRAM_BROADCAST_RATE = float(os.getenv('TELEGRAM_BROADCAST_RATE', 28))
+TELEGRAM_CHAT_INTERVAL = float(os.getenv('TELEGRAM_CHAT_INTERVAL', 1))
+TELEGRAM_GROUP_INTERVAL = float(os.getenv('TELEGRAM_GROUP_INTERVAL', 3))
+TELEGRAM_BROADCAST_WORKERS = int(os.getenv('TELEGRAM_BROADCAST_WORKERS', TELEGRAM_POOL_SIZE))
+TELEGRAM_BROADCAST_TIMEOUT = float(os.getenv('TELEGRAM_BROADCAST_TIMEOUT', 600))
+
+# Пакетная публикация в VK: до VK_BATCH_SIZE (не больше 25) вызовов wall.post в одном execute
+VK_BATCH_ENABLED = os.getenv('VK_BATCH_ENABLED', '').lower() in ('1', 'true', 'yes')
+VK_BATCH_SIZE = int(os.getenv('VK_BATCH_SIZE', 25))
+
+# Параллельная доставка: размер пула и дедлайны назначений (сек)
+FANOUT_WORKERS = int(os.getenv('FANOUT_WORKERS', 8))
+DELIVERY_DEADLINE = float(os.getenv('DELIVERY_DEADLINE', 20))
+DELIVERY_DEADLINES = {
+    'telegram': float(os.getenv('TELEGRAM_DEADLINE', DELIVERY_DEADLINE)),
+    'vk': float(os.getenv('VK_DEADLINE', DELIVERY_DEADLINE)),
+}
+
+# Автоматы защиты Telegram и VK: после скольких сбоев подряд метод перестает вызываться
+# и через сколько секунд пробовать снова
+CIRCUIT_BREAKER_ENABLED = os.getenv('CIRCUIT_BREAKER_ENABLED', '').lower() in ('1', 'true', 'yes')
+CIRCUIT_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_FAILURE_THRESHOLD', 5))
+CIRCUIT_PROBE_INTERVAL = float(os.getenv('CIRCUIT_PROBE_INTERVAL', 30))
+
+# Конвейер опрос -> обнаружение -> рендер -> доставка: у каждой стадии свои потоки,
+# размер очереди и политика при ее переполнении (block, drop_oldest или spill на диск)
+PIPELINE_ENABLED = os.getenv('PIPELINE_ENABLED', '').lower() in ('1', 'true', 'yes')
+PIPELINE_QUEUE_SIZE = int(os.getenv('PIPELINE_QUEUE_SIZE', 1000))
+PIPELINE_SPILL_PATH = os.getenv('PIPELINE_SPILL_PATH', 'pipeline_spill.db')
+
+def _stage(name, workers, policy):
+    """Настройки стадии конвейера из PIPELINE_<NAME>_WORKERS, _QUEUE_SIZE и _POLICY"""
+    return {
+        'workers': int(os.getenv(f'PIPELINE_{name}_WORKERS', workers)),
+        'queue_size': int(os.getenv(f'PIPELINE_{name}_QUEUE_SIZE', PIPELINE_QUEUE_SIZE)),
+        'policy': os.getenv(f'PIPELINE_{name}_POLICY', policy).lower(),
+    }
+
+PIPELINE_STAGES = {
+    'detect': _stage('DETECT', 1, 'block'),
+    'render': _stage('RENDER', 2, 'block'),
+    'deliver': _stage('DELIVER', 4, 'spill'),
+}
+
+# Снимок состояния каналов в файле, отображенном в память: перезапуск продолжает с того же
+# состояния без повторных постов; сброс на диск раз в STATE_SNAPSHOT_INTERVAL секунд
+STATE_SNAPSHOT_ENABLED = os.getenv('STATE_SNAPSHOT_ENABLED', '').lower() in ('1', 'true', 'yes')
+STATE_SNAPSHOT_PATH = os.getenv('STATE_SNAPSHOT_PATH', 'channel_state.bin')
+STATE_SNAPSHOT_INTERVAL = float(os.getenv('STATE_SNAPSHOT_INTERVAL', 5))
+
+# Очередь постов в SQLite: повторные попытки с экспоненциальной паузой (сек)
+OUTBOX_ENABLED = os.getenv('OUTBOX_ENABLED', '').lower() in ('1', 'true', 'yes')
+OUTBOX_PATH = os.getenv('OUTBOX_PATH', 'outbox.db')
+OUTBOX_WORKERS = int(os.getenv('OUTBOX_WORKERS', 2))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 8))
+OUTBOX_BACKOFF_BASE = float(os.getenv('OUTBOX_BACKOFF_BASE', 5))
+OUTBOX_BACKOFF_MAX = float(os.getenv('OUTBOX_BACKOFF_MAX', 900))
 
 # Сообщение
 STREAM_MESSAGE_TEMPLATE = "🎥 {streamer} начал стрим!\n\n{title}\n\nПрисоединяйся: {url}"
-# Пример: "🎥 SuperStreamer начал стрим! Играем в Cyberpunk 2077! Присоединяйся: https://twitch.tv/superstreamer"
\ No newline at end of file
+# Пример: "🎥 SuperStreamer начал стрим! Играем в Cyberpunk 2077! Присоединяйся: https://twitch.tv/superstreamer"
+
+# Шаблоны по каналам и языкам (JSON), режим разметки Telegram (HTML или MarkdownV2)
+MESSAGE_TEMPLATES_PATH = os.getenv('MESSAGE_TEMPLATES_PATH', 'templates.json')
+TELEGRAM_PARSE_MODE = os.getenv('TELEGRAM_PARSE_MODE', 'HTML')
+RENDER_CACHE_SIZE = int(os.getenv('RENDER_CACHE_SIZE', 1024))
+
+# Метрики Prometheus: эндпоинт /metrics на METRICS_HOST:METRICS_PORT
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '').lower() in ('1', 'true', 'yes')
+METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+METRICS_PORT = int(os.getenv('METRICS_PORT', 9108))
+
+# Логи: уровень, файл (JSON-строки с ротацией по размеру), формат консоли (text или json),
+# размер очереди и что выбрасывать при ее переполнении (newest или oldest)
+LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+LOG_FILE = os.getenv('LOG_FILE', 'autoposter.log')
+LOG_FORMAT = os.getenv('LOG_FORMAT', 'text').lower()
+LOG_MAX_BYTES = int(os.getenv('LOG_MAX_MB', 10)) * 1024 * 1024
+LOG_BACKUP_COUNT = int(os.getenv('LOG_BACKUP_COUNT', 5))
+LOG_QUEUE_SIZE = int(os.getenv('LOG_QUEUE_SIZE', 10000))
+LOG_DROP_POLICY = os.getenv('LOG_DROP_POLICY', 'newest').lower()
+
+# Распределение каналов между воркерами: общая база аренды, ID воркера (по умолчанию хост:PID),
+# срок аренды и период ее продления (сек), число виртуальных узлов на воркер
+SHARDING_ENABLED = os.getenv('SHARDING_ENABLED', '').lower() in ('1', 'true', 'yes')
+SHARD_STORE_PATH = os.getenv('SHARD_STORE_PATH', 'shards.db')
+SHARD_WORKER_ID = os.getenv('SHARD_WORKER_ID')
+SHARD_LEASE_TTL = float(os.getenv('SHARD_LEASE_TTL', 30))
+SHARD_HEARTBEAT_INTERVAL = float(os.getenv('SHARD_HEARTBEAT_INTERVAL', 10))
+SHARD_VNODES = int(os.getenv('SHARD_VNODES', 64))
@@ -0,0 +1,93 @@
+"""
+Индекс уже объявленных стримов по id стрима Helix
+"""
+
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+from config import DEDUPE_PATH, DEDUPE_RETENTION, DEDUPE_CACHE_SIZE
+
+# Как часто удалять записи старше срока хранения (сек)
+PRUNE_INTERVAL = 3600
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS announced (
+    stream_id TEXT PRIMARY KEY,
+    channel TEXT NOT NULL,
+    announced_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS announced_at ON announced (announced_at);
+"""
+
+class StreamDedupeIndex:
+    """Ограниченный LRU-кэш в памяти поверх таблицы SQLite"""
+    
+    def __init__(self, path=DEDUPE_PATH, retention=DEDUPE_RETENTION,
+                 cache_size=DEDUPE_CACHE_SIZE):
+        self.retention = retention
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+        self.pruned_at = 0
+        
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # Одну базу могут делить несколько воркеров, ждем блокировку вместо ошибки
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.executescript(SCHEMA)
+    
+    def remember(self, stream_id):
+        """Добавление id в кэш с вытеснением самых старых"""
+        self.cache[stream_id] = True
+        self.cache.move_to_end(stream_id)
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+    
+    def seen(self, stream_id):
+        """Объявлялся ли стрим"""
+        with self.lock:
+            if stream_id in self.cache:
+                self.cache.move_to_end(stream_id)
+                return True
+            row = self.conn.execute(
+                "SELECT 1 FROM announced WHERE stream_id = ? AND announced_at >= ?",
+                (stream_id, time.time() - self.retention)
+            ).fetchone()
+            if row:
+                self.remember(stream_id)
+            return row is not None
+    
+    def claim(self, stream_id, channel):
+        """Атомарная отметка стрима; False, если он уже был объявлен"""
+        now = time.time()
+        with self.lock:
+            if stream_id in self.cache:
+                self.cache.move_to_end(stream_id)
+                return False
+            # Просроченную запись можно перезаписать
+            cursor = self.conn.execute(
+                "INSERT INTO announced (stream_id, channel, announced_at) VALUES (?, ?, ?) "
+                "ON CONFLICT (stream_id) DO UPDATE SET channel = excluded.channel, "
+                "announced_at = excluded.announced_at WHERE announced.announced_at < ?",
+                (stream_id, channel, now, now - self.retention)
+            )
+            self.remember(stream_id)
+            claimed = cursor.rowcount == 1
+            if now - self.pruned_at > PRUNE_INTERVAL:
+                self.prune(now)
+            return claimed
+    
+    def prune(self, now=None):
+        """Удаление записей старше срока хранения"""
+        now = now or time.time()
+        self.conn.execute(
+            "DELETE FROM announced WHERE announced_at < ?", (now - self.retention,)
+        )
+        self.pruned_at = now
+    
+    def close(self):
+        """Закрытие базы"""
+        with self.lock:
+            self.conn.close()
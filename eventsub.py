@@ -0,0 +1,211 @@
+"""
+Прием событий Twitch EventSub (stream.online/stream.offline) через webhook
+"""
+
+import hmac
+import json
+import time
+import hashlib
+import queue
+import threading
+import logging
+from collections import OrderedDict
+from datetime import datetime, timezone
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config import (
+    TWITCH_API_URL, EVENTSUB_CALLBACK_URL, EVENTSUB_SECRET,
+    EVENTSUB_HOST, EVENTSUB_PORT
+)
+
+logger = logging.getLogger(__name__)
+
+STREAM_EVENTS = ("stream.online", "stream.offline")
+
+# Twitch советует отбрасывать сообщения старше 10 минут
+MAX_MESSAGE_AGE = 600
+SEEN_MESSAGES_LIMIT = 10000
+
+def sign_message(secret, message_id, timestamp, body):
+    """Подпись сообщения EventSub: HMAC-SHA256(id + timestamp + body)"""
+    digest = hmac.new(
+        secret.encode('utf-8'),
+        message_id.encode('utf-8') + timestamp.encode('utf-8') + body,
+        hashlib.sha256
+    ).hexdigest()
+    return f"sha256={digest}"
+
+def verify_signature(secret, headers, body):
+    """Проверка подписи входящего сообщения"""
+    message_id = headers.get("Twitch-Eventsub-Message-Id", "")
+    timestamp = headers.get("Twitch-Eventsub-Message-Timestamp", "")
+    signature = headers.get("Twitch-Eventsub-Message-Signature", "")
+    expected = sign_message(secret, message_id, timestamp, body)
+    return hmac.compare_digest(expected, signature)
+
+def message_age(timestamp):
+    """Возраст сообщения в секундах по заголовку timestamp"""
+    # Twitch присылает наносекунды, fromisoformat понимает только микросекунды
+    value = timestamp.rstrip("Z")
+    if "." in value:
+        head, fraction = value.split(".", 1)
+        value = f"{head}.{fraction[:6]}"
+    sent_at = datetime.fromisoformat(value).replace(tzinfo=timezone.utc)
+    return (datetime.now(timezone.utc) - sent_at).total_seconds()
+
+def build_notification(secret, subscription_type, event, message_id=None,
+                       message_type="notification", challenge=None):
+    """Подписанное сообщение в формате Twitch (для тестов и локальных заглушек EventSub);
+    с challenge - подтверждение подписки"""
+    message_id = message_id or hashlib.sha1(str(time.time_ns()).encode()).hexdigest()
+    timestamp = datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+    payload = {
+        "subscription": {"type": subscription_type, "version": "1"},
+        "event": event
+    }
+    if challenge is not None:
+        payload["challenge"] = challenge
+    body = json.dumps(payload).encode('utf-8')
+    headers = {
+        "Content-Type": "application/json",
+        "Twitch-Eventsub-Message-Id": message_id,
+        "Twitch-Eventsub-Message-Timestamp": timestamp,
+        "Twitch-Eventsub-Message-Type": message_type,
+        "Twitch-Eventsub-Message-Signature": sign_message(secret, message_id, timestamp, body)
+    }
+    return headers, body
+
+class EventSubRequestHandler(BaseHTTPRequestHandler):
+    """Обработчик webhook-запросов от Twitch"""
+    
+    def do_POST(self):
+        receiver = self.server.receiver
+        length = int(self.headers.get("Content-Length", 0))
+        body = self.rfile.read(length)
+        
+        if not verify_signature(receiver.secret, self.headers, body):
+            self.respond(403)
+            return
+        try:
+            if message_age(self.headers["Twitch-Eventsub-Message-Timestamp"]) > MAX_MESSAGE_AGE:
+                self.respond(400)
+                return
+            payload = json.loads(body)
+        except (KeyError, ValueError):
+            self.respond(400)
+            return
+        
+        message_type = self.headers.get("Twitch-Eventsub-Message-Type")
+        if message_type == "webhook_callback_verification":
+            self.respond(200, payload["challenge"])
+            return
+        
+        # Twitch может доставить одно сообщение несколько раз
+        self.respond(204)
+        if receiver.is_duplicate(self.headers["Twitch-Eventsub-Message-Id"]):
+            return
+        subscription_type = payload["subscription"]["type"]
+        if message_type == "notification":
+            receiver.events.put((subscription_type, payload["event"]))
+        elif message_type == "revocation":
+            logger.warning(f"⚠️ Подписка EventSub отозвана: {subscription_type} "
+                           f"({payload['subscription'].get('status')})")
+    
+    def respond(self, status, text=None):
+        """Ответ с кодом и необязательным текстом"""
+        body = text.encode('utf-8') if text else b""
+        self.send_response(status)
+        self.send_header("Content-Type", "text/plain")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+class EventSubReceiver:
+    """Локальный HTTP-сервер, принимающий уведомления EventSub"""
+    
+    def __init__(self, on_event, secret=EVENTSUB_SECRET,
+                 host=EVENTSUB_HOST, port=EVENTSUB_PORT):
+        self.on_event = on_event
+        self.secret = secret
+        self.seen_messages = OrderedDict()
+        self.lock = threading.Lock()
+        # События обрабатываются по одному в порядке поступления
+        self.events = queue.Queue()
+        self.server = ThreadingHTTPServer((host, port), EventSubRequestHandler)
+        self.server.receiver = self
+        self.thread = None
+        self.dispatcher = None
+    
+    @property
+    def port(self):
+        """Фактический порт сервера"""
+        return self.server.server_port
+    
+    def is_duplicate(self, message_id):
+        """Проверка повторной доставки сообщения"""
+        with self.lock:
+            if message_id in self.seen_messages:
+                return True
+            self.seen_messages[message_id] = True
+            if len(self.seen_messages) > SEEN_MESSAGES_LIMIT:
+                self.seen_messages.popitem(last=False)
+            return False
+    
+    def dispatch(self):
+        """Передача событий обработчику"""
+        while True:
+            item = self.events.get()
+            if item is None:
+                break
+            try:
+                self.on_event(*item)
+            except Exception as e:
+                logger.error(f"❌ Ошибка обработки события EventSub: {e}")
+    
+    def start(self):
+        """Запуск сервера и обработчика событий в фоновых потоках"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+        self.dispatcher = threading.Thread(target=self.dispatch, daemon=True)
+        self.dispatcher.start()
+    
+    def stop(self):
+        """Остановка сервера"""
+        self.server.shutdown()
+        self.server.server_close()
+        self.events.put(None)
+
+class EventSubSubscriber:
+    """Создание подписок stream.online/stream.offline через Helix"""
+    
+    def __init__(self, poster, callback_url=EVENTSUB_CALLBACK_URL, secret=EVENTSUB_SECRET):
+        self.poster = poster
+        self.callback_url = callback_url
+        self.secret = secret
+    
+    def subscribe(self, user_ids):
+        """Подписка на события каналов; возвращает число активных подписок"""
+        url = f"{TWITCH_API_URL}/eventsub/subscriptions"
+        active = 0
+        for user_id in user_ids:
+            for subscription_type in STREAM_EVENTS:
+                data = {
+                    "type": subscription_type,
+                    "version": "1",
+                    "condition": {"broadcaster_user_id": user_id},
+                    "transport": {
+                        "method": "webhook",
+                        "callback": self.callback_url,
+                        "secret": self.secret
+                    }
+                }
+                response = self.poster.twitch_request("POST", url, json=data)
+                # 409 - такая подписка уже существует
+                if response.status_code in (202, 409):
+                    active += 1
+                else:
+                    logger.error(f"❌ Ошибка подписки {subscription_type} для {user_id}: "
+                                 f"{response.status_code}")
+        return active
@@ -0,0 +1,110 @@
+"""
+Параллельная доставка поста во все назначения с собственным дедлайном у каждого
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeout
+from config import FANOUT_WORKERS, DELIVERY_DEADLINE, DELIVERY_DEADLINES
+
+class DeliveryResult:
+    """Итог доставки в одно назначение"""
+    
+    def __init__(self, destination, ok, duration, error=None, timed_out=False):
+        self.destination = destination
+        self.ok = ok
+        self.duration = duration
+        self.error = error
+        self.timed_out = timed_out
+    
+    def __repr__(self):
+        status = "ok" if self.ok else ("timeout" if self.timed_out else "error")
+        return f"<DeliveryResult {self.destination} {status} {self.duration:.2f}s>"
+
+class DeliveryReport:
+    """Отчет о доставке поста во все назначения"""
+    
+    def __init__(self):
+        self.results = {}
+        self.started = time.monotonic()
+        self.duration = 0.0
+    
+    def add(self, result):
+        """Добавление результата назначения"""
+        self.results[result.destination] = result
+        self.duration = time.monotonic() - self.started
+    
+    @property
+    def ok(self):
+        """Доставлено ли во все назначения"""
+        return all(result.ok for result in self.results.values())
+    
+    @property
+    def failed(self):
+        """Назначения, куда доставить не удалось"""
+        return [destination for destination, result in self.results.items() if not result.ok]
+    
+    def summary(self):
+        """Краткая строка для лога"""
+        parts = []
+        for destination, result in self.results.items():
+            if result.ok:
+                mark = "✅"
+            elif result.timed_out:
+                mark = "⏱"
+            else:
+                mark = "❌"
+            parts.append(f"{mark} {destination} {result.duration:.2f}с")
+        return f"📬 Доставка за {self.duration:.2f}с: " + ", ".join(parts)
+
+def destination_deadline(destination, deadlines=DELIVERY_DEADLINES, default=DELIVERY_DEADLINE):
+    """Дедлайн назначения по платформе: vk:<группа> - как vk, telegram:<чат> - как telegram"""
+    return deadlines.get(destination.split(":", 1)[0], default)
+
+class FanOut:
+    """Ограниченный пул потоков для одновременной доставки"""
+    
+    def __init__(self, max_workers=FANOUT_WORKERS, deadline=DELIVERY_DEADLINE,
+                 deadlines=DELIVERY_DEADLINES):
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="fanout")
+        self.deadline = deadline
+        self.deadlines = deadlines
+    
+    def deadline_for(self, destination):
+        """Дедлайн назначения в секундах"""
+        return destination_deadline(destination, self.deadlines, self.deadline)
+    
+    @staticmethod
+    def timed(func):
+        """Вызов с замером длительности"""
+        started = time.monotonic()
+        result = func()
+        return result, time.monotonic() - started
+    
+    def deliver(self, tasks):
+        """Запуск задач {назначение: функция} и сбор отчета; ждем не дольше самого длинного дедлайна"""
+        report = DeliveryReport()
+        futures = {
+            destination: self.executor.submit(self.timed, func)
+            for destination, func in tasks.items()
+        }
+        
+        for destination, future in futures.items():
+            deadline = report.started + self.deadline_for(destination)
+            try:
+                ok, duration = future.result(timeout=max(deadline - time.monotonic(), 0))
+                report.add(DeliveryResult(destination, bool(ok), duration))
+            except FutureTimeout:
+                # Поток продолжит работу, но его результат в отчет уже не попадет
+                report.add(DeliveryResult(
+                    destination, False, time.monotonic() - report.started,
+                    error="превышен дедлайн", timed_out=True
+                ))
+            except Exception as e:
+                report.add(DeliveryResult(
+                    destination, False, time.monotonic() - report.started, error=e
+                ))
+        return report
+    
+    def shutdown(self):
+        """Остановка пула без ожидания зависших задач"""
+        self.executor.shutdown(wait=False)
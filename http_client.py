@@ -0,0 +1,93 @@
+"""
+Клиентский слой HTTP: одна пулированная keep-alive сессия на платформу
+"""
+
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from config import (
+    TWITCH_POOL_SIZE, TELEGRAM_POOL_SIZE, VK_POOL_SIZE,
+    TWITCH_TIMEOUT, TELEGRAM_TIMEOUT, VK_TIMEOUT, MEDIA_POOL_SIZE, MEDIA_TIMEOUT,
+    RATE_LIMIT_MAX_RETRIES, CIRCUIT_BREAKER_ENABLED
+)
+from rate_limit import RateLimitGovernor, endpoint_name
+from circuit_breaker import CircuitBreakers, CircuitOpenError
+from metrics import HTTP_REQUEST_SECONDS, HTTP_RESPONSES
+
+class PlatformSession(requests.Session):
+    """Сессия платформы с собственным пулом соединений и таймаутами"""
+    
+    def __init__(self, platform, pool_size, timeout, governor=None, breakers=None):
+        super().__init__()
+        self.platform = platform
+        self.timeout = timeout
+        self.governor = governor
+        self.breakers = breakers
+        
+        # Соединения переиспользуются между вызовами, TLS-рукопожатие делается один раз
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+    
+    def request(self, method, url, **kwargs):
+        """Запрос с таймаутом платформы и ожиданием квоты"""
+        kwargs.setdefault("timeout", self.timeout)
+        if self.governor is None:
+            return super().request(method, url, **kwargs)
+        
+        endpoint = endpoint_name(url)
+        breaker = self.breakers.get(self.platform, endpoint) if self.breakers else None
+        if breaker and not breaker.allow():
+            # Недоступный метод не тратит ни соединение, ни время на таймаут
+            raise CircuitOpenError(f"{self.platform}/{endpoint} временно недоступен")
+        
+        # При превышении лимита запрос ждет в очереди и повторяется, а не падает
+        try:
+            for attempt in range(RATE_LIMIT_MAX_RETRIES + 1):
+                self.governor.acquire(self.platform, endpoint)
+                response = self.timed_request(endpoint, method, url, **kwargs)
+                if not self.governor.observe(self.platform, endpoint, response):
+                    break
+        except requests.RequestException:
+            if breaker:
+                breaker.record_failure()
+            raise
+        if breaker:
+            # Ошибки запроса (4xx) - не сбой платформы
+            if response.status_code >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+        return response
+    
+    def timed_request(self, endpoint, method, url, **kwargs):
+        """Запрос с учетом длительности и кода ответа в метриках"""
+        started = time.perf_counter()
+        try:
+            response = super().request(method, url, **kwargs)
+        except Exception:
+            HTTP_RESPONSES.inc(self.platform, endpoint, "error")
+            raise
+        finally:
+            HTTP_REQUEST_SECONDS.observe(time.perf_counter() - started, self.platform, endpoint)
+        HTTP_RESPONSES.inc(self.platform, endpoint, str(response.status_code))
+        return response
+
+class HttpClients:
+    """Набор сессий для всех платформ"""
+    
+    def __init__(self, governor=None, breakers=None):
+        self.governor = governor or RateLimitGovernor()
+        # Автоматы защиты - только у назначений постов, опрос Twitch повторяется по расписанию
+        self.breakers = breakers or (CircuitBreakers() if CIRCUIT_BREAKER_ENABLED else None)
+        self.twitch = PlatformSession("twitch", TWITCH_POOL_SIZE, TWITCH_TIMEOUT, self.governor)
+        self.telegram = PlatformSession("telegram", TELEGRAM_POOL_SIZE, TELEGRAM_TIMEOUT,
+                                        self.governor, self.breakers)
+        self.vk = PlatformSession("vk", VK_POOL_SIZE, VK_TIMEOUT, self.governor, self.breakers)
+        # Картинки с CDN, квоты API на них не распространяются
+        self.media = PlatformSession("media", MEDIA_POOL_SIZE, MEDIA_TIMEOUT)
+    
+    def close(self):
+        """Закрытие всех соединений"""
+        for session in (self.twitch, self.telegram, self.vk, self.media):
+            session.close()
@@ -0,0 +1,93 @@
+"""
+Обновление опубликованных постов во время стрима: зрители, название и игра
+"""
+
+import time
+import threading
+import logging
+from config import LIVE_UPDATE_WINDOW
+
+logger = logging.getLogger(__name__)
+
+class LivePost:
+    """Опубликованный пост, который можно редактировать"""
+    
+    __slots__ = ("destination", "payload", "message_id", "text", "updated_at")
+    
+    def __init__(self, destination, payload, message_id):
+        self.destination = destination
+        self.payload = payload
+        self.message_id = message_id
+        self.text = payload["message"]
+        self.updated_at = time.monotonic()
+
+class LiveUpdater(threading.Thread):
+    """Собирает изменения стримов и правит каждый пост не чаще раза за окно"""
+    
+    def __init__(self, poster, window=LIVE_UPDATE_WINDOW):
+        super().__init__(daemon=True)
+        self.poster = poster
+        self.window = window
+        self.posts = {}
+        self.channels = {}
+        self.pending = {}
+        self.lock = threading.Lock()
+        self.stopped = threading.Event()
+    
+    def track(self, stream_id, channel, destination, payload, message_id):
+        """Запоминание отправленного поста"""
+        with self.lock:
+            self.posts.setdefault(stream_id, []).append(LivePost(destination, payload, message_id))
+            self.channels[channel] = stream_id
+    
+    def observe(self, stream_id, stream_info):
+        """Свежие данные стрима; несколько изменений за окно сливаются в одно"""
+        with self.lock:
+            if stream_id in self.posts:
+                self.pending[stream_id] = stream_info
+    
+    def finish(self, channel):
+        """Стрим закончился - посты больше не обновляем"""
+        with self.lock:
+            stream_id = self.channels.pop(channel, None)
+            self.posts.pop(stream_id, None)
+            self.pending.pop(stream_id, None)
+    
+    def flush(self):
+        """Правка постов, у которых изменился текст и истекло окно"""
+        now = time.monotonic()
+        with self.lock:
+            updates = []
+            for stream_id, stream_info in list(self.pending.items()):
+                due = [post for post in self.posts.get(stream_id, ())
+                       if now - post.updated_at >= self.window]
+                if due:
+                    updates.append((stream_info, due))
+                # Посты, у которых окно еще не истекло, дождутся следующего раза
+                if len(due) == len(self.posts.get(stream_id, ())):
+                    del self.pending[stream_id]
+        
+        edited = 0
+        for stream_info, posts in updates:
+            for post in posts:
+                text = self.poster.render_update(stream_info, post.destination, post.payload)
+                post.updated_at = now
+                # Текст не изменился - запрос не нужен
+                if text == post.text:
+                    continue
+                if self.poster.edit_post(post.destination, post.payload, post.message_id, text):
+                    post.text = text
+                    edited += 1
+        return edited
+    
+    def run(self):
+        """Периодическая отправка накопленных правок"""
+        while not self.stopped.wait(min(self.window, 30)):
+            try:
+                self.flush()
+            except Exception as e:
+                logger.error(f"❌ Ошибка обновления постов: {e}")
+    
+    def stop(self):
+        """Остановка"""
+        self.stopped.set()
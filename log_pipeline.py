@@ -0,0 +1,152 @@
+"""
+Неблокирующий вывод логов: запись в очередь в вызывающем потоке, форматирование,
+JSON-строки и ротация файла - в отдельном потоке
+"""
+
+import sys
+import json
+import queue
+import time
+import atexit
+import logging
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
+from config import (
+    LOG_LEVEL, LOG_FILE, LOG_FORMAT, LOG_MAX_BYTES, LOG_BACKUP_COUNT,
+    LOG_QUEUE_SIZE, LOG_DROP_POLICY
+)
+from metrics import LOG_DROPPED
+
+# Поля, которые передаются через extra={...} и попадают в JSON
+CONTEXT_FIELDS = ("channel", "platform", "destination", "stream_id", "latency", "status")
+
+TEXT_FORMAT = '%(asctime)s - %(levelname)s - %(message)s'
+
+# Не чаще раза за столько секунд сообщаем о выброшенных записях
+DROP_REPORT_INTERVAL = 10
+
+class JsonFormatter(logging.Formatter):
+    """Одна запись - одна JSON-строка"""
+    
+    def format(self, record):
+        entry = {
+            "time": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage()
+        }
+        for field in CONTEXT_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = round(value, 4) if field == "latency" else value
+        if record.exc_info:
+            entry["exception"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+class DroppingQueueHandler(QueueHandler):
+    """Постановка записей в ограниченную очередь без ожидания; при переполнении запись выбрасывается"""
+    
+    def __init__(self, log_queue, policy=LOG_DROP_POLICY):
+        super().__init__(log_queue)
+        self.policy = policy
+        self.dropped = 0
+        self.reported = 0
+        self.reported_at = 0
+    
+    def prepare(self, record):
+        # Форматирование делает поток слушателя, здесь запись передается как есть
+        return record
+    
+    def enqueue(self, record):
+        # emit() вызывается под блокировкой обработчика, отдельная для счетчиков не нужна
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.drop(record)
+            return
+        if self.dropped > self.reported and time.monotonic() - self.reported_at >= DROP_REPORT_INTERVAL:
+            try:
+                self.queue.put_nowait(self.dropped_record())
+            except queue.Full:
+                return
+            self.reported = self.dropped
+            self.reported_at = time.monotonic()
+    
+    def drop(self, record):
+        """oldest: место освобождается за счет самой старой записи; newest: выбрасывается новая"""
+        if self.policy == "oldest":
+            try:
+                self.queue.get_nowait()
+                self.queue.put_nowait(record)
+            except (queue.Empty, queue.Full):
+                pass
+        self.dropped += 1
+        LOG_DROPPED.inc()
+    
+    def dropped_record(self):
+        """Запись о сообщениях, выброшенных с прошлого отчета"""
+        return logging.makeLogRecord({
+            "name": __name__,
+            "levelno": logging.WARNING,
+            "levelname": "WARNING",
+            "msg": f"⚠️ Очередь логов переполнена, пропущено записей: {self.dropped - self.reported}"
+        })
+
+class BlockingStopListener(QueueListener):
+    """Слушатель, который при остановке дожидается места в очереди для маркера конца"""
+    
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel)
+
+class LogPipeline:
+    """Очередь, обработчики вывода и поток-слушатель"""
+    
+    def __init__(self, level=LOG_LEVEL, filename=LOG_FILE, fmt=LOG_FORMAT,
+                 max_bytes=LOG_MAX_BYTES, backup_count=LOG_BACKUP_COUNT, queue_size=LOG_QUEUE_SIZE):
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.handler = DroppingQueueHandler(self.queue)
+        
+        console = logging.StreamHandler(sys.stdout)
+        console.setFormatter(JsonFormatter() if fmt == "json" else logging.Formatter(TEXT_FORMAT))
+        handlers = [console]
+        if filename:
+            # Файл всегда в JSON-строках, с ротацией по размеру
+            rotating = RotatingFileHandler(filename, maxBytes=max_bytes,
+                                           backupCount=backup_count, encoding='utf-8')
+            rotating.setFormatter(JsonFormatter())
+            handlers.append(rotating)
+        self.listener = BlockingStopListener(self.queue, *handlers, respect_handler_level=True)
+        self.level = level
+        self.running = False
+    
+    def start(self):
+        """Подключение к корневому логгеру и запуск потока записи"""
+        root = logging.getLogger()
+        root.setLevel(self.level)
+        root.addHandler(self.handler)
+        self.listener.start()
+        self.running = True
+    
+    def stop(self):
+        """Отключение от логгера и запись оставшихся сообщений"""
+        if not self.running:
+            return
+        self.running = False
+        logging.getLogger().removeHandler(self.handler)
+        self.listener.stop()
+        if self.handler.dropped > self.handler.reported:
+            # Слушатель уже остановлен, последний отчет пишем напрямую
+            self.listener.handle(self.handler.dropped_record())
+        for handler in self.listener.handlers:
+            handler.close()
+
+_pipeline = None
+
+def setup_logging(**kwargs):
+    """Настройка логирования процесса (повторный вызов возвращает уже запущенный конвейер)"""
+    global _pipeline
+    if _pipeline is None:
+        _pipeline = LogPipeline(**kwargs)
+        _pipeline.start()
+        atexit.register(_pipeline.stop)
+    return _pipeline
@@ -1,201 +1,1032 @@
 import time
-import requests
 import json
+import logging
+import threading
+from functools import partial
 from datetime import datetime
 from config import *
+from http_client import HttpClients
+from twitch_auth import TwitchTokenManager
+from eventsub import EventSubReceiver, EventSubSubscriber
+from scheduler import AdaptivePollScheduler, parse_started_at
+from channel_state import ChannelStateTable
+from state_snapshot import StateSnapshot, SnapshotFlusher
+from outbox import Outbox, OutboxWorker, LEASE_RENEW_INTERVAL
+from fanout import FanOut
+from dedupe import StreamDedupeIndex
+from render import MessageRenderer
+from media import MediaCache, sized_thumbnail_url
+from vk_media import VKPhotoUploader
+from vk_batch import VKBatchPoster
+from live_updater import LiveUpdater
+from channels import ChannelsFile
+from sharding import ShardCoordinator
+from telegram_broadcast import TelegramBroadcaster
+from circuit_breaker import ParkingLot
+from pipeline import Pipeline
+from log_pipeline import setup_logging
+from metrics import (
+    MetricsServer, POLL_CYCLE_SECONDS, RATE_LIMIT_HEADROOM, OUTBOX_DEPTH, DETECTION_SECONDS,
+    PARKED_WORK
+)
+
+logger = logging.getLogger(__name__)
+
+# Helix принимает не больше 100 user_login/user_id в одном запросе
+HELIX_BATCH_SIZE = 100
+
+def chunked(items, size):
+    """Разбиение списка на части не длиннее size"""
+    for i in range(0, len(items), size):
+        yield items[i:i + size]
 
 class TwitchAutoPoster:
-    def __init__(self):
+    def __init__(self, logins=None, user_ids=None):
+        self.http = HttpClients()
+        self.token_manager = TwitchTokenManager(self.http.twitch)
         self.twitch_token = None
-        self.last_stream_status = False
         self.last_post_time = None
         
+        # Мультиканальный режим: состояние хранится отдельно для каждого канала
+        self.channels = {}
+        self.channels_file = None
+        if logins is None and user_ids is None:
+            # Файл каналов, если он есть, заменяет списки из переменных окружения
+            channels_file = ChannelsFile()
+            if channels_file.exists():
+                self.channels_file = channels_file
+            else:
+                logins = TWITCH_STREAMER_LOGINS
+                user_ids = TWITCH_STREAMER_IDS
+        # Упорядоченные множества (dict): проверка и удаление канала за O(1) при любом их числе
+        self.logins = dict.fromkeys(login.lower() for login in (logins or []))
+        self.user_ids = dict.fromkeys(str(user_id) for user_id in (user_ids or []))
+        # Статус, последняя трансляция и время опроса каждого канала - в колонках таблицы,
+        # со снимком - в файле, который переживает перезапуск
+        self.states = ChannelStateTable(storage=StateSnapshot() if STATE_SNAPSHOT_ENABLED else None)
+        self.snapshot_flusher = SnapshotFlusher(self.states) if STATE_SNAPSHOT_ENABLED else None
+        self.dedupe = StreamDedupeIndex()
+        self.renderer = MessageRenderer()
+        self.media = MediaCache(self.http.media) if TELEGRAM_SEND_PHOTO or VK_SEND_PHOTO else None
+        self.vk_photos = VKPhotoUploader(self.http.vk, self.media, self.http.media) if VK_SEND_PHOTO else None
+        self.vk_batch = VKBatchPoster(self.http.vk) if VK_BATCH_ENABLED else None
+        self.live_updater = LiveUpdater(self) if LIVE_UPDATES else None
+        self.state_lock = threading.RLock()
+        self.eventsub = None
+        self.metrics_server = None
+        
+        self.destinations = list(POST_DESTINATIONS)
+        self.outbox = Outbox() if OUTBOX_ENABLED else None
+        self.outbox_workers = []
+        self.fanout = FanOut()
+        # Работа для платформ с разомкнутым автоматом защиты ждет их восстановления
+        self.parking = ParkingLot(self.http.breakers) if self.http.breakers else None
+        # При распределении между воркерами опрашиваются только арендованные каналы
+        self.shard = ShardCoordinator() if SHARDING_ENABLED else None
+        self.shard_applied = frozenset()
+        # Рассылка в несколько чатов Telegram вместо одного TELEGRAM_CHANNEL_ID
+        self.broadcaster = TelegramBroadcaster(self.send_to_chat) if TELEGRAM_BROADCAST_CHATS else None
+        # Обнаружение, рендер и доставка в своих потоках: медленная соцсеть не задерживает опрос
+        self.pipeline = self.build_pipeline() if PIPELINE_ENABLED else None
+        
+        self.scheduler = None
+        if ADAPTIVE_POLLING:
+            self.scheduler = AdaptivePollScheduler(states=self.states)
+        elif self.channels_file:
+            # Свои интервалы каналов из файла требуют расписания, но без адаптации
+            self.scheduler = AdaptivePollScheduler.fixed(states=self.states)
+        if self.scheduler and not self.shard:
+            for key in self.channel_keys():
+                self.scheduler.add_channel(key)
+        if self.channels_file:
+            self.reload_channels()
+        if STATE_SNAPSHOT_ENABLED:
+            self.restore_states()
+    
+    def restore_states(self):
+        """Продолжение с сохраненного состояния: идущие стримы не объявляются повторно"""
+        keys = self.channel_keys()
+        removed = self.states.retain(keys)
+        live = sum(1 for key in keys if self.states.is_live(key))
+        logger.info(f"💾 Состояние каналов: {len(self.states)}, в эфире {live}"
+                    + (f", удалено устаревших {removed}" if removed else ""))
+    
+    @property
+    def multi_channel(self):
+        """Включен ли мультиканальный режим"""
+        return bool(self.logins or self.user_ids or self.channels_file)
+    
+    @property
+    def last_stream_status(self):
+        """Идет ли стрим канала TWITCH_STREAMER_LOGIN (одноканальный режим)"""
+        return self.states.is_live(TWITCH_STREAMER_LOGIN.lower())
+    
+    def channel_keys(self):
+        """Ключи всех отслеживаемых каналов"""
+        if self.multi_channel:
+            return list(self.logins) + list(self.user_ids)
+        return [TWITCH_STREAMER_LOGIN.lower()]
+    
+    def has_channel(self, key):
+        """Отслеживается ли канал с таким ключом"""
+        if self.multi_channel:
+            return key in self.logins or key in self.user_ids
+        return key == TWITCH_STREAMER_LOGIN.lower()
+    
+    def reload_channels(self):
+        """Применение изменений файла каналов: трогаются только измененные каналы"""
+        if not self.channels_file:
+            return None
+        old_channels = dict(self.channels)
+        changes = self.channels_file.reload()
+        if not changes:
+            return changes
+        
+        registry = self.renderer.registry
+        with self.state_lock:
+            for channel in changes.removed:
+                key = channel.key
+                self.channels.pop(key, None)
+                self.user_ids.pop(key, None)
+                self.logins.pop(key, None)
+                self.states.remove(key)
+                if self.scheduler:
+                    self.scheduler.remove_channel(key)
+                if self.live_updater:
+                    self.live_updater.finish(key)
+                if channel.templates:
+                    registry.replace_channel(channel.login, None)
+            
+            for channel in changes.added + changes.changed:
+                key = channel.key
+                old = old_channels.get(key)
+                self.channels[key] = channel
+                if old is None:
+                    (self.user_ids if channel.user_id else self.logins)[key] = None
+                    if self.scheduler and not self.shard:
+                        self.scheduler.add_channel(key)
+                if self.scheduler:
+                    self.scheduler.set_interval(key, channel.poll_interval)
+                # Шаблоны из MESSAGE_TEMPLATES_PATH не трогаем, если файл каналов их не задает
+                if channel.templates or (old and old.templates):
+                    registry.replace_channel(channel.login, channel.templates)
+            self.renderer.clear_cache()
+        
+        if self.shard:
+            self.shard.set_channels(self.channel_keys())
+        if self.eventsub and changes.added:
+            self.subscribe_channels(changes.added)
+        logger.info(f"📋 Каналы обновлены ({changes.summary()}), всего {len(self.channels)}")
+        return changes
+    
+    def start_shard(self):
+        """Вход в группу воркеров: первая аренда сразу, дальше продление в фоне"""
+        if not self.shard or self.shard.is_alive():
+            return
+        self.shard.set_channels(self.channel_keys())
+        self.shard.rebalance()
+        self.shard.start()
+        self.sync_shard()
+    
+    def sync_shard(self):
+        """Перенос изменений аренды в расписание и состояние каналов"""
+        if not self.shard:
+            return
+        owned = self.shard.owned
+        if owned == self.shard_applied:
+            return
+        gained = owned - self.shard_applied
+        lost = self.shard_applied - owned
+        with self.state_lock:
+            for key in lost:
+                # Канал ушел другому воркеру: его состояние теперь ведет он
+                self.states.remove(key)
+                if self.scheduler:
+                    self.scheduler.remove_channel(key)
+                if self.live_updater:
+                    self.live_updater.finish(key)
+            for key in gained:
+                if self.scheduler:
+                    self.scheduler.add_channel(key)
+                    config = self.channels.get(key)
+                    self.scheduler.set_interval(key, config.poll_interval if config else None)
+            self.shard_applied = owned
+        logger.info(f"🧩 Каналов у воркера {self.shard.worker_id}: {len(owned)} "
+                    f"(+{len(gained)} -{len(lost)})")
+    
+    def channel_key(self, stream_info):
+        """Ключ канала, под которым хранится его состояние"""
+        user_id = stream_info.get("user_id")
+        if user_id and user_id in self.user_ids:
+            return user_id
+        return (stream_info.get("user_login") or TWITCH_STREAMER_LOGIN or "").lower()
+        
     def get_twitch_token(self):
         """Получение токена доступа к Twitch API"""
         try:
-            url = "https://id.twitch.tv/oauth2/token"
-            data = {
-                "client_id": TWITCH_CLIENT_ID,
-                "client_secret": TWITCH_CLIENT_SECRET,
-                "grant_type": "client_credentials"
-            }
-            
-            response = requests.post(url, data=data)
-            if response.status_code == 200:
-                self.twitch_token = response.json()["access_token"]
-                print("✅ Токен Twitch получен успешно")
+            token = self.token_manager.refresh()
+            if token:
+                self.twitch_token = token
+                logger.info("✅ Токен Twitch получен успешно")
                 return True
             else:
-                print(f"❌ Ошибка получения токена Twitch: {response.status_code}")
+                logger.error(f"❌ Ошибка получения токена Twitch: {self.token_manager.last_error}")
                 return False
         except Exception as e:
-            print(f"❌ Ошибка при получении токена Twitch: {e}")
+            logger.error(f"❌ Ошибка при получении токена Twitch: {e}")
             return False
     
-    def check_stream_status(self):
-        """Проверка статуса стрима"""
-        if not self.twitch_token:
-            if not self.get_twitch_token():
-                return False
-        
-        try:
-            url = f"https://api.twitch.tv/helix/streams"
+    def ensure_twitch_token(self):
+        """Токен из кэша, а если он истек или отозван - новый"""
+        token = self.token_manager.get_token()
+        if token:
+            self.twitch_token = token
+            return True
+        return self.get_twitch_token()
+    
+    def twitch_request(self, method, url, **kwargs):
+        """Запрос к Helix с повтором после обновления токена при 401"""
+        for attempt in range(2):
             headers = {
                 "Client-ID": TWITCH_CLIENT_ID,
                 "Authorization": f"Bearer {self.twitch_token}"
             }
+            response = self.http.twitch.request(method, url, headers=headers, **kwargs)
+            if response.status_code != 401 or attempt:
+                return response
+            
+            # Токен отозван или истек раньше срока: обновляем один раз и повторяем
+            logger.info("🔑 Токен Twitch недействителен, обновляем...")
+            self.token_manager.invalidate()
+            if not self.get_twitch_token():
+                return response
+    
+    def twitch_get(self, url, params):
+        """GET-запрос к Helix"""
+        return self.twitch_request("GET", url, params=params)
+    
+    def check_stream_status(self):
+        """Проверка статуса стрима"""
+        self.reload_channels()
+        self.sync_shard()
+        if not self.ensure_twitch_token():
+            return False
+        
+        if self.multi_channel:
+            return self.check_channels_status()
+        
+        try:
+            url = f"{TWITCH_API_URL}/streams"
             params = {
                 "user_login": TWITCH_STREAMER_LOGIN
             }
             
-            response = requests.get(url, headers=headers, params=params)
+            response = self.twitch_get(url, params)
             
             if response.status_code == 200:
                 data = response.json()
                 is_live = len(data["data"]) > 0
-                
-                if is_live and not self.last_stream_status:
-                    # Стрим только что начался
-                    stream_info = data["data"][0]
-                    self.post_to_socials(stream_info)
-                    self.last_stream_status = True
-                    print(f"🎥 Стрим начался: {stream_info['title']}")
-                elif not is_live and self.last_stream_status:
-                    # Стрим закончился
-                    self.last_stream_status = False
-                    print("🔴 Стрим закончился")
-                
+                stream_info = data["data"][0] if is_live else None
+                self.detect(TWITCH_STREAMER_LOGIN.lower(), stream_info)
                 return is_live
             else:
-                print(f"❌ Ошибка проверки статуса стрима: {response.status_code}")
+                logger.error(f"❌ Ошибка проверки статуса стрима: {response.status_code}")
                 return False
                 
         except Exception as e:
-            print(f"❌ Ошибка при проверке статуса стрима: {e}")
+            logger.error(f"❌ Ошибка при проверке статуса стрима: {e}")
+            return False
+        finally:
+            if self.scheduler:
+                key = TWITCH_STREAMER_LOGIN.lower()
+                self.scheduler.schedule(key)
+    
+    def fetch_streams(self, logins=(), user_ids=()):
+        """Получение активных стримов пачками по 100 каналов с учетом пагинации"""
+        url = f"{TWITCH_API_URL}/streams"
+        filters = [("user_login", login) for login in logins]
+        filters += [("user_id", user_id) for user_id in user_ids]
+        
+        streams = []
+        failed = []
+        for batch in chunked(filters, HELIX_BATCH_SIZE):
+            cursor = None
+            while True:
+                params = batch + [("first", HELIX_BATCH_SIZE)]
+                if cursor:
+                    params.append(("after", cursor))
+                try:
+                    response = self.twitch_get(url, params)
+                except Exception as e:
+                    logger.error(f"❌ Ошибка при запросе пачки стримов: {e}")
+                    failed.extend(batch)
+                    break
+                
+                if response.status_code != 200:
+                    logger.error(f"❌ Ошибка проверки пачки стримов: {response.status_code}")
+                    failed.extend(batch)
+                    break
+                
+                data = response.json()
+                streams.extend(data["data"])
+                cursor = data.get("pagination", {}).get("cursor")
+                if not cursor:
+                    break
+        
+        return streams, failed
+    
+    def check_channels_status(self):
+        """Проверка статуса отслеживаемых каналов, которым подошла очередь"""
+        if self.scheduler and not self.eventsub:
+            keys = self.scheduler.due()
+        else:
+            keys = self.channel_keys()
+        if self.shard:
+            owned = self.shard_applied
+            keys = [key for key in keys if key in owned]
+        streams, failed = self.fetch_streams(
+            [key for key in keys if key not in self.user_ids],
+            [key for key in keys if key in self.user_ids]
+        )
+        
+        # Каналы из неудачных запросов не трогаем, чтобы не получить ложный оффлайн
+        unknown = {value.lower() for _, value in failed}
+        live = {}
+        for stream_info in streams:
+            live[self.channel_key(stream_info)] = stream_info
+        
+        for key in keys:
+            if key not in unknown:
+                self.detect(key, live.get(key))
+            if self.scheduler:
+                self.scheduler.schedule(key)
+        
+        return set(live)
+    
+    def detect(self, key, stream_info):
+        """Передача статуса канала на обнаружение смены: в конвейере - в очередь стадии"""
+        if self.pipeline:
+            self.pipeline.submit("detect", [key, stream_info])
+        else:
+            self.update_channel(key, stream_info)
+    
+    def update_channel(self, key, stream_info):
+        """Смена статуса канала; stream_info=None означает оффлайн"""
+        is_live = stream_info is not None
+        with self.state_lock:
+            if is_live:
+                was_live = self.states.transition(key, True, self.stream_id(stream_info),
+                                                  parse_started_at(stream_info.get("started_at")))
+            else:
+                was_live = self.states.transition(key, False)
+            if self.scheduler and is_live and not was_live:
+                self.scheduler.record_start(key, stream_info.get("started_at"))
+        
+        if is_live and not was_live:
+            # Стрим только что начался
+            started = parse_started_at(stream_info.get("started_at"))
+            if started:
+                DETECTION_SECONDS.observe(max(time.time() - started, 0))
+            self.post_to_socials(stream_info)
+            logger.info(f"🎥 Стрим {key} начался: {stream_info['title']}", extra={"channel": key})
+        elif is_live and self.live_updater:
+            self.live_updater.observe(self.stream_id(stream_info), stream_info)
+        elif not is_live and was_live:
+            # Стрим закончился
+            if self.live_updater:
+                self.live_updater.finish(key)
+            logger.info(f"🔴 Стрим {key} закончился", extra={"channel": key})
+        return is_live != was_live
+    
+    def fetch_user_ids(self, logins):
+        """ID пользователей Twitch по логинам, пачками по 100"""
+        user_ids = {}
+        for batch in chunked(list(logins), HELIX_BATCH_SIZE):
+            params = [("login", login) for login in batch]
+            response = self.twitch_get(f"{TWITCH_API_URL}/users", params)
+            if response.status_code != 200:
+                logger.error(f"❌ Ошибка получения ID пользователей: {response.status_code}")
+                continue
+            for user in response.json()["data"]:
+                user_ids[user["login"].lower()] = user["id"]
+        return user_ids
+    
+    def handle_stream_event(self, subscription_type, event):
+        """Обработка уведомления EventSub о начале или конце стрима"""
+        user_id = event["broadcaster_user_id"]
+        login = event["broadcaster_user_login"].lower()
+        key = user_id if user_id in self.user_ids else login
+        if self.multi_channel and not self.has_channel(key):
+            # Канал удален из файла каналов, а подписка еще действует
+            return
+        if self.shard and key not in self.shard_applied:
+            # Событие канала другого воркера
+            return
+        
+        if subscription_type == "stream.offline":
+            self.detect(key, None)
+            return
+        
+        # В stream.online нет названия и игры, поэтому догружаем стрим из Helix
+        stream_info = None
+        if self.ensure_twitch_token():
+            streams, _ = self.fetch_streams(user_ids=[user_id])
+            stream_info = streams[0] if streams else None
+        if stream_info is None:
+            stream_info = {
+                "id": event.get("id"),
+                "user_id": user_id,
+                "user_login": login,
+                "user_name": event.get("broadcaster_user_name"),
+                "title": "",
+                "started_at": event.get("started_at")
+            }
+        self.detect(key, stream_info)
+    
+    def start_eventsub(self):
+        """Запуск приема EventSub и подписка на события каналов"""
+        if EVENTSUB_CONFIG_ERROR:
+            logger.error(f"❌ EventSub не запущен: {EVENTSUB_CONFIG_ERROR}, остается обычный опрос")
+            return False
+        if not self.ensure_twitch_token():
             return False
+        
+        logins = list(self.logins) if self.multi_channel else [TWITCH_STREAMER_LOGIN.lower()]
+        user_ids = list(self.user_ids) + list(self.fetch_user_ids(logins).values())
+        
+        try:
+            self.eventsub = EventSubReceiver(self.handle_stream_event)
+        except OSError as e:
+            logger.error(f"❌ Не удалось запустить прием EventSub: {e}")
+            return False
+        self.eventsub.start()
+        active = EventSubSubscriber(self).subscribe(user_ids)
+        if not active:
+            # Без подписок события не придут: редкий запасной опрос пропустил бы начало стримов
+            logger.error("❌ EventSub: ни одна подписка не создана, остается обычный опрос")
+            self.eventsub.stop()
+            self.eventsub = None
+            return False
+        logger.info(f"📡 EventSub: порт {self.eventsub.port}, подписок {active}")
+        return True
+    
+    def subscribe_channels(self, channels):
+        """Подписка EventSub на каналы, добавленные в файл каналов"""
+        user_ids = [channel.user_id for channel in channels if channel.user_id]
+        logins = [channel.login for channel in channels if not channel.user_id]
+        user_ids += list(self.fetch_user_ids(logins).values())
+        active = EventSubSubscriber(self).subscribe(user_ids)
+        logger.info(f"📡 EventSub: подписок для новых каналов {active}")
+    
+    @property
+    def poll_interval(self):
+        """Пауза до следующего опроса"""
+        # При работающем EventSub опрос только страхует
+        if self.eventsub:
+            return EVENTSUB_FALLBACK_INTERVAL
+        if self.scheduler:
+            return max(self.scheduler.next_wakeup() - time.time(), 1)
+        return POLL_INTERVAL
+    
+    def stream_id(self, stream_info):
+        """Идентификатор трансляции для защиты от повторных постов"""
+        if stream_info.get("id"):
+            return stream_info["id"]
+        # Без id различаем трансляции по времени начала, а без него - по 5-минутному окну
+        started = stream_info.get("started_at") or int(time.time() // 300)
+        return f"{self.channel_key(stream_info)}:{started}"
     
     def post_to_socials(self, stream_info):
         """Постинг в социальные сети"""
         current_time = datetime.now()
+        key = self.channel_key(stream_info)
+        stream_id = self.stream_id(stream_info)
         
-        # Проверяем, не постили ли мы недавно
-        if (self.last_post_time and 
-            (current_time - self.last_post_time).seconds < 300):  # 5 минут
-            print("⏰ Пост уже был недавно, пропускаем")
+        # Аренда могла истечь, пока шел опрос: тогда канал уже у другого воркера
+        if self.shard and not self.shard.holds(key):
+            logger.warning(f"⚠️ Канал {key} больше не закреплен за воркером, пост пропущен",
+                           extra={"channel": key, "stream_id": stream_id})
             return
         
-        # Формируем сообщение
-        message = STREAM_MESSAGE_TEMPLATE.format(
-            streamer=TWITCH_STREAMER_LOGIN,
-            title=stream_info["title"],
-            url=f"https://twitch.tv/{TWITCH_STREAMER_LOGIN}"
-        )
+        # Проверяем, не объявляли ли мы уже эту трансляцию (в т.ч. до перезапуска)
+        if not self.dedupe.claim(stream_id, key):
+            logger.info("⏰ Пост об этом стриме уже был, пропускаем",
+                        extra={"channel": key, "stream_id": stream_id})
+            return
+        
+        if self.pipeline:
+            # Рендер и доставка идут в своих стадиях
+            self.pipeline.submit("render", stream_info)
+            report = None
+        else:
+            report = self.publish(stream_id, key, self.build_payloads(stream_info))
+        
+        self.states.mark_posted(key, current_time.timestamp())
+        self.last_post_time = current_time
+        return report
+    
+    def publish(self, stream_id, key, payloads):
+        """Доставка постов о трансляции; без очереди возвращает DeliveryReport"""
+        if self.outbox:
+            # Доставкой займутся воркеры очереди, опрос не ждет медленные соцсети
+            self.outbox.enqueue(stream_id, payloads)
+            return None
+        # Назначения обслуживаются параллельно, ждем только самое медленное
+        report = self.fanout.deliver(self.delivery_tasks(payloads))
+        logger.info(report.summary(),
+                    extra={"channel": key, "stream_id": stream_id, "latency": report.duration})
+        return report
+    
+    def build_pipeline(self):
+        """Стадии конвейера: обнаружение смены статуса, рендер постов, доставка"""
+        pipeline = Pipeline()
+        # Статусы одного канала обрабатывает один поток, иначе онлайн и оффлайн могут поменяться местами
+        pipeline.add_stage("detect", self.detect_stage, partition=lambda item: item[0],
+                           **PIPELINE_STAGES["detect"])
+        pipeline.add_stage("render", self.render_stage, **PIPELINE_STAGES["render"])
+        pipeline.add_stage("deliver", self.deliver_stage, **PIPELINE_STAGES["deliver"])
+        return pipeline
+    
+    def detect_stage(self, item):
+        """Стадия обнаружения: [канал, стрим или None]"""
+        key, stream_info = item
+        self.update_channel(key, stream_info)
+    
+    def render_stage(self, stream_info):
+        """Стадия рендера: посты для всех назначений уходят на доставку"""
+        payloads = self.build_payloads(stream_info)
+        self.pipeline.submit("deliver", [self.stream_id(stream_info), self.channel_key(stream_info), payloads])
+    
+    def deliver_stage(self, item):
+        """Стадия доставки: [стрим, канал, посты]"""
+        stream_id, key, payloads = item
+        self.publish(stream_id, key, payloads)
+    
+    def build_payloads(self, stream_info):
+        """Посты для всех назначений; каждая группа VK - отдельное назначение vk:<id>"""
+        # Один рендер на формат, назначения одного формата его переиспользуют
+        photo_url = None
+        if self.media and stream_info.get("thumbnail_url"):
+            # Превью скачивается при доставке, чтобы не задерживать опрос
+            photo_url = sized_thumbnail_url(stream_info["thumbnail_url"])
         
-        # Добавляем информацию об игре
-        if stream_info.get("game_name"):
-            message += f"\n🎮 Игра: {stream_info['game_name']}"
+        stream_id = self.stream_id(stream_info)
+        channel = self.channel_key(stream_info)
+        payloads = {}
+        for destination in self.channel_destinations(channel):
+            platform, _, group_id = destination.partition(":")
+            if destination == "telegram" and photo_url and TELEGRAM_SEND_PHOTO:
+                payloads[destination] = self.telegram_payload(channel, {
+                    "message": self.renderer.render(stream_info, destination, caption=True),
+                    "photo_url": photo_url,
+                    "stream_id": stream_id,
+                    "channel": channel
+                })
+                continue
+            
+            payload = {
+                "message": self.renderer.render(stream_info, platform),
+                "stream_id": stream_id,
+                "channel": channel
+            }
+            if platform == "vk" and photo_url and VK_SEND_PHOTO:
+                payload["photo_url"] = photo_url
+            if group_id:
+                payloads[destination] = dict(payload, group_id=group_id)
+            elif destination == "vk" and VK_GROUP_IDS:
+                for group_id in VK_GROUP_IDS:
+                    payloads[f"vk:{group_id}"] = dict(payload, group_id=group_id)
+            elif destination == "telegram":
+                payloads[destination] = self.telegram_payload(channel, payload)
+            else:
+                payloads[destination] = payload
+        return payloads
+    
+    def telegram_payload(self, channel, payload):
+        """В режиме рассылки пост Telegram уходит во все чаты с приоритетом канала"""
+        if not self.broadcaster:
+            return payload
+        config = self.channels.get(channel)
+        return dict(payload, chats=list(TELEGRAM_BROADCAST_CHATS),
+                    priority=config.priority if config else 0)
+    
+    def channel_destinations(self, channel):
+        """Назначения канала: из файла каналов или POST_DESTINATIONS"""
+        config = self.channels.get(channel)
+        if config and config.destinations is not None:
+            return config.destinations
+        return self.destinations
+    
+    def delivery_tasks(self, payloads):
+        """Задачи доставки по назначениям; группы VK при пакетной публикации - одним execute"""
+        tasks = {
+            destination: partial(self.deliver_or_park, destination, payload)
+            for destination, payload in payloads.items()
+        }
+        vk = [(destination, payload) for destination, payload in payloads.items()
+              if destination.split(":", 1)[0] == "vk" and payload.get("group_id")]
+        if self.vk_batch and len(vk) > 1 and not (self.parking and self.parking.blocked("vk")):
+            # Пакет ставится в пул первым, поэтому ждущие его задачи не займут все потоки раньше него
+            batch = self.fanout.executor.submit(self.deliver_vk_batch, vk)
+            for index, (destination, _) in enumerate(vk):
+                tasks[destination] = partial(self.batch_result, batch, index)
+        return tasks
+    
+    @staticmethod
+    def batch_result(future, index):
+        """Результат одного назначения из общего пакета"""
+        return future.result()[index]
+    
+    def deliver_vk_batch(self, items):
+        """Публикация в группы VK пакетами execute; items - [(назначение, payload)], результат - [успех]"""
+        if not VK_ACCESS_TOKEN or not all(payload.get("group_id") for _, payload in items):
+            # Без группы назначение пропускается так же, как в post_to_vk
+            return [self.deliver(destination, payload) for destination, payload in items]
         
-        # Добавляем количество зрителей
-        if stream_info.get("viewer_count"):
-            message += f"\n👥 Зрители: {stream_info['viewer_count']}"
+        posts = []
+        attachments = {}
+        for destination, payload in items:
+            group_id = payload["group_id"]
+            photo_url = payload.get("photo_url")
+            if photo_url and self.vk_photos and photo_url not in attachments:
+                # Фото загружается один раз на весь пакет
+                attachments[photo_url] = self.vk_photos.attachment(photo_url, group_id)
+            posts.append((group_id, payload["message"], attachments.get(photo_url)))
         
-        # Постим в Telegram
-        #self.post_to_telegram(message)
+        started = time.monotonic()
+        results = self.vk_batch.post(posts)
+        delivered = []
+        for (destination, payload), (group_id, _, attached), (post_id, error) in zip(items, posts, results):
+            if not post_id:
+                logger.error(f"❌ Ошибка постинга в {destination}: {error}",
+                             extra={"platform": "vk", "destination": destination,
+                                    "stream_id": payload.get("stream_id")})
+            elif self.live_updater and payload.get("stream_id"):
+                self.live_updater.track(payload["stream_id"], payload.get("channel"), destination,
+                                        dict(payload, group_id=group_id, attachments=attached), post_id)
+            delivered.append(bool(post_id))
+        logger.info(f"✅ Пакет VK: опубликовано в {sum(delivered)}/{len(items)} групп",
+                    extra={"platform": "vk", "latency": time.monotonic() - started})
+        return delivered
+    
+    def deliver_or_park(self, destination, payload):
+        """Доставка без очереди: если платформа недоступна, пост откладывается до ее восстановления"""
+        platform = destination.split(":", 1)[0]
+        if self.parking and self.parking.blocked(platform):
+            logger.warning(f"⏸ {destination} недоступен, пост отложен до восстановления",
+                           extra={"destination": destination, "stream_id": payload.get("stream_id")})
+            self.parking.park(platform, partial(self.deliver_or_park, destination, payload))
+            return False
+        ok = self.deliver(destination, payload)
+        if not ok and self.parking and self.parking.blocked(platform):
+            # Сбой разомкнул контур (или не прошла проба): пост ждет следующей пробы, а не теряется
+            self.parking.park(platform, partial(self.deliver_or_park, destination, payload), front=True)
+        return ok
+    
+    def deliver(self, destination, payload):
+        """Отправка поста в одно назначение; True при успехе"""
+        platform = destination.split(":", 1)[0]
+        if platform == "telegram" and payload.get("chats") and self.broadcaster:
+            return self.broadcast(payload, destination)
+        elif platform == "telegram":
+            result = self.send_to_chat(payload)
+        elif platform == "vk":
+            attachments = None
+            if payload.get("photo_url") and self.vk_photos:
+                # Фото загружается один раз, остальные группы получают готовое вложение
+                attachments = self.vk_photos.attachment(payload["photo_url"], payload.get("group_id"))
+            result = self.post_to_vk(payload["message"], group_id=payload.get("group_id"),
+                                     attachments=attachments)
+            payload = dict(payload, attachments=attachments)
+        else:
+            logger.warning(f"⚠️ Неизвестное назначение: {destination}")
+            return False
         
-        # Постим в VK (отключено в текущей версии)
-        self.post_to_vk(message)
+        # Методы постинга возвращают id сообщения; True - назначение пропущено
+        if self.live_updater and result and result is not True and payload.get("stream_id"):
+            self.live_updater.track(payload["stream_id"], payload.get("channel"),
+                                    destination, payload, result)
+        return bool(result)
+    
+    def send_to_chat(self, payload, chat_id=None):
+        """Пост Telegram в один чат (по умолчанию TELEGRAM_CHANNEL_ID); возвращает message_id"""
+        if payload.get("photo_url") and self.media:
+            return self.post_photo_to_telegram(payload["message"], payload["photo_url"], chat_id=chat_id)
+        return self.post_to_telegram(payload["message"], chat_id=chat_id)
+    
+    def broadcast(self, payload, destination="telegram"):
+        """Рассылка поста по чатам Telegram; True, если доставлено во все"""
+        stream_id = payload.get("stream_id")
+        broadcast = self.broadcaster.broadcast(payload, payload["chats"],
+                                               payload.get("priority", 0), stream_id)
+        deadline = time.monotonic() + TELEGRAM_BROADCAST_TIMEOUT
+        while not broadcast.wait(min(LEASE_RENEW_INTERVAL, max(deadline - time.monotonic(), 0))):
+            if time.monotonic() >= deadline:
+                logger.warning(f"⚠️ Рассылка не завершилась за {TELEGRAM_BROADCAST_TIMEOUT:.0f}с, "
+                               f"остальные чаты - при повторе",
+                               extra={"platform": "telegram", "stream_id": stream_id})
+                break
+            # Долгая рассылка не должна потерять аренду записи: иначе ее подхватит другой воркер
+            if self.outbox and stream_id:
+                self.outbox.renew(stream_id, destination)
+        logger.info(broadcast.summary(), extra={"platform": "telegram", "stream_id": stream_id,
+                                                "channel": payload.get("channel")})
         
-        self.last_post_time = current_time
+        if self.live_updater and stream_id:
+            # Каждый чат - отдельный пост со своим message_id
+            for chat_id, result in broadcast.results.items():
+                if result["ok"]:
+                    self.live_updater.track(stream_id, payload.get("channel"), f"telegram:{chat_id}",
+                                            dict(payload, chat_id=chat_id), result["message_id"])
+        return broadcast.ok
+    
+    def render_update(self, stream_info, destination, payload):
+        """Новый текст опубликованного поста"""
+        platform = destination.split(":", 1)[0]
+        caption = platform == "telegram" and bool(payload.get("photo_url"))
+        return self.renderer.render(stream_info, platform, caption=caption)
     
-    def post_to_telegram(self, message):
-        """Постинг в Telegram"""
+    def edit_post(self, destination, payload, message_id, text):
+        """Правка опубликованного поста; True при успехе"""
+        platform = destination.split(":", 1)[0]
         try:
-            url = f"https://api.telegram.org/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
-            
-            # Очищаем сообщение от HTML тегов для безопасности
-            clean_message = message.replace('<', '&lt;').replace('>', '&gt;')
-            
-            # Ограничиваем длину сообщения (Telegram лимит ~4096 символов)
-            if len(clean_message) > 4000:
-                clean_message = clean_message[:3997] + "..."
+            if platform == "telegram":
+                caption = bool(payload.get("photo_url"))
+                method = "editMessageCaption" if caption else "editMessageText"
+                data = {
+                    "chat_id": payload.get("chat_id") or TELEGRAM_CHANNEL_ID,
+                    "message_id": message_id,
+                    "caption" if caption else "text": text,
+                    "parse_mode": self.renderer.renderer_for("telegram").parse_mode
+                }
+                response = self.http.telegram.post(
+                    f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/{method}", data=data
+                )
+                ok = response.status_code == 200
+            elif platform == "vk":
+                data = {
+                    "owner_id": f"-{payload.get('group_id') or VK_GROUP_IDS[0]}",
+                    "post_id": message_id,
+                    "message": text,
+                    "access_token": VK_ACCESS_TOKEN,
+                    "v": VK_API_VERSION
+                }
+                # wall.edit заменяет вложения целиком, поэтому передаем их снова
+                if payload.get("attachments"):
+                    data["attachments"] = payload["attachments"]
+                response = self.http.vk.post(f"{VK_API_URL}/wall.edit", data=data)
+                ok = response.status_code == 200 and "response" in response.json()
+            else:
+                return False
+        except Exception as e:
+            logger.error(f"❌ Ошибка при обновлении поста в {destination}: {e}")
+            return False
+        
+        if not ok:
+            logger.error(f"❌ Ошибка обновления поста в {destination}: {response.status_code}")
+        return ok
+    
+    def start_services(self):
+        """Запуск фоновых служб: конвейера, доставки из очереди, обновления постов, метрик,
+        аренды каналов и рассылки"""
+        if self.pipeline:
+            self.pipeline.start()
+        if self.live_updater and not self.live_updater.is_alive():
+            self.live_updater.start()
+        self.start_outbox()
+        self.start_metrics()
+        self.start_shard()
+        if self.broadcaster and not self.broadcaster.is_alive():
+            self.broadcaster.start()
+        if self.parking and not self.parking.is_alive():
+            self.parking.start()
+        if self.snapshot_flusher and not self.snapshot_flusher.is_alive():
+            self.snapshot_flusher.start()
+    
+    def start_metrics(self):
+        """Запуск эндпоинта /metrics"""
+        if not METRICS_ENABLED or self.metrics_server:
+            return
+        # Квоты и глубина очереди считаются только при запросе метрик
+        governor = self.http.governor
+        for platform in ("twitch", "telegram", "vk"):
+            RATE_LIMIT_HEADROOM.set_function(partial(governor.headroom, platform), platform)
+        if self.outbox:
+            OUTBOX_DEPTH.set_function(self.outbox.depth)
+        if self.parking:
+            PARKED_WORK.set_function(self.parking.depth)
+        
+        try:
+            self.metrics_server = MetricsServer()
+        except OSError as e:
+            logger.error(f"❌ Не удалось запустить эндпоинт метрик: {e}")
+            return
+        self.metrics_server.start()
+        logger.info(f"📊 Метрики: http://{METRICS_HOST}:{self.metrics_server.port}/metrics")
+    
+    def start_outbox(self):
+        """Запуск воркеров доставки из очереди"""
+        if not self.outbox or self.outbox_workers:
+            return
+        for _ in range(OUTBOX_WORKERS):
+            worker = OutboxWorker(
+                self.outbox, self.deliver, parking=self.parking,
+                batches={"vk": self.deliver_vk_batch} if self.vk_batch else None,
+                claim_limit=VK_BATCH_SIZE if self.vk_batch else 10
+            )
+            worker.start()
+            self.outbox_workers.append(worker)
+    
+    def post_to_telegram(self, message, chat_id=None):
+        """Постинг в Telegram (message уже экранирован и укорочен рендерером); возвращает message_id"""
+        try:
+            url = f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/sendMessage"
             
             data = {
-                "chat_id": TELEGRAM_CHANNEL_ID,
-                "text": clean_message,
-                "parse_mode": "HTML"
+                "chat_id": chat_id or TELEGRAM_CHANNEL_ID,
+                "text": message,
+                "parse_mode": self.renderer.renderer_for("telegram").parse_mode
             }
             
-            response = requests.post(url, data=data)
+            response = self.http.telegram.post(url, data=data)
             if response.status_code == 200:
-                print("✅ Пост в Telegram успешно опубликован")
+                logger.info("✅ Пост в Telegram успешно опубликован",
+                            extra={"platform": "telegram", "latency": response.elapsed.total_seconds()})
+                return response.json()["result"]["message_id"]
             else:
                 # Получаем детали ошибки
                 error_details = response.json() if response.content else "Нет деталей"
-                print(f"❌ Ошибка постинга в Telegram: {response.status_code}")
-                print(f"   Детали: {error_details}")
+                logger.error(f"❌ Ошибка постинга в Telegram: {response.status_code}, детали: {error_details}",
+                             extra={"platform": "telegram", "status": response.status_code})
                 
                 # Попробуем отправить без HTML разметки
                 if response.status_code == 400:
-                    print("🔄 Пробуем отправить без HTML разметки...")
+                    logger.info("🔄 Пробуем отправить без HTML разметки...")
                     data["parse_mode"] = None
-                    retry_response = requests.post(url, data=data)
+                    retry_response = self.http.telegram.post(url, data=data)
                     if retry_response.status_code == 200:
-                        print("✅ Пост в Telegram отправлен без HTML разметки")
+                        logger.info("✅ Пост в Telegram отправлен без HTML разметки")
+                        return retry_response.json()["result"]["message_id"]
                     else:
-                        print(f"❌ Повторная ошибка: {retry_response.status_code}")
+                        logger.error(f"❌ Повторная ошибка: {retry_response.status_code}")
+                return False
                 
         except Exception as e:
-            print(f"❌ Ошибка при постинге в Telegram: {e}")
+            logger.error(f"❌ Ошибка при постинге в Telegram: {e}")
+            return False
     
-    def post_to_vk(self, message):
-        """Постинг в VK"""
+    def post_photo_to_telegram(self, message, photo_url, chat_id=None):
+        """Фото-пост в Telegram: картинка загружается один раз, дальше по file_id"""
+        photo = self.media.get(photo_url)
+        if photo is None:
+            logger.warning("⚠️ Превью недоступно, отправляем текстом")
+            return self.post_to_telegram(message, chat_id=chat_id)
+        
         try:
+            url = f"{TELEGRAM_API_URL}/bot{TELEGRAM_BOT_TOKEN}/sendPhoto"
+            data = {
+                "chat_id": chat_id or TELEGRAM_CHANNEL_ID,
+                "caption": message,
+                "parse_mode": self.renderer.renderer_for("telegram").parse_mode
+            }
+            status = {}
+            
+            def upload():
+                # Первая отправка сама загружает картинку и возвращает ее file_id
+                files = {"photo": ("thumbnail.jpg", self.media.read(photo["key"]), "image/jpeg")}
+                response = self.http.telegram.post(url, data=data, files=files)
+                status["code"] = response.status_code
+                if response.status_code == 200:
+                    result = response.json()["result"]
+                    status["sent"] = True
+                    status["message_id"] = result["message_id"]
+                    return result["photo"][-1]["file_id"]
+            
+            file_id = self.media.upload_once("telegram", photo["key"], upload)
+            if not status.get("sent") and file_id is not None:
+                response = self.http.telegram.post(url, data=dict(data, photo=file_id))
+                status["code"] = response.status_code
+                status["sent"] = response.status_code == 200
+                if status["sent"]:
+                    status["message_id"] = response.json()["result"]["message_id"]
+            
+            if status.get("sent"):
+                logger.info("✅ Фото-пост в Telegram успешно опубликован")
+                return status["message_id"]
+            logger.error(f"❌ Ошибка фото-поста в Telegram: {status.get('code')}, отправляем текстом")
+            return self.post_to_telegram(message, chat_id=chat_id)
+        
+        except Exception as e:
+            logger.error(f"❌ Ошибка при фото-посте в Telegram: {e}")
+            return False
+    
+    def post_to_vk(self, message, group_id=None, attachments=None):
+        """Постинг в VK; возвращает post_id"""
+        try:
+            group_id = group_id or (VK_GROUP_IDS[0] if VK_GROUP_IDS else None)
             # Проверяем, настроен ли VK
-            if not VK_GROUP_ID or not VK_ACCESS_TOKEN:
-                print("⚠️ VK не настроен, пропускаем")
-                return
+            if not group_id or not VK_ACCESS_TOKEN:
+                logger.warning("⚠️ VK не настроен, пропускаем")
+                return True
             
-            url = "https://api.vk.com/method/wall.post"
+            url = f"{VK_API_URL}/wall.post"
             data = {
-                "owner_id": f"-{VK_GROUP_ID}",
+                "owner_id": f"-{group_id}",
                 "message": message,
                 "access_token": VK_ACCESS_TOKEN,
                 "v": VK_API_VERSION
             }
+            if attachments:
+                data["attachments"] = attachments
             
-            response = requests.post(url, data=data)
+            response = self.http.vk.post(url, data=data)
             if response.status_code == 200:
                 result = response.json()
                 if "response" in result:
-                    print("✅ Пост в VK успешно опубликован")
+                    logger.info("✅ Пост в VK успешно опубликован",
+                                extra={"platform": "vk", "destination": f"vk:{group_id}",
+                                       "latency": response.elapsed.total_seconds()})
+                    return result["response"]["post_id"]
                 else:
-                    print(f"❌ Ошибка постинга в VK: {result}")
+                    logger.error(f"❌ Ошибка постинга в VK: {result}", extra={"platform": "vk"})
             else:
-                print(f"❌ Ошибка постинга в VK: {response.status_code}")
+                logger.error(f"❌ Ошибка постинга в VK: {response.status_code}",
+                             extra={"platform": "vk", "status": response.status_code})
+            return False
                 
         except Exception as e:
-            print(f"❌ Ошибка при постинге в VK: {e}")
+            logger.error(f"❌ Ошибка при постинге в VK: {e}")
+            return False
     
     def run(self):
         """Основной цикл работы"""
-        print("🚀 Запуск Twitch AutoPoster...")
-        print(f"📺 Мониторинг канала: {TWITCH_STREAMER_LOGIN}")
-        print(f"📱 Telegram канал: {TELEGRAM_CHANNEL_ID}")
-        print(f"🌐 VK группа: {VK_GROUP_ID if VK_GROUP_ID else 'Не настроена'}")
-        print("=" * 50)
+        logger.info("🚀 Запуск Twitch AutoPoster...")
+        if self.multi_channel:
+            logger.info(f"📺 Мониторинг каналов: {len(self.logins) + len(self.user_ids)}")
+        else:
+            logger.info(f"📺 Мониторинг канала: {TWITCH_STREAMER_LOGIN}")
+        if self.broadcaster:
+            logger.info(f"📱 Telegram чатов для рассылки: {len(TELEGRAM_BROADCAST_CHATS)}")
+        else:
+            logger.info(f"📱 Telegram канал: {TELEGRAM_CHANNEL_ID}")
+        logger.info(f"🌐 VK группы: {', '.join(VK_GROUP_IDS) if VK_GROUP_IDS else 'Не настроены'}")
+        logger.info("=" * 50)
+        
+        self.start_services()
+        if EVENTSUB_ENABLED:
+            self.start_eventsub()
         
         while True:
             try:
-                self.check_stream_status()
-                time.sleep(60)  # Проверяем каждую минуту
+                with POLL_CYCLE_SECONDS.time():
+                    self.check_stream_status()
+                if self.scheduler:
+                    self.scheduler.flush()
+                if self.pipeline:
+                    logger.debug(self.pipeline.summary())
+                time.sleep(self.poll_interval)
                 
             except KeyboardInterrupt:
-                print("\n🛑 Остановка программы...")
+                logger.info("🛑 Остановка программы...")
+                self.stop()
                 break
             except Exception as e:
-                print(f"❌ Неожиданная ошибка: {e}")
-                time.sleep(60)
+                logger.error(f"❌ Неожиданная ошибка: {e}")
+                time.sleep(self.poll_interval)
+    
+    def stop(self):
+        """Освобождение ресурсов"""
+        if self.eventsub:
+            self.eventsub.stop()
+        if self.metrics_server:
+            self.metrics_server.stop()
+        if self.pipeline:
+            # Стадии дорабатывают то, что уже в памяти, пока доставка еще работает
+            self.pipeline.stop()
+        if self.shard:
+            self.shard.stop()
+        if self.live_updater:
+            self.live_updater.stop()
+        if self.broadcaster:
+            self.broadcaster.stop()
+        if self.parking:
+            self.parking.stop()
+        for worker in self.outbox_workers:
+            worker.stop()
+        for worker in self.outbox_workers:
+            worker.join(timeout=5)
+        if self.outbox:
+            self.outbox.close()
+        self.fanout.shutdown()
+        if self.scheduler:
+            self.scheduler.flush(force=True)
+        if self.snapshot_flusher:
+            self.snapshot_flusher.stop()
+        self.states.close()
+        self.dedupe.close()
+        self.http.close()
 
 if __name__ == "__main__":
+    setup_logging()
     poster = TwitchAutoPoster()
     poster.run()
\ No newline at end of file
@@ -0,0 +1,226 @@
+"""
+Превью стрима для фото-постов: загрузка с условным GET, кэш на диске с LRU-вытеснением
+и повторное использование уже загруженных в соцсети картинок (file_id Telegram, вложения VK)
+"""
+
+import os
+import json
+import time
+import hashlib
+import threading
+import logging
+from contextlib import contextmanager
+from config import (
+    MEDIA_CACHE_DIR, MEDIA_CACHE_MAX_MB, MEDIA_FRESH_SECONDS, THUMBNAIL_WIDTH, THUMBNAIL_HEIGHT
+)
+
+logger = logging.getLogger(__name__)
+
+try:
+    from PIL import Image
+except ImportError:  # Pillow необязателен: Twitch и так отдает превью нужного размера
+    Image = None
+
+INDEX_FILE = "index.json"
+
+def sized_thumbnail_url(thumbnail_url, width=THUMBNAIL_WIDTH, height=THUMBNAIL_HEIGHT):
+    """Адрес превью нужного размера (Twitch масштабирует по шаблону {width}x{height})"""
+    return thumbnail_url.replace("{width}", str(width)).replace("{height}", str(height))
+
+def resize_image(data, width=THUMBNAIL_WIDTH, height=THUMBNAIL_HEIGHT):
+    """Уменьшение картинки до width x height, если установлен Pillow"""
+    if Image is None:
+        return data
+    import io
+    try:
+        image = Image.open(io.BytesIO(data))
+        if image.width <= width and image.height <= height:
+            return data
+        image.thumbnail((width, height))
+        output = io.BytesIO()
+        image.convert("RGB").save(output, format="JPEG", quality=85)
+        return output.getvalue()
+    except Exception:
+        return data
+
+class MediaCache:
+    """Кэш картинок на диске: индекс по адресу, файлы по хэшу содержимого"""
+    
+    def __init__(self, session, cache_dir=MEDIA_CACHE_DIR,
+                 max_bytes=MEDIA_CACHE_MAX_MB * 1024 * 1024, fresh_for=MEDIA_FRESH_SECONDS):
+        self.session = session
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.fresh_for = fresh_for
+        self.lock = threading.Lock()
+        self.key_locks = {}
+        os.makedirs(cache_dir, exist_ok=True)
+        self.index = self.load()
+    
+    def load(self):
+        """Загрузка индекса кэша"""
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        try:
+            with open(path, encoding='utf-8') as f:
+                index = json.load(f)
+        except (OSError, ValueError):
+            index = {}
+        index.setdefault("urls", {})
+        index.setdefault("files", {})
+        index.setdefault("uploads", {})
+        return index
+    
+    def save(self):
+        """Атомарное сохранение индекса (вызывается под self.lock)"""
+        path = os.path.join(self.cache_dir, INDEX_FILE)
+        tmp_path = f"{path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.index, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить индекс медиа-кэша: {e}")
+    
+    @contextmanager
+    def key_lock(self, key):
+        """Блокировка для одного адреса или файла; запись удаляется, когда ее больше никто не ждет"""
+        with self.lock:
+            lock, users = self.key_locks.get(key, (None, 0))
+            lock = lock or threading.Lock()
+            self.key_locks[key] = (lock, users + 1)
+        try:
+            with lock:
+                yield
+        finally:
+            with self.lock:
+                lock, users = self.key_locks[key]
+                if users > 1:
+                    self.key_locks[key] = (lock, users - 1)
+                else:
+                    del self.key_locks[key]
+    
+    def path(self, key):
+        """Путь к файлу по хэшу содержимого"""
+        return os.path.join(self.cache_dir, f"{key}.jpg")
+    
+    def get(self, url):
+        """Картинка по адресу: {"key", "path"} или None"""
+        with self.key_lock(url):
+            with self.lock:
+                entry = self.index["urls"].get(url)
+            now = time.time()
+            
+            # Свежую копию не перепроверяем: один стрим - одна загрузка на все чаты
+            if entry and now - entry["checked_at"] < self.fresh_for and os.path.exists(self.path(entry["key"])):
+                self.touch(entry["key"], now)
+                return {"key": entry["key"], "path": self.path(entry["key"])}
+            
+            headers = {}
+            if entry and os.path.exists(self.path(entry["key"])):
+                if entry.get("etag"):
+                    headers["If-None-Match"] = entry["etag"]
+                if entry.get("last_modified"):
+                    headers["If-Modified-Since"] = entry["last_modified"]
+            try:
+                response = self.session.get(url, headers=headers)
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось загрузить превью: {e}")
+                response = None
+            
+            if response is not None and response.status_code == 304 and headers:
+                key = entry["key"]
+            elif response is not None and response.status_code == 200:
+                key = self.store(resize_image(response.content))
+            elif entry and os.path.exists(self.path(entry["key"])):
+                # Сервер недоступен: отдаем устаревшую копию
+                return {"key": entry["key"], "path": self.path(entry["key"])}
+            else:
+                return None
+            
+            with self.lock:
+                self.index["urls"][url] = {
+                    "key": key,
+                    "etag": response.headers.get("ETag") or (entry or {}).get("etag"),
+                    "last_modified": (response.headers.get("Last-Modified")
+                                      or (entry or {}).get("last_modified")),
+                    "checked_at": now
+                }
+            self.touch(key, now)
+            # Новый файл попадает в индекс сразу, а подтверждение 304 - при следующей записи
+            if not self.evict() and response.status_code == 200:
+                with self.lock:
+                    self.save()
+            return {"key": key, "path": self.path(key)}
+    
+    def store(self, data):
+        """Запись картинки на диск; ключ - хэш содержимого"""
+        key = hashlib.sha1(data).hexdigest()
+        path = self.path(key)
+        if not os.path.exists(path):
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            os.replace(tmp_path, path)
+        with self.lock:
+            self.index["files"][key] = {"size": len(data), "used_at": time.time()}
+        return key
+    
+    def touch(self, key, now=None):
+        """Отметка использования файла для LRU"""
+        with self.lock:
+            info = self.index["files"].get(key)
+            if info:
+                info["used_at"] = now or time.time()
+    
+    def read(self, key):
+        """Содержимое картинки"""
+        with open(self.path(key), 'rb') as f:
+            return f.read()
+    
+    def evict(self):
+        """Удаление давно не использованных файлов сверх лимита размера; True, если что-то удалено"""
+        with self.lock:
+            files = self.index["files"]
+            total = sum(info["size"] for info in files.values())
+            removed = False
+            for key, info in sorted(files.items(), key=lambda item: item[1]["used_at"]):
+                if total <= self.max_bytes:
+                    break
+                try:
+                    os.remove(self.path(key))
+                except OSError:
+                    pass
+                total -= info["size"]
+                del files[key]
+                removed = True
+                for uploads in self.index["uploads"].values():
+                    uploads.pop(key, None)
+                for url in [u for u, e in self.index["urls"].items() if e["key"] == key]:
+                    del self.index["urls"][url]
+            if removed:
+                self.save()
+            return removed
+    
+    def upload_id(self, platform, key):
+        """Идентификатор картинки, уже загруженной в соцсеть (file_id, photo{owner}_{id})"""
+        with self.lock:
+            return self.index["uploads"].get(platform, {}).get(key)
+    
+    def remember_upload_id(self, platform, key, upload_id):
+        """Сохранение идентификатора после первой загрузки"""
+        with self.lock:
+            self.index["uploads"].setdefault(platform, {})[key] = upload_id
+            self.save()
+    
+    def upload_once(self, platform, key, upload):
+        """Идентификатор из кэша или результат upload(); параллельные вызовы ждут первую загрузку"""
+        upload_id = self.upload_id(platform, key)
+        if upload_id is not None:
+            return upload_id
+        with self.key_lock(f"{platform}:{key}"):
+            upload_id = self.upload_id(platform, key)
+            if upload_id is None:
+                upload_id = upload()
+                if upload_id is not None:
+                    self.remember_upload_id(platform, key, upload_id)
+            return upload_id
@@ -0,0 +1,266 @@
+"""
+Метрики в формате Prometheus и HTTP-эндпоинт /metrics без внешних зависимостей
+"""
+
+import math
+import time
+import threading
+from bisect import bisect_left
+from http.server import ThreadingHTTPServer, BaseHTTPRequestHandler
+from config import METRICS_HOST, METRICS_PORT
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+# Границы корзин гистограмм по умолчанию (сек)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+DETECTION_BUCKETS = (1, 5, 10, 20, 30, 60, 120, 300, 600, 1800)
+
+def escape_label(value):
+    """Экранирование значения метки"""
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def format_value(value):
+    """Число в текстовом формате Prometheus"""
+    if value == math.inf:
+        return "+Inf"
+    if value == -math.inf:
+        return "-Inf"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value)
+
+class Metric:
+    """Общая часть метрик: имя, описание и значения по наборам меток"""
+    
+    kind = "untyped"
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.values = {}
+        self.lock = threading.Lock()
+    
+    def label_string(self, labels, extra=()):
+        """Метки в виде {a="1",b="2"}"""
+        pairs = list(zip(self.labelnames, labels)) + list(extra)
+        if not pairs:
+            return ""
+        return "{" + ",".join(f'{name}="{escape_label(value)}"' for name, value in pairs) + "}"
+    
+    def samples(self):
+        """Строки значений метрики"""
+        with self.lock:
+            items = list(self.values.items())
+        return [f"{self.name}{self.label_string(labels)} {format_value(value)}" for labels, value in items]
+    
+    def render(self):
+        """Описание и значения метрики"""
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+        return lines + self.samples()
+
+class Counter(Metric):
+    """Монотонный счетчик"""
+    
+    kind = "counter"
+    
+    def inc(self, *labels, amount=1):
+        with self.lock:
+            self.values[labels] = self.values.get(labels, 0) + amount
+
+class Gauge(Metric):
+    """Текущее значение; может вычисляться функцией в момент сбора"""
+    
+    kind = "gauge"
+    
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.functions = {}
+    
+    def set(self, value, *labels):
+        with self.lock:
+            self.values[labels] = value
+    
+    def set_function(self, function, *labels):
+        """Значение считается только при запросе /metrics, опрос за него не платит"""
+        with self.lock:
+            self.functions[labels] = function
+    
+    def samples(self):
+        with self.lock:
+            functions = list(self.functions.items())
+        lines = super().samples()
+        for labels, function in functions:
+            try:
+                value = function()
+            except Exception:
+                continue
+            lines.append(f"{self.name}{self.label_string(labels)} {format_value(value)}")
+        return lines
+
+class Histogram(Metric):
+    """Гистограмма с фиксированными корзинами"""
+    
+    kind = "histogram"
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets)) + (math.inf,)
+    
+    def observe(self, value, *labels):
+        # Счетчики по корзинам не накопительные: накопление делается при сборе
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            state = self.values.get(labels)
+            if state is None:
+                state = self.values[labels] = [[0] * len(self.buckets), 0.0, 0]
+            state[0][index] += 1
+            state[1] += value
+            state[2] += 1
+    
+    def time(self, *labels):
+        """Контекстный менеджер для замера длительности блока"""
+        return Timer(self, labels)
+    
+    def samples(self):
+        with self.lock:
+            items = [(labels, (list(counts), total, count)) for labels, (counts, total, count) in self.values.items()]
+        lines = []
+        for labels, (counts, total, count) in items:
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                le = self.label_string(labels, [("le", format_value(float(bound)))])
+                lines.append(f"{self.name}_bucket{le} {cumulative}")
+            lines.append(f"{self.name}_sum{self.label_string(labels)} {format_value(total)}")
+            lines.append(f"{self.name}_count{self.label_string(labels)} {count}")
+        return lines
+
+class Timer:
+    """Замер длительности блока кода в гистограмму"""
+    
+    def __init__(self, histogram, labels):
+        self.histogram = histogram
+        self.labels = labels
+        self.started = None
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started, *self.labels)
+        return False
+
+class MetricsRegistry:
+    """Набор метрик, отдаваемых одним эндпоинтом"""
+    
+    def __init__(self):
+        self.metrics = {}
+        self.lock = threading.Lock()
+    
+    def register(self, metric):
+        with self.lock:
+            return self.metrics.setdefault(metric.name, metric)
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def gauge(self, name, documentation, labelnames=()):
+        return self.register(Gauge(name, documentation, labelnames))
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def render(self):
+        """Все метрики в текстовом формате Prometheus"""
+        with self.lock:
+            metrics = list(self.metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+REGISTRY = MetricsRegistry()
+
+POLL_CYCLE_SECONDS = REGISTRY.histogram(
+    "autoposter_poll_cycle_seconds", "Длительность цикла опроса Helix"
+)
+HTTP_REQUEST_SECONDS = REGISTRY.histogram(
+    "autoposter_http_request_seconds", "Длительность HTTP-запросов к API",
+    ("platform", "endpoint")
+)
+HTTP_RESPONSES = REGISTRY.counter(
+    "autoposter_http_responses_total", "Ответы API по кодам состояния",
+    ("platform", "endpoint", "code")
+)
+RATE_LIMIT_HEADROOM = REGISTRY.gauge(
+    "autoposter_rate_limit_headroom_ratio", "Доля свободной квоты запросов платформы",
+    ("platform",)
+)
+OUTBOX_DEPTH = REGISTRY.gauge(
+    "autoposter_outbox_depth", "Число недоставленных постов в очереди"
+)
+DETECTION_SECONDS = REGISTRY.histogram(
+    "autoposter_golive_detection_seconds", "Задержка обнаружения начала стрима",
+    buckets=DETECTION_BUCKETS
+)
+CIRCUIT_STATE = REGISTRY.gauge(
+    "autoposter_circuit_state", "Состояние контура метода API: 0 - closed, 1 - half_open, 2 - open",
+    ("platform", "endpoint")
+)
+PARKED_WORK = REGISTRY.gauge(
+    "autoposter_parked_work", "Работа, отложенная до восстановления недоступных платформ"
+)
+PIPELINE_DEPTH = REGISTRY.gauge(
+    "autoposter_pipeline_queue_depth", "Элементы в очереди стадии конвейера (в памяти и на диске)",
+    ("stage",)
+)
+PIPELINE_DROPPED = REGISTRY.counter(
+    "autoposter_pipeline_dropped_total", "Элементы, выброшенные из переполненной очереди стадии",
+    ("queue",)
+)
+LOG_DROPPED = REGISTRY.counter(
+    "autoposter_log_dropped_total", "Записи лога, выброшенные при переполнении очереди"
+)
+
+class MetricsRequestHandler(BaseHTTPRequestHandler):
+    """Отдача метрик по GET /metrics"""
+    
+    def do_GET(self):
+        if self.path.split("?", 1)[0] != "/metrics":
+            self.send_error(404)
+            return
+        body = self.server.registry.render().encode('utf-8')
+        self.send_response(200)
+        self.send_header("Content-Type", CONTENT_TYPE)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+    
+    def log_message(self, format, *args):
+        pass
+
+class MetricsServer:
+    """HTTP-сервер эндпоинта /metrics в фоновом потоке"""
+    
+    def __init__(self, registry=REGISTRY, host=METRICS_HOST, port=METRICS_PORT):
+        self.server = ThreadingHTTPServer((host, port), MetricsRequestHandler)
+        self.server.daemon_threads = True
+        self.server.registry = registry
+        self.thread = None
+    
+    @property
+    def port(self):
+        """Фактический порт сервера"""
+        return self.server.server_port
+    
+    def start(self):
+        """Запуск сервера в фоновом потоке"""
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+    
+    def stop(self):
+        """Остановка сервера"""
+        self.server.shutdown()
+        self.server.server_close()
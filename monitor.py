@@ -7,16 +7,12 @@ import time
 import logging
 from datetime import datetime
 from main import TwitchAutoPoster
+from metrics import POLL_CYCLE_SECONDS
+from log_pipeline import setup_logging
+from config import TWITCH_STREAMER_LOGIN, TELEGRAM_CHANNEL_ID, VK_GROUP_IDS, EVENTSUB_ENABLED
 
-# Настройка логирования
-logging.basicConfig(
-    level=logging.INFO,
-    format='%(asctime)s - %(levelname)s - %(message)s',
-    handlers=[
-        logging.FileHandler('autoposter.log', encoding='utf-8'),
-        logging.StreamHandler()
-    ]
-)
+# Настройка логирования: запись в файл и консоль идет в отдельном потоке
+setup_logging()
 
 logger = logging.getLogger(__name__)
 
@@ -46,26 +42,33 @@ class MonitoredAutoPoster(TwitchAutoPoster):
     def post_to_socials(self, stream_info):
         """Постинг в соцсети с логированием"""
         logger.info(f"📝 Постинг информации о стриме: {stream_info.get('title', 'Без названия')}")
-        super().post_to_socials(stream_info)
+        return super().post_to_socials(stream_info)
     
-    def post_to_telegram(self, message):
+    def post_to_telegram(self, message, chat_id=None):
         """Постинг в Telegram с логированием"""
-        logger.info("📱 Отправка поста в Telegram...")
-        super().post_to_telegram(message)
+        logger.info(f"📱 Отправка поста в Telegram{f' (чат {chat_id})' if chat_id else ''}...")
+        return super().post_to_telegram(message, chat_id=chat_id)
     
-    def post_to_vk(self, message):
+    def post_to_vk(self, message, group_id=None, attachments=None):
         """Постинг в VK с логированием"""
-        logger.info("🌐 Отправка поста в VK...")
-        super().post_to_vk(message)
+        logger.info(f"🌐 Отправка поста в VK{f' (группа {group_id})' if group_id else ''}...")
+        return super().post_to_vk(message, group_id=group_id, attachments=attachments)
     
     def run(self):
         """Основной цикл с расширенным логированием"""
         logger.info("🚀 Запуск Twitch AutoPoster с мониторингом...")
-        logger.info(f"📺 Мониторинг канала: {TWITCH_STREAMER_LOGIN}")
+        if self.multi_channel:
+            logger.info(f"📺 Мониторинг каналов: {len(self.logins) + len(self.user_ids)}")
+        else:
+            logger.info(f"📺 Мониторинг канала: {TWITCH_STREAMER_LOGIN}")
         logger.info(f"📱 Telegram канал: {TELEGRAM_CHANNEL_ID}")
-        logger.info(f"🌐 VK группа: {VK_GROUP_ID if VK_GROUP_ID else 'Не настроена'}")
+        logger.info(f"🌐 VK группы: {', '.join(VK_GROUP_IDS) if VK_GROUP_IDS else 'Не настроены'}")
         logger.info("=" * 50)
         
+        self.start_services()
+        if EVENTSUB_ENABLED and self.start_eventsub():
+            logger.info(f"📡 EventSub включен, запасной опрос раз в {self.poll_interval} сек")
+        
         start_time = datetime.now()
         check_count = 0
         
@@ -77,20 +80,25 @@ class MonitoredAutoPoster(TwitchAutoPoster):
                 
                 logger.info(f"🔍 Проверка #{check_count} (Uptime: {uptime})")
                 
-                self.check_stream_status()
+                with POLL_CYCLE_SECONDS.time():
+                    self.check_stream_status()
+                if self.scheduler:
+                    # История опроса сохраняется по таймеру, а не только при остановке
+                    self.scheduler.flush()
                 
                 # Логируем статистику каждые 10 проверок
                 if check_count % 10 == 0:
                     logger.info(f"📊 Статистика: {check_count} проверок, Uptime: {uptime}")
                 
-                time.sleep(60)  # Проверяем каждую минуту
+                time.sleep(self.poll_interval)
                 
             except KeyboardInterrupt:
                 logger.info("🛑 Остановка программы по запросу пользователя...")
+                self.stop()
                 break
             except Exception as e:
                 logger.error(f"❌ Неожиданная ошибка: {e}", exc_info=True)
-                time.sleep(60)
+                time.sleep(self.poll_interval)
         
         logger.info(f"🏁 Программа остановлена. Всего проверок: {check_count}")
 
@@ -0,0 +1,262 @@
+"""
+Надежная очередь постов в SQLite (WAL) с идемпотентной доставкой
+"""
+
+import json
+import time
+import random
+import sqlite3
+import threading
+import logging
+from functools import partial
+from config import (
+    OUTBOX_PATH, OUTBOX_MAX_ATTEMPTS, OUTBOX_BACKOFF_BASE, OUTBOX_BACKOFF_MAX
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько секунд запись "в отправке" принадлежит воркеру; после падения процесса
+# она снова станет доступной
+SEND_LEASE = 120
+# Как часто продлевать аренду, пока идет долгая доставка (рассылка по многим чатам)
+LEASE_RENEW_INTERVAL = SEND_LEASE / 4
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    stream_id TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL,
+    UNIQUE (stream_id, destination)
+);
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+"""
+
+class Outbox:
+    """Очередь постов: ключ (stream_id, destination) исключает повторную публикацию"""
+    
+    def __init__(self, path=OUTBOX_PATH, max_attempts=OUTBOX_MAX_ATTEMPTS,
+                 backoff_base=OUTBOX_BACKOFF_BASE, backoff_max=OUTBOX_BACKOFF_MAX):
+        self.path = path
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+        
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        # В режиме WAL NORMAL не теряет целостность, а запись не ждет fsync
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.executescript(SCHEMA)
+        # Отложенные записи ждали восстановления платформы в прошлом запуске
+        self.conn.execute("UPDATE outbox SET status = 'pending' WHERE status = 'parked'")
+    
+    def enqueue(self, stream_id, destinations):
+        """Постановка поста в очередь; destinations - {назначение: payload}"""
+        now = time.time()
+        rows = [
+            (str(stream_id), destination, json.dumps(payload, ensure_ascii=False), now, now)
+            for destination, payload in destinations.items()
+        ]
+        with self.lock:
+            before = self.conn.total_changes
+            self.conn.execute("BEGIN")
+            try:
+                self.conn.executemany(
+                    "INSERT OR IGNORE INTO outbox "
+                    "(stream_id, destination, payload, next_attempt_at, created_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    rows
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                # Иначе соединение останется в открытой транзакции и очередь перестанет работать
+                self.conn.execute("ROLLBACK")
+                raise
+            added = self.conn.total_changes - before
+        if added:
+            self.wakeup.set()
+        return added
+    
+    def claim(self, limit=10):
+        """Выборка готовых к отправке записей с арендой на время отправки"""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    "SELECT id, stream_id, destination, payload, attempts FROM outbox "
+                    "WHERE status IN ('pending', 'sending') AND next_attempt_at <= ? "
+                    "ORDER BY next_attempt_at LIMIT ?",
+                    (now, limit)
+                ).fetchall()
+                self.conn.executemany(
+                    "UPDATE outbox SET status = 'sending', next_attempt_at = ? WHERE id = ?",
+                    [(now + SEND_LEASE, row[0]) for row in rows]
+                )
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return [
+            {
+                "id": row[0],
+                "stream_id": row[1],
+                "destination": row[2],
+                "payload": json.loads(row[3]),
+                "attempts": row[4]
+            }
+            for row in rows
+        ]
+    
+    def renew(self, stream_id, destination):
+        """Продление аренды записи, которая еще отправляется"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE outbox SET next_attempt_at = ? "
+                "WHERE stream_id = ? AND destination = ? AND status = 'sending'",
+                (time.time() + SEND_LEASE, str(stream_id), destination)
+            )
+    
+    def mark_sent(self, item_id):
+        """Запись доставлена"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+                (time.time(), item_id)
+            )
+    
+    def park(self, item_id):
+        """Запись отложена до восстановления назначения; попытка не засчитывается"""
+        with self.lock:
+            self.conn.execute("UPDATE outbox SET status = 'parked' WHERE id = ?", (item_id,))
+    
+    def unpark(self, item_id):
+        """Отложенная запись снова готова к отправке"""
+        with self.lock:
+            self.conn.execute(
+                "UPDATE outbox SET status = 'pending', next_attempt_at = ? "
+                "WHERE id = ? AND status = 'parked'",
+                (time.time(), item_id)
+            )
+        self.wakeup.set()
+    
+    def mark_failed(self, item, error):
+        """Неудачная попытка: экспоненциальная пауза с джиттером или окончательный отказ"""
+        attempts = item["attempts"] + 1
+        if attempts >= self.max_attempts:
+            status, next_attempt_at = 'failed', time.time()
+        else:
+            delay = min(self.backoff_base * 2 ** (attempts - 1), self.backoff_max)
+            status, next_attempt_at = 'pending', time.time() + delay * random.uniform(0.5, 1)
+        with self.lock:
+            self.conn.execute(
+                "UPDATE outbox SET status = ?, attempts = ?, next_attempt_at = ?, last_error = ? "
+                "WHERE id = ?",
+                (status, attempts, next_attempt_at, str(error)[:500], item["id"])
+            )
+        return status
+    
+    def depth(self):
+        """Число недоставленных записей"""
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM outbox WHERE status IN ('pending', 'sending', 'parked')"
+            ).fetchone()[0]
+    
+    def close(self):
+        """Закрытие базы"""
+        with self.lock:
+            self.conn.close()
+
+class OutboxWorker(threading.Thread):
+    """Фоновая доставка постов из очереди"""
+    
+    def __init__(self, outbox, deliver, idle_interval=1.0, parking=None, batches=None, claim_limit=10):
+        super().__init__(daemon=True)
+        self.outbox = outbox
+        self.deliver = deliver
+        self.idle_interval = idle_interval
+        self.parking = parking
+        # Пакетная доставка по платформам: {платформа: функция([(назначение, payload)]) -> [успех]}
+        self.batches = batches or {}
+        self.claim_limit = claim_limit
+        self.stopped = threading.Event()
+    
+    def run(self):
+        """Цикл разбора очереди"""
+        while not self.stopped.is_set():
+            self.outbox.wakeup.clear()
+            items = self.outbox.claim(self.claim_limit)
+            if not items:
+                self.outbox.wakeup.wait(self.idle_interval)
+                continue
+            grouped = {}
+            for item in items:
+                platform = self.platform(item)
+                if self.park(item, platform):
+                    continue
+                if platform in self.batches:
+                    grouped.setdefault(platform, []).append(item)
+                else:
+                    self.process(item)
+            for platform, batch in grouped.items():
+                self.process_batch(platform, batch)
+    
+    @staticmethod
+    def platform(item):
+        """Платформа назначения записи"""
+        return item["destination"].split(":", 1)[0]
+    
+    def park(self, item, platform):
+        """Назначение недоступно: запись ждет без попыток и соединений"""
+        if not self.parking or not self.parking.blocked(platform):
+            return False
+        self.outbox.park(item["id"])
+        self.parking.park(platform, partial(self.outbox.unpark, item["id"]))
+        return True
+    
+    def process(self, item):
+        """Доставка одной записи"""
+        if self.park(item, self.platform(item)):
+            return
+        try:
+            delivered = self.deliver(item["destination"], item["payload"])
+            error = "доставка не удалась"
+        except Exception as e:
+            delivered, error = False, e
+        self.finish(item, delivered, error)
+    
+    def process_batch(self, platform, items):
+        """Доставка записей одной платформы одним пакетом; результат - у каждой записи свой"""
+        if len(items) == 1:
+            self.process(items[0])
+            return
+        try:
+            results = self.batches[platform]([(item["destination"], item["payload"]) for item in items])
+            error = "доставка не удалась"
+        except Exception as e:
+            results, error = [False] * len(items), e
+        for item, delivered in zip(items, results):
+            self.finish(item, delivered, error)
+    
+    def finish(self, item, delivered, error):
+        """Учет результата доставки записи"""
+        if delivered:
+            self.outbox.mark_sent(item["id"])
+        elif self.outbox.mark_failed(item, error) == 'failed':
+            logger.error(f"❌ Пост {item['stream_id']} в {item['destination']} не доставлен: {error}",
+                         extra={"stream_id": item["stream_id"], "destination": item["destination"]})
+    
+    def stop(self):
+        """Остановка воркера"""
+        self.stopped.set()
+        self.outbox.wakeup.set()
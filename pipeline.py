@@ -0,0 +1,250 @@
+"""
+Конвейер обработки стримов: стадии со своими потоками, соединенные ограниченными очередями
+с политикой при переполнении (block, drop_oldest, spill на диск)
+"""
+
+import json
+import sqlite3
+import logging
+import threading
+from collections import deque
+from config import PIPELINE_SPILL_PATH
+from metrics import PIPELINE_DEPTH, PIPELINE_DROPPED
+
+logger = logging.getLogger(__name__)
+
+POLICIES = ("block", "drop_oldest", "spill")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS spill (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    queue TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    item TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS spill_queue ON spill (queue, position);
+"""
+
+class SpillStore:
+    """Вытесненные из памяти элементы очередей (SQLite); переживают перезапуск"""
+    
+    def __init__(self, path=PIPELINE_SPILL_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+    
+    def push(self, queue, item):
+        """Добавление в конец очереди: позиция больше всех имеющихся в ней"""
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO spill (queue, position, item) "
+                "VALUES (?, COALESCE((SELECT MAX(position) FROM spill WHERE queue = ?), 0) + 1, ?)",
+                (queue, queue, json.dumps(item, ensure_ascii=False))
+            )
+    
+    def pop(self, queue, limit):
+        """Самые старые элементы очереди; из базы они удаляются"""
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                rows = self.conn.execute(
+                    "SELECT id, item FROM spill WHERE queue = ? ORDER BY position LIMIT ?", (queue, limit)
+                ).fetchall()
+                self.conn.executemany("DELETE FROM spill WHERE id = ?", [(row_id,) for row_id, _ in rows])
+                self.conn.execute("COMMIT")
+            except Exception:
+                # Иначе соединение останется в открытой транзакции и очередь перестанет работать
+                self.conn.execute("ROLLBACK")
+                raise
+        return [json.loads(item) for _, item in rows]
+    
+    def unshift(self, queue, items):
+        """Возврат элементов в начало очереди: позиции меньше всех имеющихся в ней"""
+        if not items:
+            return
+        with self.lock:
+            first = self.conn.execute("SELECT MIN(position) FROM spill WHERE queue = ?", (queue,)).fetchone()[0]
+            start = (1 if first is None else first) - len(items)
+            self.conn.executemany(
+                "INSERT INTO spill (queue, position, item) VALUES (?, ?, ?)",
+                [(queue, start + index, json.dumps(item, ensure_ascii=False)) for index, item in enumerate(items)]
+            )
+    
+    def count(self, queue):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM spill WHERE queue = ?", (queue,)).fetchone()[0]
+    
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+class StageQueue:
+    """Ограниченная очередь стадии"""
+    
+    def __init__(self, name, maxsize, policy="block", spill=None):
+        if policy not in POLICIES:
+            raise ValueError(f"неизвестная политика очереди {name}: {policy}")
+        if policy == "spill" and spill is None:
+            raise ValueError(f"очереди {name} со spill нужна база для вытеснения")
+        self.name = name
+        self.maxsize = maxsize
+        self.policy = policy
+        self.spill = spill
+        self.items = deque()
+        self.condition = threading.Condition()
+        self.closed = False
+        # Элементы, оставшиеся на диске с прошлого запуска, обрабатываются первыми
+        self.spilled = spill.count(name) if policy == "spill" else 0
+    
+    def put(self, item):
+        """Постановка элемента; при block ждет места, при drop_oldest вытесняет самый старый"""
+        with self.condition:
+            if self.policy == "spill" and (self.spilled or len(self.items) >= self.maxsize):
+                # Пока на диске что-то есть, новые элементы идут туда же, чтобы не нарушить порядок
+                self.spill.push(self.name, item)
+                self.spilled += 1
+                self.condition.notify()
+                return
+            if self.policy == "block":
+                while len(self.items) >= self.maxsize and not self.closed:
+                    self.condition.wait()
+            elif len(self.items) >= self.maxsize:
+                self.items.popleft()
+                PIPELINE_DROPPED.inc(self.name)
+                logger.warning(f"⚠️ Очередь {self.name} переполнена, самый старый элемент выброшен")
+            self.items.append(item)
+            self.condition.notify_all()
+    
+    def get(self, timeout=1.0):
+        """Следующий элемент; None, если очередь закрыта и пуста или истекло ожидание"""
+        with self.condition:
+            # После закрытия вытесненное остается на диске до следующего запуска
+            if not self.items and self.spilled and not self.closed:
+                self.refill()
+            if not self.items:
+                if self.closed:
+                    return None
+                self.condition.wait(timeout)
+                if not self.items and self.spilled and not self.closed:
+                    self.refill()
+                if not self.items:
+                    return None
+            item = self.items.popleft()
+            self.condition.notify_all()
+            return item
+    
+    def refill(self):
+        """Подъем вытесненных элементов с диска в память"""
+        items = self.spill.pop(self.name, self.maxsize)
+        self.spilled = max(self.spilled - len(items), 0) if items else 0
+        self.items.extend(items)
+    
+    def depth(self):
+        """Элементов в памяти и на диске"""
+        with self.condition:
+            return len(self.items) + self.spilled
+    
+    def close(self):
+        """Закрытие; при spill не начатые элементы из памяти возвращаются на диск"""
+        with self.condition:
+            self.closed = True
+            if self.policy == "spill" and self.items:
+                self.spill.unshift(self.name, list(self.items))
+                self.spilled += len(self.items)
+                self.items.clear()
+            self.condition.notify_all()
+
+class Stage:
+    """Стадия: потоки-обработчики и очередь; с partition у каждого потока своя очередь,
+    и элементы с одним ключом обрабатываются по порядку одним потоком"""
+    
+    def __init__(self, name, handler, workers=1, queue_size=1000, policy="block", spill=None, partition=None):
+        self.name = name
+        self.handler = handler
+        self.partition = partition
+        workers = max(1, workers)
+        count = workers if partition else 1
+        self.queues = [
+            StageQueue(name if count == 1 else f"{name}:{index}", queue_size, policy, spill)
+            for index in range(count)
+        ]
+        self.workers = workers
+        self.threads = []
+        self.stopped = threading.Event()
+    
+    def submit(self, item):
+        """Передача элемента в стадию"""
+        queue = self.queues[0]
+        if self.partition:
+            queue = self.queues[hash(self.partition(item)) % len(self.queues)]
+        queue.put(item)
+    
+    def depth(self):
+        return sum(queue.depth() for queue in self.queues)
+    
+    def start(self):
+        for index in range(self.workers):
+            queue = self.queues[index % len(self.queues)]
+            thread = threading.Thread(target=self.work, args=(queue,), daemon=True,
+                                      name=f"{self.name}-{index}")
+            thread.start()
+            self.threads.append(thread)
+    
+    def work(self, queue):
+        """Цикл потока стадии; после остановки дорабатывает то, что осталось в памяти"""
+        while True:
+            item = queue.get()
+            if item is None:
+                if self.stopped.is_set():
+                    return
+                continue
+            try:
+                self.handler(item)
+            except Exception as e:
+                logger.error(f"❌ Ошибка стадии {self.name}: {e}", exc_info=True)
+    
+    def stop(self, timeout=5):
+        self.stopped.set()
+        for queue in self.queues:
+            queue.close()
+        for thread in self.threads:
+            thread.join(timeout=timeout)
+
+class Pipeline:
+    """Набор стадий; глубина каждой очереди видна в метриках, по ней ищется узкое место"""
+    
+    def __init__(self, spill=None):
+        self.spill = spill
+        self.stages = {}
+    
+    def add_stage(self, name, handler, workers=1, queue_size=1000, policy="block", partition=None):
+        if policy == "spill" and self.spill is None:
+            self.spill = SpillStore()
+        stage = Stage(name, handler, workers, queue_size, policy, self.spill, partition)
+        self.stages[name] = stage
+        PIPELINE_DEPTH.set_function(stage.depth, name)
+        return stage
+    
+    def submit(self, stage, item):
+        self.stages[stage].submit(item)
+    
+    def depths(self):
+        """Глубина очередей по стадиям"""
+        return {name: stage.depth() for name, stage in self.stages.items()}
+    
+    def summary(self):
+        return "🧵 Очереди: " + ", ".join(f"{name}={depth}" for name, depth in self.depths().items())
+    
+    def start(self):
+        for stage in self.stages.values():
+            stage.start()
+    
+    def stop(self):
+        """Остановка по порядку стадий: каждая дорабатывает то, что ей уже передано,
+        а очереди со spill сохраняют необработанное на диске"""
+        for stage in self.stages.values():
+            stage.stop()
+        if self.spill:
+            self.spill.close()
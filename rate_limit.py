@@ -0,0 +1,158 @@
+"""
+Общий регулятор частоты запросов с учетом квот Twitch, Telegram и VK
+"""
+
+import time
+import threading
+from urllib.parse import urlsplit
+from config import TWITCH_RATE_LIMIT, TELEGRAM_RATE_LIMIT, VK_RATE_LIMIT, RATE_LIMIT_MAX_WAIT
+
+# Лимиты платформ: (запросов в секунду, размер всплеска)
+PLATFORM_LIMITS = {
+    "twitch": (TWITCH_RATE_LIMIT / 60, TWITCH_RATE_LIMIT),
+    "telegram": (TELEGRAM_RATE_LIMIT, TELEGRAM_RATE_LIMIT),
+    "vk": (VK_RATE_LIMIT, VK_RATE_LIMIT)
+}
+
+# Лимиты отдельных методов; для остальных методов работают только паузы от сервера
+ENDPOINT_LIMITS = {}
+
+# Код ошибки VK "слишком много запросов в секунду"
+VK_TOO_MANY_REQUESTS = 6
+
+def endpoint_name(url):
+    """Имя метода API по адресу запроса"""
+    return urlsplit(url).path.rstrip("/").rsplit("/", 1)[-1]
+
+class TokenBucket:
+    """Корзина токенов с паузами по сигналам сервера"""
+    
+    def __init__(self, rate=None, capacity=None):
+        self.rate = rate
+        self.capacity = capacity or rate or 1
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+        self.paused_until = 0
+    
+    def refill(self, now):
+        """Пополнение токенов за прошедшее время"""
+        if self.rate:
+            self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+    
+    def reserve(self, now):
+        """Резерв токена; возвращает, сколько ждать до его появления"""
+        self.refill(now)
+        wait = max(self.paused_until - now, 0)
+        if self.rate:
+            # Уход в минус ставит следующие запросы в очередь за текущим
+            self.tokens -= 1
+            if self.tokens < 0:
+                wait = max(wait, -self.tokens / self.rate)
+        return wait
+    
+    def pause(self, seconds):
+        """Пауза по требованию сервера"""
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+    
+    def sync(self, remaining, reset_in):
+        """Синхронизация с остатком квоты, сообщенным сервером"""
+        self.refill(time.monotonic())
+        self.tokens = min(self.tokens, remaining)
+        if remaining <= 0:
+            self.pause(reset_in)
+    
+    @property
+    def headroom(self):
+        """Доля свободной квоты (0..1)"""
+        self.refill(time.monotonic())
+        return max(self.tokens, 0) / self.capacity
+
+class RateLimitGovernor:
+    """Корзины токенов по платформам и методам, общие для всех исходящих запросов"""
+    
+    def __init__(self, platform_limits=PLATFORM_LIMITS, endpoint_limits=ENDPOINT_LIMITS,
+                 max_wait=RATE_LIMIT_MAX_WAIT):
+        self.platform_limits = platform_limits
+        self.endpoint_limits = endpoint_limits
+        self.max_wait = max_wait
+        self.buckets = {}
+        self.lock = threading.Lock()
+    
+    def bucket(self, platform, endpoint=None):
+        """Корзина платформы (endpoint=None) или метода"""
+        key = (platform, endpoint)
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            if endpoint is None:
+                limits = self.platform_limits.get(platform, (None, None))
+            else:
+                limits = self.endpoint_limits.get(key, (None, None))
+            bucket = self.buckets[key] = TokenBucket(*limits)
+        return bucket
+    
+    def reserve(self, platform, endpoint):
+        """Резерв места в квоте без ожидания; возвращает, сколько ждать перед запросом"""
+        with self.lock:
+            now = time.monotonic()
+            return max(
+                self.bucket(platform).reserve(now),
+                self.bucket(platform, endpoint).reserve(now)
+            )
+    
+    def acquire(self, platform, endpoint):
+        """Ожидание разрешения на запрос"""
+        wait = self.reserve(platform, endpoint)
+        if wait > 0:
+            time.sleep(wait)
+        return wait
+    
+    def observe(self, platform, endpoint, response):
+        """Учет ответа; возвращает True, если запрос стоит повторить после паузы"""
+        handler = getattr(self, f"observe_{platform}", None)
+        if handler is None:
+            return False
+        retry_after = handler(endpoint, response)
+        return retry_after is not None and retry_after <= self.max_wait
+    
+    def observe_twitch(self, endpoint, response):
+        """Helix: заголовки Ratelimit-Remaining/Ratelimit-Reset"""
+        remaining = response.headers.get("Ratelimit-Remaining")
+        reset = response.headers.get("Ratelimit-Reset")
+        if remaining is None or reset is None:
+            return None
+        reset_in = max(float(reset) - time.time(), 0)
+        with self.lock:
+            self.bucket("twitch").sync(int(remaining), reset_in)
+        return reset_in if response.status_code == 429 else None
+    
+    def observe_telegram(self, endpoint, response):
+        """Telegram: 429 с parameters.retry_after"""
+        if response.status_code != 429:
+            return None
+        try:
+            retry_after = response.json().get("parameters", {}).get("retry_after", 1)
+        except ValueError:
+            retry_after = 1
+        with self.lock:
+            self.bucket("telegram", endpoint).pause(retry_after)
+        return retry_after
+    
+    def observe_vk(self, endpoint, response):
+        """VK: ошибка 6 "слишком много запросов в секунду" внутри ответа 200"""
+        if response.status_code != 200:
+            return None
+        try:
+            error = response.json().get("error")
+        except ValueError:
+            return None
+        if not error or error.get("error_code") != VK_TOO_MANY_REQUESTS:
+            return None
+        with self.lock:
+            self.bucket("vk").pause(1)
+        return 1
+    
+    def headroom(self, platform):
+        """Доля свободной квоты платформы"""
+        with self.lock:
+            return self.bucket(platform).headroom
@@ -0,0 +1,281 @@
+"""
+Подготовка текстов постов: шаблоны разбираются один раз, для каждой платформы
+свой рендерер с нужным экранированием и лимитом длины
+"""
+
+import os
+import re
+import html
+import json
+import threading
+from string import Formatter
+from collections import OrderedDict
+from config import (
+    STREAM_MESSAGE_TEMPLATE, MESSAGE_TEMPLATES_PATH, TELEGRAM_PARSE_MODE, RENDER_CACHE_SIZE
+)
+
+# Шаблоны по умолчанию; строки с игрой и зрителями добавляются, только если значение есть
+DEFAULT_TEMPLATES = {
+    "message": STREAM_MESSAGE_TEMPLATE,
+    "game": "\n🎮 Игра: {game}",
+    "viewers": "\n👥 Зрители: {viewers}"
+}
+OPTIONAL_LINES = ("game", "viewers")
+
+ANY = "*"
+
+def utf16_len(text):
+    """Длина в единицах UTF-16, как ее считает Telegram"""
+    return len(text.encode('utf-16-le')) // 2
+
+def truncate_utf16(text, limit):
+    """Обрезка до limit единиц UTF-16 без разрыва суррогатных пар"""
+    units = 0
+    for index, char in enumerate(text):
+        units += 2 if ord(char) > 0xFFFF else 1
+        if units > limit:
+            return text[:index]
+    return text
+
+class CompiledTemplate:
+    """Шаблон, разобранный один раз; литералы уже экранированы под платформу"""
+    
+    def __init__(self, text, escape):
+        self.parts = [
+            (escape(literal), field, spec, conversion)
+            for literal, field, spec, conversion in Formatter().parse(text)
+        ]
+    
+    def render(self, values, escape):
+        """Подстановка значений с экранированием"""
+        chunks = []
+        for literal, field, spec, conversion in self.parts:
+            chunks.append(literal)
+            if field is None:
+                continue
+            value = values[field]
+            if conversion == "r":
+                value = repr(value)
+            elif conversion == "a":
+                value = ascii(value)
+            chunks.append(escape(format(value, spec or "")))
+        return "".join(chunks)
+
+class Renderer:
+    """Простой текст без разметки"""
+    
+    name = "plain"
+    limit = None
+    caption_limit = None
+    
+    def __init__(self):
+        self.compiled = {}
+        self.lock = threading.Lock()
+    
+    def escape(self, text):
+        return text
+    
+    def length(self, text):
+        return len(text)
+    
+    def cut(self, text, limit):
+        """Обрезка готового (экранированного) текста"""
+        return text[:limit]
+    
+    def shorten(self, text, limit):
+        """Обрезка исходного текста до экранирования: разметку в нем не ищем"""
+        return text[:limit]
+    
+    def compile(self, text):
+        """Компиляция шаблона с запоминанием"""
+        template = self.compiled.get(text)
+        if template is None:
+            with self.lock:
+                template = self.compiled[text] = CompiledTemplate(text, self.escape)
+        return template
+    
+    def render_parts(self, templates, values):
+        """Сборка сообщения из основной части и необязательных строк"""
+        message = self.compile(templates["message"]).render(values, self.escape)
+        for line in OPTIONAL_LINES:
+            if values.get(line):
+                message += self.compile(templates[line]).render(values, self.escape)
+        return message
+    
+    def render(self, templates, values, limit=None):
+        """Готовый текст в пределах лимита платформы"""
+        limit = limit or self.limit
+        message = self.render_parts(templates, values)
+        if limit is None or self.length(message) <= limit:
+            return message
+        
+        # Сначала укорачиваем название стрима, чтобы не резать разметку и ссылку;
+        # экранирование удлиняет текст, поэтому длину подбираем пропорционально
+        title = values.get("title") or ""
+        keep = self.length(title)
+        for _ in range(5):
+            overflow = self.length(message) - limit
+            if overflow <= 0 or not keep:
+                break
+            escaped = self.length(self.escape(title[:keep])) or 1
+            keep = max(int(keep * (escaped - overflow - 1) / escaped), 0)
+            title_cut = self.shorten(title, keep) + "…"
+            message = self.render_parts(templates, dict(values, title=title_cut))
+        if self.length(message) > limit:
+            message = self.cut(message, limit - 1) + "…"
+        return message
+
+class TelegramHTMLRenderer(Renderer):
+    """Telegram, parse_mode=HTML"""
+    
+    name = "telegram_html"
+    parse_mode = "HTML"
+    limit = 4096
+    caption_limit = 1024
+    
+    def escape(self, text):
+        return html.escape(text, quote=False)
+    
+    def length(self, text):
+        return utf16_len(text)
+    
+    def cut(self, text, limit):
+        # Не оставляем половину сущности вроде &am
+        return re.sub(r"&[^;\s]*$", "", truncate_utf16(text, limit))
+    
+    def shorten(self, text, limit):
+        return truncate_utf16(text, limit)
+
+class TelegramMarkdownV2Renderer(Renderer):
+    """Telegram, parse_mode=MarkdownV2"""
+    
+    name = "telegram_markdown_v2"
+    parse_mode = "MarkdownV2"
+    limit = 4096
+    caption_limit = 1024
+    special = re.compile(r"([_*\[\]()~`>#+\-=|{}.!\\])")
+    
+    def escape(self, text):
+        return self.special.sub(r"\\\1", text)
+    
+    def length(self, text):
+        return utf16_len(text)
+    
+    def cut(self, text, limit):
+        text = truncate_utf16(text, limit)
+        # Одиночный обратный слэш в конце экранировал бы следующий символ
+        if (len(text) - len(text.rstrip("\\"))) % 2:
+            text = text[:-1]
+        return text
+    
+    def shorten(self, text, limit):
+        return truncate_utf16(text, limit)
+
+class VKRenderer(Renderer):
+    """VK wall.post: простой текст"""
+    
+    name = "vk"
+    limit = 16384
+
+TELEGRAM_RENDERERS = {
+    "HTML": TelegramHTMLRenderer,
+    "MarkdownV2": TelegramMarkdownV2Renderer
+}
+
+class TemplateRegistry:
+    """Шаблоны по каналам и языкам: канал+язык, канал, язык, по умолчанию"""
+    
+    def __init__(self, path=MESSAGE_TEMPLATES_PATH):
+        self.templates = {(ANY, ANY): dict(DEFAULT_TEMPLATES)}
+        if path and os.path.exists(path):
+            self.load(path)
+    
+    def load(self, path):
+        """Загрузка файла вида {канал|*: {язык|*: шаблон или {message, game, viewers}}}"""
+        with open(path, encoding='utf-8') as f:
+            data = json.load(f)
+        for channel, locales in data.items():
+            for locale, templates in locales.items():
+                self.set(channel, locale, templates)
+    
+    def set(self, channel, locale, templates):
+        """Шаблон для канала и языка"""
+        if isinstance(templates, str):
+            templates = {"message": templates}
+        self.templates[(channel.lower(), locale.lower())] = dict(DEFAULT_TEMPLATES, **templates)
+    
+    def replace_channel(self, channel, locales):
+        """Замена всех шаблонов канала на {язык: шаблон}"""
+        channel = channel.lower()
+        for key in [key for key in self.templates if key[0] == channel]:
+            del self.templates[key]
+        for locale, templates in (locales or {}).items():
+            self.set(channel, locale, templates)
+    
+    def lookup(self, channel, locale):
+        """Ключ и набор шаблонов для канала и языка"""
+        channel = (channel or ANY).lower()
+        locale = (locale or ANY).lower()
+        for key in ((channel, locale), (channel, ANY), (ANY, locale), (ANY, ANY)):
+            templates = self.templates.get(key)
+            if templates is not None:
+                return key, templates
+
+class MessageRenderer:
+    """Рендеринг поста для назначений с кэшем: одна отрисовка на формат и событие"""
+    
+    def __init__(self, registry=None, parse_mode=TELEGRAM_PARSE_MODE, cache_size=RENDER_CACHE_SIZE):
+        self.registry = registry or TemplateRegistry()
+        self.renderers = {
+            "telegram": TELEGRAM_RENDERERS.get(parse_mode, TelegramHTMLRenderer)(),
+            "vk": VKRenderer()
+        }
+        self.plain = Renderer()
+        self.cache_size = cache_size
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+    
+    def clear_cache(self):
+        """Сброс готовых текстов после смены шаблонов"""
+        with self.lock:
+            self.cache.clear()
+    
+    def renderer_for(self, destination):
+        """Рендерер назначения"""
+        return self.renderers.get(destination, self.plain)
+    
+    @staticmethod
+    def values(stream_info):
+        """Значения для подстановки из данных стрима"""
+        login = stream_info.get("user_login") or ""
+        return {
+            "streamer": stream_info.get("user_name") or login,
+            "login": login,
+            "title": stream_info.get("title") or "",
+            "url": f"https://twitch.tv/{login}",
+            "game": stream_info.get("game_name") or "",
+            "viewers": stream_info.get("viewer_count") or ""
+        }
+    
+    def render(self, stream_info, destination, values=None, caption=False):
+        """Текст поста для назначения; caption=True - подпись к фото с меньшим лимитом"""
+        renderer = self.renderer_for(destination)
+        values = values or self.values(stream_info)
+        limit = renderer.caption_limit if caption else renderer.limit
+        template_key, templates = self.registry.lookup(
+            stream_info.get("user_login"), stream_info.get("language")
+        )
+        cache_key = (renderer.name, limit, template_key, tuple(sorted(values.items())))
+        
+        with self.lock:
+            message = self.cache.get(cache_key)
+            if message is not None:
+                self.cache.move_to_end(cache_key)
+                return message
+        
+        message = renderer.render(templates, values, limit)
+        with self.lock:
+            self.cache[cache_key] = message
+            if len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return message
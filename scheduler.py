@@ -0,0 +1,184 @@
+"""
+Адаптивный планировщик опроса: чаще около привычного времени начала стрима,
+реже в "мертвые" часы и во время идущего стрима
+"""
+
+import os
+import json
+import time
+import random
+import logging
+from datetime import datetime, timezone
+from channel_state import ChannelStateTable
+from config import (
+    POLL_INTERVAL, POLL_MIN_INTERVAL, POLL_MAX_INTERVAL, POLL_LIVE_INTERVAL,
+    POLL_JITTER, POLL_HISTORY_PATH, POLL_HISTORY_SAVE_INTERVAL
+)
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 7 * 24
+# Старые начала стримов постепенно теряют вес
+HISTORY_DECAY = 0.97
+# Пока история короче, каналу назначается обычный интервал
+MIN_HISTORY = 3
+
+def hour_of_week(timestamp):
+    """Номер часа недели (0-167) в UTC"""
+    moment = datetime.fromtimestamp(timestamp, timezone.utc)
+    return moment.weekday() * 24 + moment.hour
+
+def parse_started_at(value):
+    """Время начала стрима из поля started_at Helix/EventSub"""
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00")).timestamp()
+    except ValueError:
+        return None
+
+class AdaptivePollScheduler:
+    """Расписание опроса каналов на основе истории начала стримов; время следующего опроса
+    и статус канала берутся из колонок таблицы состояния, отдельной копии у расписания нет"""
+    
+    def __init__(self, min_interval=POLL_MIN_INTERVAL, max_interval=POLL_MAX_INTERVAL,
+                 live_interval=POLL_LIVE_INTERVAL, jitter=POLL_JITTER,
+                 history_path=POLL_HISTORY_PATH, save_interval=POLL_HISTORY_SAVE_INTERVAL, states=None):
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.live_interval = live_interval
+        self.jitter = jitter
+        self.history_path = history_path
+        self.save_interval = save_interval
+        self.dirty = False
+        self.saved_at = time.monotonic()
+        self.history = {}
+        self.peaks = {}
+        self.states = states if states is not None else ChannelStateTable()
+        self.intervals = {}
+        self.load()
+    
+    @classmethod
+    def fixed(cls, interval=POLL_INTERVAL, states=None):
+        """Расписание без адаптации: все каналы раз в interval, если не задан свой интервал"""
+        return cls(min_interval=interval, max_interval=interval, live_interval=interval,
+                   jitter=0, history_path=None, states=states)
+    
+    def load(self):
+        """Загрузка истории начала стримов"""
+        if not self.history_path or not os.path.exists(self.history_path):
+            return
+        try:
+            with open(self.history_path, encoding='utf-8') as f:
+                self.history = json.load(f)
+        except (OSError, ValueError):
+            self.history = {}
+    
+    def flush(self, force=False):
+        """Сохранение измененной истории не чаще раза в save_interval; force - при остановке"""
+        if not self.dirty:
+            return
+        now = time.monotonic()
+        if force or now - self.saved_at >= self.save_interval:
+            self.dirty = False
+            self.saved_at = now
+            self.save()
+    
+    def save(self):
+        """Атомарное сохранение истории"""
+        if not self.history_path:
+            return
+        tmp_path = f"{self.history_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                # Копия: запись идет вне блокировок, а начала стримов могут учитываться параллельно
+                json.dump(dict(self.history), f)
+            os.replace(tmp_path, self.history_path)
+        except OSError as e:
+            logger.warning(f"⚠️ Не удалось сохранить историю стримов: {e}")
+    
+    def add_channel(self, key, now=None):
+        """Добавление канала: первый опрос сразу, а после перезапуска - по прежнему расписанию"""
+        # Строка из снимка получает ключ только здесь: без него due() ее не видит
+        row = self.states.add(key)
+        if not self.states.next_poll[row]:
+            self.states.set_next_poll(key, now or time.time())
+    
+    def remove_channel(self, key):
+        """Удаление канала из расписания (история сохраняется)"""
+        if key in self.states:
+            self.states.set_next_poll(key, 0.0)
+        self.intervals.pop(key, None)
+    
+    def set_interval(self, key, interval):
+        """Собственный интервал опроса канала вне стрима; None - по истории"""
+        if interval:
+            self.intervals[key] = interval
+        else:
+            self.intervals.pop(key, None)
+    
+    def record_start(self, key, started_at=None):
+        """Начало стрима пополняет историю; сам статус канала хранит таблица состояния"""
+        buckets = self.history.get(key) or [0.0] * HOURS_PER_WEEK
+        buckets = [weight * HISTORY_DECAY for weight in buckets]
+        buckets[hour_of_week(parse_started_at(started_at) or time.time())] += 1.0
+        self.history[key] = buckets
+        self.peaks.pop(key, None)
+        # Файл перезаписывается целиком, поэтому не на каждое начало стрима, а по flush()
+        self.dirty = True
+    
+    def score(self, key, timestamp):
+        """Вероятность начала стрима в этот час относительно самого "горячего" часа (0..1)"""
+        buckets = self.history.get(key)
+        if not buckets:
+            return None
+        # Сумма весов после N стартов не меньше N * DECAY^N
+        if sum(buckets) < MIN_HISTORY * HISTORY_DECAY ** MIN_HISTORY:
+            return None
+        
+        # Соседние часы тоже учитываем: стримы начинаются то раньше, то позже
+        def smoothed(hour):
+            return (buckets[hour]
+                    + 0.5 * buckets[(hour - 1) % HOURS_PER_WEEK]
+                    + 0.5 * buckets[(hour + 1) % HOURS_PER_WEEK])
+        
+        peak = self.peaks.get(key)
+        if peak is None:
+            peak = self.peaks[key] = max(smoothed(hour) for hour in range(HOURS_PER_WEEK))
+        return smoothed(hour_of_week(timestamp)) / peak if peak else 0.0
+    
+    def interval(self, key, timestamp):
+        """Интервал до следующего опроса без учета джиттера"""
+        if self.states.is_live(key):
+            return self.live_interval
+        if key in self.intervals:
+            return self.intervals[key]
+        score = self.score(key, timestamp)
+        if score is None:
+            return min(max(POLL_INTERVAL, self.min_interval), self.max_interval)
+        return self.max_interval - (self.max_interval - self.min_interval) * score
+    
+    def schedule(self, key, now=None):
+        """Назначение следующего опроса канала после проверки"""
+        now = now or time.time()
+        delay = self.interval(key, now)
+        
+        # Не проспать начало следующего часа, если в нем стрим вероятнее
+        next_hour = (int(now) // 3600 + 1) * 3600
+        if now + delay > next_hour and self.interval(key, next_hour) < delay:
+            delay = next_hour - now
+        
+        if self.jitter:
+            delay *= 1 + random.uniform(-self.jitter, self.jitter)
+        moment = now + max(delay, 1)
+        self.states.set_next_poll(key, moment)
+        return moment
+    
+    def due(self, now=None):
+        """Каналы, которые пора опросить"""
+        return self.states.due(now or time.time())
+    
+    def next_wakeup(self):
+        """Время ближайшего запланированного опроса"""
+        moment = self.states.earliest_poll()
+        return moment if moment is not None else time.time() + POLL_INTERVAL
@@ -0,0 +1,214 @@
+"""
+Распределение каналов между воркерами: консистентное хеширование и аренда
+каналов в общей базе, перераспределение при появлении и пропаже воркеров
+"""
+
+import os
+import time
+import bisect
+import socket
+import sqlite3
+import hashlib
+import logging
+import threading
+from config import (
+    SHARD_STORE_PATH, SHARD_WORKER_ID, SHARD_LEASE_TTL, SHARD_HEARTBEAT_INTERVAL, SHARD_VNODES
+)
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    worker_id TEXT PRIMARY KEY,
+    heartbeat_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS leases (
+    channel TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+) WITHOUT ROWID;
+CREATE INDEX IF NOT EXISTS leases_owner ON leases (owner);
+"""
+
+def default_worker_id():
+    """Идентификатор воркера: хост и PID"""
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+def ring_hash(value):
+    """Стабильный между процессами и хостами 64-битный хеш"""
+    return int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), "big")
+
+class HashRing:
+    """Кольцо консистентного хеширования с виртуальными узлами"""
+    
+    def __init__(self, workers=(), vnodes=SHARD_VNODES):
+        self.vnodes = vnodes
+        self.workers = sorted(set(workers))
+        points = sorted(
+            (ring_hash(f"{worker}#{i}"), worker)
+            for worker in self.workers for i in range(vnodes)
+        )
+        self.hashes = [point for point, _ in points]
+        self.owners = [worker for _, worker in points]
+    
+    def owner(self, key):
+        """Воркер, отвечающий за ключ; None, если воркеров нет"""
+        if not self.hashes:
+            return None
+        index = bisect.bisect(self.hashes, ring_hash(key)) % len(self.hashes)
+        return self.owners[index]
+
+class ShardStore:
+    """Общая база воркеров и аренды каналов (SQLite в режиме WAL)"""
+    
+    def __init__(self, path=SHARD_STORE_PATH):
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        # Базу пишут несколько процессов, ждем блокировку вместо ошибки
+        self.conn.execute("PRAGMA busy_timeout=5000")
+        self.conn.executescript(SCHEMA)
+    
+    def heartbeat(self, worker_id, ttl, now=None):
+        """Отметка воркера и список живых воркеров; просроченные удаляются"""
+        now = now or time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.execute(
+                    "INSERT INTO workers (worker_id, heartbeat_at) VALUES (?, ?) "
+                    "ON CONFLICT (worker_id) DO UPDATE SET heartbeat_at = excluded.heartbeat_at",
+                    (worker_id, now)
+                )
+                self.conn.execute("DELETE FROM workers WHERE heartbeat_at < ?", (now - ttl,))
+                workers = sorted(row[0] for row in self.conn.execute("SELECT worker_id FROM workers"))
+                self.conn.execute("COMMIT")
+            except Exception:
+                # Иначе соединение останется в открытой транзакции и все следующие вызовы упадут
+                self.conn.execute("ROLLBACK")
+                raise
+        return workers
+    
+    def acquire(self, worker_id, channels, ttl, now=None):
+        """Аренда свободных, просроченных и своих каналов; возвращает полученные"""
+        now = now or time.time()
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                self.conn.executemany(
+                    "INSERT INTO leases (channel, owner, expires_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT (channel) DO UPDATE SET owner = excluded.owner, "
+                    "expires_at = excluded.expires_at "
+                    "WHERE leases.owner = excluded.owner OR leases.expires_at < ?",
+                    [(channel, worker_id, now + ttl, now) for channel in channels]
+                )
+                owned = {row[0] for row in self.conn.execute(
+                    "SELECT channel FROM leases WHERE owner = ? AND expires_at >= ?", (worker_id, now)
+                )}
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return owned
+    
+    def release(self, worker_id, channels=None):
+        """Освобождение аренды каналов (всех, если channels=None)"""
+        with self.lock:
+            if channels is None:
+                self.conn.execute("DELETE FROM leases WHERE owner = ?", (worker_id,))
+            else:
+                self.conn.executemany(
+                    "DELETE FROM leases WHERE channel = ? AND owner = ?",
+                    [(channel, worker_id) for channel in channels]
+                )
+    
+    def holds(self, worker_id, channel, now=None):
+        """Действует ли аренда канала у воркера прямо сейчас"""
+        now = now or time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT 1 FROM leases WHERE channel = ? AND owner = ? AND expires_at >= ?",
+                (channel, worker_id, now)
+            ).fetchone()
+        return row is not None
+    
+    def leave(self, worker_id):
+        """Уход воркера: его каналы сразу становятся свободными"""
+        self.release(worker_id)
+        with self.lock:
+            self.conn.execute("DELETE FROM workers WHERE worker_id = ?", (worker_id,))
+    
+    def close(self):
+        """Закрытие базы"""
+        with self.lock:
+            self.conn.close()
+
+class ShardCoordinator(threading.Thread):
+    """Фоновое продление аренды и перераспределение каналов этого воркера"""
+    
+    def __init__(self, store=None, worker_id=SHARD_WORKER_ID, lease_ttl=SHARD_LEASE_TTL,
+                 interval=SHARD_HEARTBEAT_INTERVAL, vnodes=SHARD_VNODES):
+        super().__init__(daemon=True)
+        self.store = store or ShardStore()
+        self.worker_id = worker_id or default_worker_id()
+        self.lease_ttl = lease_ttl
+        self.interval = interval
+        self.vnodes = vnodes
+        self.channels = []
+        self.owned = frozenset()
+        # До этого момента действует аренда, полученная последним удачным продлением
+        self.expires_at = 0.0
+        self.ring = HashRing(vnodes=vnodes)
+        self.stopped = threading.Event()
+    
+    def set_channels(self, channels):
+        """Полный список каналов, который делят воркеры"""
+        self.channels = list(channels)
+    
+    def rebalance(self, now=None):
+        """Один шаг: отметка, кольцо по живым воркерам, аренда своих и отпуск чужих каналов"""
+        now = now or time.time()
+        workers = self.store.heartbeat(self.worker_id, self.lease_ttl, now)
+        if workers != self.ring.workers:
+            self.ring = HashRing(workers, self.vnodes)
+            logger.info(f"🧩 Воркеров: {len(workers)}, перераспределение каналов")
+        
+        wanted = [channel for channel in self.channels if self.ring.owner(channel) == self.worker_id]
+        # Каналы, ушедшие другому воркеру, отпускаем сразу, чтобы он не ждал истечения аренды
+        lost = self.owned.difference(wanted)
+        if lost:
+            self.store.release(self.worker_id, lost)
+        # Канал, который еще держит другой живой воркер, достанется нам после его отпуска
+        self.owned = frozenset(self.store.acquire(self.worker_id, wanted, self.lease_ttl, now))
+        self.expires_at = now + self.lease_ttl
+        return self.owned
+    
+    def holds(self, channel):
+        """Проверка аренды в базе перед постом: защита от двойного объявления"""
+        return self.store.holds(self.worker_id, channel)
+    
+    def run(self):
+        """Периодическое перераспределение"""
+        while not self.stopped.wait(self.interval):
+            try:
+                self.rebalance()
+            except sqlite3.Error as e:
+                # Без продления аренда истечет сама, и каналы заберут другие воркеры
+                logger.error(f"❌ Ошибка базы распределения каналов: {e}")
+                if self.owned and time.time() + self.interval >= self.expires_at:
+                    # До следующей попытки аренда истечет: опрашивать эти каналы больше нельзя
+                    logger.warning(f"⚠️ Аренда каналов не продлена, воркер {self.worker_id} "
+                                   f"отпускает {len(self.owned)}")
+                    self.owned = frozenset()
+    
+    def stop(self):
+        """Остановка с освобождением каналов"""
+        self.stopped.set()
+        if self.is_alive():
+            self.join(timeout=5)
+        try:
+            self.store.leave(self.worker_id)
+        except sqlite3.Error as e:
+            logger.error(f"❌ Не удалось освободить каналы: {e}")
+        self.store.close()
@@ -0,0 +1,175 @@
+"""
+Снимок состояния каналов в файле, отображенном в память: колонки таблицы лежат в нем как есть,
+меняются на месте и при запуске подключаются без разбора
+"""
+
+import os
+import mmap
+import struct
+import logging
+import threading
+from channel_state import COLUMNS
+from config import STATE_SNAPSHOT_PATH, STATE_SNAPSHOT_INTERVAL
+
+logger = logging.getLogger(__name__)
+
+MAGIC = int.from_bytes(b"TAPSTATE", "little")
+VERSION = 1
+
+# Заголовок: сигнатура, версия, емкость, число строк, сброшен ли файл на диск после изменений
+HEADER_SIZE = 64
+H_MAGIC, H_VERSION, H_CAPACITY, H_SIZE, H_CLEAN = range(5)
+
+def layout(capacity):
+    """Смещения колонок и размер файла: у каждого канала фиксированное место в каждой колонке"""
+    offsets = {}
+    offset = HEADER_SIZE
+    for name, typecode in COLUMNS + (("slots", "i"),):
+        count = capacity * 2 if name == "slots" else capacity
+        offsets[name] = (offset, typecode, count)
+        # Колонки выровнены на 8 байт
+        offset += (count * struct.calcsize(typecode) + 7) // 8 * 8
+    return offsets, offset
+
+class StateSnapshot:
+    """Файл состояния каналов; колонки отдаются таблице как memoryview поверх mmap"""
+    
+    def __init__(self, path=STATE_SNAPSHOT_PATH):
+        self.path = path
+        self.file = None
+        self.map = None
+        self.views = []
+        self.header = None
+        self.columns = None
+    
+    def open(self, capacity):
+        """Колонки, число строк и признак сброса на диск; без файла - новая пустая таблица"""
+        if os.path.exists(self.path):
+            try:
+                return self.map_file()
+            except (OSError, ValueError) as e:
+                self.release()
+                if self.file:
+                    self.file.close()
+                logger.warning(f"⚠️ Снимок состояния {self.path} не подходит, начинаем заново: {e}")
+        self.file = open(self.path, "w+b")
+        self.remap(layout(capacity)[1])
+        return self.format(capacity, 0), 0, True
+    
+    def map_file(self):
+        """Подключение существующего файла после проверки заголовка"""
+        self.file = open(self.path, "r+b")
+        if os.fstat(self.file.fileno()).st_size < HEADER_SIZE:
+            raise ValueError("файл короче заголовка")
+        self.remap()
+        header = self.view(0, "Q", HEADER_SIZE // 8)
+        if header[H_MAGIC] != MAGIC or header[H_VERSION] != VERSION:
+            raise ValueError("неизвестный формат")
+        capacity, size = header[H_CAPACITY], header[H_SIZE]
+        offsets, total = layout(capacity)
+        if not capacity or capacity & (capacity - 1) or size > capacity or len(self.map) < total:
+            raise ValueError("файл поврежден")
+        self.header = header
+        self.columns = self.map_columns(offsets)
+        logger.info(f"💾 Состояние каналов подключено из {self.path}: {size}")
+        return self.columns, size, bool(header[H_CLEAN])
+    
+    def remap(self, length=None):
+        """Отображение файла в память; length - новый размер файла"""
+        self.release()
+        if length is not None:
+            # Пока файл отображен, Windows не дает менять его размер
+            self.file.truncate(length)
+        self.map = mmap.mmap(self.file.fileno(), 0)
+    
+    def view(self, offset, typecode, count):
+        """Типизированный memoryview части файла"""
+        base = memoryview(self.map)[offset:offset + count * struct.calcsize(typecode)]
+        view = base.cast(typecode)
+        self.views += [view, base]
+        return view
+    
+    def map_columns(self, offsets):
+        return {name: self.view(offset, typecode, count) for name, (offset, typecode, count) in offsets.items()}
+    
+    def format(self, capacity, size, rows=None):
+        """Разметка файла под capacity каналов; rows - байты первых строк колонок"""
+        offsets, total = layout(capacity)
+        self.map[:total] = bytes(total)
+        for name, data in (rows or {}).items():
+            offset = offsets[name][0]
+            self.map[offset:offset + len(data)] = data
+        offset, _, count = offsets["slots"]
+        # -1 (пустая ячейка индекса) - все байты 0xFF
+        self.map[offset:offset + count * 4] = b"\xff" * (count * 4)
+        
+        header = self.view(0, "Q", HEADER_SIZE // 8)
+        header[H_VERSION] = VERSION
+        header[H_CAPACITY] = capacity
+        header[H_SIZE] = size
+        header[H_CLEAN] = 0
+        # Сигнатура пишется последней: до нее файл не считается снимком
+        header[H_MAGIC] = MAGIC
+        self.header = header
+        self.columns = self.map_columns(offsets)
+        return self.columns
+    
+    def grow(self, capacity, size):
+        """Увеличение файла с переносом строк; индекс таблица перестраивает сама"""
+        rows = {name: self.columns[name][:size].tobytes() for name, _ in COLUMNS}
+        # Сбой посреди переразметки оставит файл без сигнатуры, и он будет создан заново
+        self.header[H_MAGIC] = 0
+        self.map.flush()
+        self.remap(layout(capacity)[1])
+        return self.format(capacity, size, rows)
+    
+    def set_size(self, size):
+        """Число строк; файл отмечается как не сброшенный на диск"""
+        self.header[H_CLEAN] = 0
+        self.header[H_SIZE] = size
+    
+    def flush(self):
+        """Сброс измененных страниц на диск (msync)"""
+        if not self.map:
+            return
+        self.header[H_CLEAN] = 1
+        self.map.flush()
+    
+    def release(self):
+        """Освобождение отображения; memoryview должны быть отпущены до закрытия mmap"""
+        for view in self.views:
+            view.release()
+        self.views = []
+        self.header = None
+        self.columns = None
+        if self.map:
+            self.map.close()
+            self.map = None
+    
+    def close(self):
+        self.flush()
+        self.release()
+        if self.file:
+            self.file.close()
+            self.file = None
+
+class SnapshotFlusher(threading.Thread):
+    """Сброс снимка на диск по расписанию; между сбросами изменения живут в страничном кэше ОС"""
+    
+    def __init__(self, table, interval=STATE_SNAPSHOT_INTERVAL):
+        super().__init__(daemon=True)
+        self.table = table
+        self.interval = interval
+        self.stopped = threading.Event()
+    
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            try:
+                self.table.flush()
+            except (OSError, ValueError) as e:
+                logger.error(f"❌ Ошибка сброса состояния каналов на диск: {e}")
+    
+    def stop(self):
+        self.stopped.set()
+        if self.is_alive():
+            self.join(timeout=5)
@@ -0,0 +1,234 @@
+"""
+Рассылка поста во множество чатов Telegram с соблюдением лимитов Bot API:
+общий поток сообщений, не чаще раза в секунду в один чат и 20 в минуту в группу
+"""
+
+import time
+import heapq
+import logging
+import threading
+from itertools import count
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from config import (
+    TELEGRAM_BROADCAST_RATE, TELEGRAM_CHAT_INTERVAL, TELEGRAM_GROUP_INTERVAL,
+    TELEGRAM_BROADCAST_WORKERS
+)
+
+logger = logging.getLogger(__name__)
+
+# Сколько пар (стрим, чат) помнить, чтобы повторная доставка не дублировала сообщения
+DELIVERED_LIMIT = 100000
+
+def chat_interval(chat_id, chat_interval=TELEGRAM_CHAT_INTERVAL, group_interval=TELEGRAM_GROUP_INTERVAL):
+    """Минимальная пауза между сообщениями в чат: личный чат - по секундному лимиту,
+    группа, канал и @username - по минутному"""
+    chat_id = str(chat_id)
+    if chat_id.startswith("@") or chat_id.startswith("-"):
+        return group_interval
+    return chat_interval
+
+class Broadcast:
+    """Ход рассылки одного поста: когда и с каким результатом доставлено в каждый чат"""
+    
+    def __init__(self, chats):
+        self.chats = list(chats)
+        self.results = {}
+        self.started = time.time()
+        self.done = threading.Event()
+        self.lock = threading.Lock()
+        if not self.chats:
+            self.done.set()
+    
+    def record(self, chat_id, message_id=None, error=None):
+        """Результат отправки в чат"""
+        with self.lock:
+            self.results[chat_id] = {
+                "ok": bool(message_id),
+                "message_id": message_id,
+                "delivered_at": time.time() if message_id else None,
+                "error": error
+            }
+            if len(self.results) == len(self.chats):
+                self.done.set()
+    
+    def wait(self, timeout=None):
+        """Ожидание завершения; True, если все чаты обработаны"""
+        return self.done.wait(timeout)
+    
+    @property
+    def ok(self):
+        """Доставлено ли во все чаты"""
+        return self.done.is_set() and all(result["ok"] for result in self.results.values())
+    
+    @property
+    def delivered(self):
+        """Чаты, куда сообщение доставлено"""
+        return [chat for chat, result in self.results.items() if result["ok"]]
+    
+    def summary(self):
+        """Краткая строка для лога"""
+        with self.lock:
+            times = [r["delivered_at"] for r in self.results.values() if r["ok"]]
+            failed = len(self.results) - len(times)
+        duration = (max(times) - self.started) if times else 0.0
+        text = f"📣 Рассылка в Telegram: {len(times)}/{len(self.chats)} чатов за {duration:.1f}с"
+        return text + (f", ошибок {failed}" if failed else "")
+
+class ChatQueue:
+    """Очередь сообщений одного чата по приоритету и время, когда в него снова можно писать"""
+    
+    __slots__ = ("chat_id", "interval", "jobs", "ready_at")
+    
+    def __init__(self, chat_id, interval):
+        self.chat_id = chat_id
+        self.interval = interval
+        self.jobs = []
+        self.ready_at = 0.0
+
+class TelegramBroadcaster(threading.Thread):
+    """Диспетчер рассылки: из готовых чатов выбирается сообщение с наивысшим приоритетом
+    (меньшее число), общий темп не выше rate сообщений в секунду"""
+    
+    def __init__(self, send, rate=TELEGRAM_BROADCAST_RATE, workers=TELEGRAM_BROADCAST_WORKERS):
+        super().__init__(daemon=True)
+        self.send = send
+        self.rate = rate
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="broadcast")
+        self.condition = threading.Condition()
+        self.chats = {}
+        # Чаты с сообщениями: готовые - по приоритету головы очереди, ждущие - по времени
+        self.ready = []
+        self.waiting = []
+        self.sequence = count()
+        self.next_slot = 0.0
+        self.delivered = OrderedDict()
+        # Сообщения в очередях чатов по (стрим, чат): повтор заменяет их, а не добавляет второе
+        self.queued = {}
+        self.stopped = False
+    
+    def broadcast(self, payload, chats, priority=0, stream_id=None):
+        """Постановка поста в очередь всех чатов; возвращает Broadcast"""
+        chats = list(dict.fromkeys(str(chat).strip() for chat in chats if str(chat).strip()))
+        if stream_id is not None:
+            # Повтор после частичной неудачи: в чаты, куда уже дошло, не пишем
+            with self.condition:
+                chats = [chat for chat in chats if (stream_id, chat) not in self.delivered]
+        broadcast = Broadcast(chats)
+        with self.condition:
+            for chat in chats:
+                job = (priority, next(self.sequence), payload, broadcast, stream_id)
+                if stream_id is not None:
+                    self.drop(chat, self.queued.get((stream_id, chat)))
+                    self.queued[(stream_id, chat)] = job
+                self.push(chat, job)
+            self.condition.notify()
+        return broadcast
+    
+    def drop(self, chat_id, job):
+        """Удаление еще не отправленного сообщения из очереди чата"""
+        queue = self.chats.get(chat_id)
+        if job is None or queue is None or job not in queue.jobs:
+            return
+        queue.jobs.remove(job)
+        heapq.heapify(queue.jobs)
+        job[3].record(chat_id, error="заменено повторной рассылкой")
+        if queue.jobs and queue.ready_at <= time.monotonic():
+            # Запись ready указывала на удаленное сообщение
+            head = queue.jobs[0]
+            heapq.heappush(self.ready, (head[0], head[1], chat_id))
+    
+    def push(self, chat_id, job):
+        """Добавление сообщения в очередь чата"""
+        queue = self.chats.get(chat_id)
+        if queue is None:
+            # Очередь чата не удаляется: в ней помнится, когда в чат писали последний раз
+            queue = self.chats[chat_id] = ChatQueue(chat_id, chat_interval(chat_id))
+        heapq.heappush(queue.jobs, job)
+        if queue.ready_at <= time.monotonic():
+            # Прежняя запись чата в ready остается и отбрасывается при выборке
+            heapq.heappush(self.ready, (job[0], job[1], chat_id))
+        elif len(queue.jobs) == 1:
+            heapq.heappush(self.waiting, (queue.ready_at, chat_id))
+    
+    def next_job(self, now):
+        """Следующее сообщение, которое можно отправить сейчас, и сколько ждать, если такого нет"""
+        while self.waiting and self.waiting[0][0] <= now:
+            _, chat_id = heapq.heappop(self.waiting)
+            queue = self.chats[chat_id]
+            if queue.jobs:
+                head = queue.jobs[0]
+                heapq.heappush(self.ready, (head[0], head[1], chat_id))
+        
+        if self.next_slot > now:
+            return None, self.next_slot - now
+        
+        while self.ready:
+            _, sequence, chat_id = heapq.heappop(self.ready)
+            queue = self.chats[chat_id]
+            if not queue.jobs or queue.jobs[0][1] != sequence or queue.ready_at > now:
+                continue
+            job = heapq.heappop(queue.jobs)
+            queue.ready_at = now + queue.interval
+            if queue.jobs:
+                heapq.heappush(self.waiting, (queue.ready_at, chat_id))
+            self.next_slot = max(self.next_slot, now) + 1 / self.rate
+            return (chat_id,) + job, 0
+        
+        return None, (self.waiting[0][0] - now) if self.waiting else None
+    
+    def run(self):
+        """Цикл диспетчера"""
+        while True:
+            with self.condition:
+                if self.stopped:
+                    return
+                job, wait = self.next_job(time.monotonic())
+                if job is None:
+                    self.condition.wait(wait)
+                    continue
+            # Отправка идет в пуле: задержка ответа не снижает темп рассылки
+            self.executor.submit(self.deliver, job)
+    
+    def deliver(self, job):
+        """Отправка сообщения в чат и учет результата"""
+        chat_id, _, _, payload, broadcast, stream_id = job
+        with self.condition:
+            queued = self.queued.get((stream_id, chat_id))
+            if queued and queued[1] == job[2]:
+                del self.queued[(stream_id, chat_id)]
+            # Пока сообщение ждало, в чат могла дойти прежняя рассылка того же стрима
+            message_id = self.delivered.get((stream_id, chat_id)) if stream_id is not None else None
+        if message_id:
+            broadcast.record(chat_id, message_id)
+            return
+        try:
+            message_id = self.send(payload, chat_id)
+            error = None if message_id else "не отправлено"
+        except Exception as e:
+            message_id, error = None, str(e)
+        
+        if message_id and stream_id is not None:
+            with self.condition:
+                self.delivered[(stream_id, chat_id)] = message_id
+                if len(self.delivered) > DELIVERED_LIMIT:
+                    self.delivered.popitem(last=False)
+        broadcast.record(chat_id, message_id, error)
+        extra = {"platform": "telegram", "destination": f"telegram:{chat_id}",
+                 "stream_id": stream_id, "latency": time.time() - broadcast.started}
+        if message_id:
+            logger.debug(f"📣 Доставлено в чат {chat_id}", extra=extra)
+        else:
+            logger.warning(f"⚠️ Не доставлено в чат {chat_id}: {error}", extra=extra)
+    
+    def pending(self):
+        """Число сообщений, ожидающих отправки"""
+        with self.condition:
+            return sum(len(queue.jobs) for queue in self.chats.values())
+    
+    def stop(self):
+        """Остановка диспетчера; неотправленные сообщения отбрасываются"""
+        with self.condition:
+            self.stopped = True
+            self.condition.notify()
+        self.executor.shutdown(wait=False, cancel_futures=True)
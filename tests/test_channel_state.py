@@ -0,0 +1,187 @@
+"""
+Таблица состояния каналов и ее снимок: python -m unittest discover tests
+"""
+
+import os
+import random
+import shutil
+import tempfile
+import unittest
+
+from channel_state import ChannelStateTable, EMPTY, key_code
+from state_snapshot import StateSnapshot
+from scheduler import AdaptivePollScheduler
+
+def colliding_keys(table, count):
+    """Числовые ключи с одной начальной ячейкой индекса"""
+    home = table.home(key_code("1"))
+    keys = [str(value) for value in range(1, 100000) if table.home(value) == home]
+    return keys[:count]
+
+class ChannelStateTableTest(unittest.TestCase):
+    """Удаление со сдвигом назад не должно терять каналы из цепочек поиска"""
+    
+    def assert_consistent(self, table, expected):
+        self.assertEqual(len(table), len(expected))
+        for key, stream in expected.items():
+            row = table.row(key)
+            self.assertNotEqual(row, EMPTY, key)
+            self.assertEqual(table.keys[row], key)
+            self.assertEqual(table.get(key)["stream"], stream)
+        used = [row for row in table.slots if row != EMPTY]
+        self.assertEqual(sorted(used), list(range(len(table))))
+    
+    def test_remove_head_of_chain(self):
+        table = ChannelStateTable(capacity=16)
+        keys = colliding_keys(table, 4)
+        self.assertEqual(len(keys), 4)
+        for index, key in enumerate(keys):
+            table.transition(key, True, stream_id=str(index + 1))
+        
+        self.assertTrue(table.remove(keys[0]))
+        self.assertFalse(table.remove(keys[0]))
+        self.assertNotIn(keys[0], table)
+        self.assert_consistent(table, {key: index + 1 for index, key in enumerate(keys) if index})
+    
+    def test_remove_wraps_around_index(self):
+        table = ChannelStateTable(capacity=16)
+        last = len(table.slots) - 1
+        keys = [str(value) for value in range(1, 100000) if table.home(value) == last][:3]
+        for index, key in enumerate(keys):
+            table.transition(key, True, stream_id=str(index + 1))
+        
+        table.remove(keys[1])
+        self.assert_consistent(table, {keys[0]: 1, keys[2]: 3})
+    
+    def test_random_operations_match_dict(self):
+        rng = random.Random(7)
+        table = ChannelStateTable(capacity=16)
+        expected = {}
+        for _ in range(5000):
+            key = rng.choice([str(rng.randrange(300)), f"login{rng.randrange(300)}"])
+            if rng.random() < 0.4:
+                self.assertEqual(table.remove(key), key in expected)
+                expected.pop(key, None)
+            else:
+                stream = rng.randrange(1, 10 ** 6)
+                table.transition(key, False)
+                table.transition(key, True, stream_id=str(stream))
+                expected[key] = stream
+        self.assert_consistent(table, expected)
+        
+        table.retain(list(expected)[:50])
+        self.assert_consistent(table, {key: expected[key] for key in list(expected)[:50]})
+
+class StateSnapshotTest(unittest.TestCase):
+    """Таблица в отображенном файле переживает закрытие и сбой"""
+    
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.workdir, "channel_state.bin")
+    
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+    
+    def fill(self, table, count):
+        for index in range(count):
+            key = f"login{index}"
+            table.transition(key, index % 3 == 0, stream_id=str(index + 1), started_at=1000.0 + index)
+            table.set_next_poll(key, 2000.0 + index)
+    
+    def assert_restored(self, table, count):
+        self.assertEqual(len(table), count)
+        for index in range(count):
+            key = f"login{index}"
+            self.assertEqual(table.is_live(key), index % 3 == 0)
+            self.assertEqual(table.next_poll_at(key), 2000.0 + index)
+            self.assertEqual(table.get(key)["stream"], index + 1 if index % 3 == 0 else 0)
+    
+    def test_reopen_after_close(self):
+        table = ChannelStateTable(capacity=16, storage=StateSnapshot(self.path))
+        # Больше начальной емкости: файл увеличивается с переносом строк
+        self.fill(table, 100)
+        table.remove("login5")
+        table.close()
+        
+        table = ChannelStateTable(capacity=16, storage=StateSnapshot(self.path))
+        self.assertEqual(len(table), 99)
+        self.assertNotIn("login5", table)
+        self.assertTrue(table.is_live("login3"))
+        self.assertEqual(table.next_poll_at("login99"), 2099.0)
+        self.assertTrue(table.transition("login0", True, stream_id="1"))
+        self.assertFalse(table.transition("login0", True, stream_id="500"))
+        table.close()
+    
+    def test_reopen_after_crash_rebuilds_index(self):
+        table = ChannelStateTable(capacity=16, storage=StateSnapshot(self.path))
+        self.fill(table, 40)
+        table.flush()
+        table.transition("login40", True, stream_id="41")
+        # Процесс упал без сброса после добавления канала: индекс мог не дойти до файла
+        for slot in range(len(table.slots)):
+            table.slots[slot] = EMPTY
+        table.storage.release()
+        table.storage.file.close()
+        
+        with self.assertLogs("channel_state", "WARNING"):
+            table = ChannelStateTable(capacity=16, storage=StateSnapshot(self.path))
+        self.assertTrue(table.is_live("login40"))
+        self.assertEqual(len(table), 41)
+        self.assertEqual(table.next_poll_at("login39"), 2039.0)
+        table.close()
+    
+    def test_restored_channels_are_scheduled(self):
+        table = ChannelStateTable(capacity=16, storage=StateSnapshot(self.path))
+        self.fill(table, 20)
+        table.close()
+        
+        table = ChannelStateTable(capacity=16, storage=StateSnapshot(self.path))
+        scheduler = AdaptivePollScheduler.fixed(60, states=table)
+        keys = [f"login{index}" for index in range(20)]
+        for key in keys:
+            scheduler.add_channel(key, now=100.0)
+        self.assertEqual(sorted(scheduler.due(2010.0)), sorted(keys[:11]))
+        self.assertEqual(sorted(scheduler.due(3000.0)), sorted(keys))
+        self.assertEqual(scheduler.next_wakeup(), 2000.0)
+        table.close()
+    
+    def test_damaged_file_starts_empty(self):
+        with open(self.path, "wb") as f:
+            f.write(b"not a snapshot" * 10)
+        with self.assertLogs("state_snapshot", "WARNING"):
+            table = ChannelStateTable(capacity=16, storage=StateSnapshot(self.path))
+        self.assertEqual(len(table), 0)
+        self.fill(table, 3)
+        self.assert_restored(table, 3)
+        table.close()
+
+class SchedulerStateTest(unittest.TestCase):
+    """Расписание читает и пишет колонки таблицы, своей копии у него нет"""
+    
+    def setUp(self):
+        self.states = ChannelStateTable()
+        self.scheduler = AdaptivePollScheduler.fixed(60, states=self.states)
+    
+    def test_schedule_uses_table(self):
+        self.scheduler.add_channel("a", now=100.0)
+        self.scheduler.add_channel("b", now=200.0)
+        self.assertEqual(self.scheduler.due(150.0), ["a"])
+        self.assertEqual(self.scheduler.next_wakeup(), 100.0)
+        
+        moment = self.scheduler.schedule("a", now=150.0)
+        self.assertEqual(self.states.next_poll_at("a"), moment)
+        self.assertEqual(moment, 210.0)
+        self.assertEqual(self.scheduler.due(205.0), ["b"])
+        
+        self.scheduler.remove_channel("b")
+        self.assertEqual(self.scheduler.due(1000.0), ["a"])
+    
+    def test_restored_schedule_is_kept(self):
+        self.states.set_next_poll("a", 500.0)
+        self.states.transition("a", True, stream_id="1")
+        self.scheduler.add_channel("a", now=100.0)
+        self.assertEqual(self.scheduler.due(400.0), [])
+        self.assertEqual(self.scheduler.interval("a", 500.0), self.scheduler.live_interval)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,72 @@
+"""
+Автоматы защиты и отложенные посты: python -m unittest discover tests
+"""
+
+import time
+import unittest
+from functools import partial
+from types import SimpleNamespace
+
+from circuit_breaker import CircuitBreakers, ParkingLot, OPEN, CLOSED
+from main import TwitchAutoPoster
+
+class FailedProbeTest(unittest.TestCase):
+    """Неудачная проба не должна терять отложенный пост"""
+    
+    def setUp(self):
+        self.breakers = CircuitBreakers(failure_threshold=1, probe_interval=0.05)
+        self.breaker = self.breakers.get("vk", "wall.post")
+        self.parking = ParkingLot(self.breakers)
+        self.up = False
+        self.sent = []
+        self.poster = SimpleNamespace(parking=self.parking, deliver=self.deliver)
+        self.poster.deliver_or_park = partial(TwitchAutoPoster.deliver_or_park, self.poster)
+    
+    def deliver(self, destination, payload):
+        """Доставка через контур, как в PlatformSession"""
+        if not self.breaker.allow():
+            return False
+        if not self.up:
+            self.breaker.record_failure()
+            return False
+        self.breaker.record_success()
+        self.sent.append(destination)
+        return True
+    
+    def release(self):
+        """Один проход цикла ParkingLot.run"""
+        for work in self.parking.release("vk", time.monotonic()):
+            work()
+    
+    def test_failed_probe_is_parked_again(self):
+        self.assertFalse(self.poster.deliver_or_park("vk:1", {}))
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.parking.depth(), 1)
+        
+        time.sleep(0.06)
+        self.release()
+        self.assertEqual(self.breaker.state, OPEN)
+        self.assertEqual(self.parking.depth(), 1)
+        self.assertEqual(self.sent, [])
+        
+        self.up = True
+        time.sleep(0.06)
+        self.release()
+        self.assertEqual(self.breaker.state, CLOSED)
+        self.assertEqual(self.parking.depth(), 0)
+        self.assertEqual(self.sent, ["vk:1"])
+    
+    def test_failed_probe_keeps_order(self):
+        self.poster.deliver_or_park("vk:1", {})
+        self.poster.deliver_or_park("vk:2", {})
+        time.sleep(0.06)
+        self.release()
+        
+        self.up = True
+        time.sleep(0.06)
+        self.release()
+        self.release()
+        self.assertEqual(self.sent, ["vk:1", "vk:2"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,60 @@
+"""
+Прием уведомлений EventSub: python -m unittest discover tests
+"""
+
+import queue
+import unittest
+import urllib.error
+import urllib.request
+
+from eventsub import EventSubReceiver, build_notification
+
+SECRET = "test-secret-0123456789"
+EVENT = {"broadcaster_user_id": "100", "broadcaster_user_login": "streamer"}
+
+class EventSubReceiverTest(unittest.TestCase):
+    """Подпись, подтверждение подписки и повторная доставка"""
+    
+    def setUp(self):
+        self.events = queue.Queue()
+        self.receiver = EventSubReceiver(lambda *event: self.events.put(event), secret=SECRET,
+                                         host="127.0.0.1", port=0)
+        self.receiver.start()
+    
+    def tearDown(self):
+        self.receiver.stop()
+    
+    def post(self, headers, body):
+        """Код ответа и тело"""
+        request = urllib.request.Request(f"http://127.0.0.1:{self.receiver.port}/", data=body,
+                                         headers=headers, method="POST")
+        try:
+            with urllib.request.urlopen(request, timeout=5) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode()
+    
+    def test_challenge_is_echoed(self):
+        headers, body = build_notification(SECRET, "stream.online", {},
+                                           message_type="webhook_callback_verification",
+                                           challenge="pogchamp-kappa-360noscope")
+        self.assertEqual(self.post(headers, body), (200, "pogchamp-kappa-360noscope"))
+    
+    def test_bad_signature_is_rejected(self):
+        headers, body = build_notification("another-secret-0123456789", "stream.online", EVENT)
+        self.assertEqual(self.post(headers, body)[0], 403)
+        self.assertTrue(self.events.empty())
+    
+    def test_duplicate_message_is_dropped(self):
+        headers, body = build_notification(SECRET, "stream.online", EVENT, message_id="m1")
+        self.assertEqual(self.post(headers, body)[0], 204)
+        self.assertEqual(self.post(headers, body)[0], 204)
+        headers, body = build_notification(SECRET, "stream.offline", EVENT, message_id="m2")
+        self.assertEqual(self.post(headers, body)[0], 204)
+        
+        self.assertEqual(self.events.get(timeout=5), ("stream.online", EVENT))
+        self.assertEqual(self.events.get(timeout=5), ("stream.offline", EVENT))
+        self.assertTrue(self.events.empty())
+
+if __name__ == "__main__":
+    unittest.main()
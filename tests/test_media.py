@@ -0,0 +1,93 @@
+"""
+Кэш превью на диске: python -m unittest discover tests
+"""
+
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from media import MediaCache
+
+class FakeResponse:
+    def __init__(self, status_code, content=b"", headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+class FakeSession:
+    """Отвечает 200 на первый запрос адреса и 304 на условный; считает одновременные запросы"""
+    
+    def __init__(self, delay=0):
+        self.delay = delay
+        self.active = 0
+        self.max_active = 0
+        self.calls = 0
+        self.lock = threading.Lock()
+    
+    def get(self, url, headers=None):
+        with self.lock:
+            self.calls += 1
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(self.delay)
+        with self.lock:
+            self.active -= 1
+        if headers and headers.get("If-None-Match"):
+            return FakeResponse(304)
+        return FakeResponse(200, url.encode() * 100, {"ETag": f'"{url}"'})
+
+class MediaCacheTest(unittest.TestCase):
+    """Блокировки по адресу не копятся, индекс пишется только при изменениях"""
+    
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        self.saves = 0
+    
+    def tearDown(self):
+        shutil.rmtree(self.workdir)
+    
+    def cache(self, session, **kwargs):
+        cache = MediaCache(session, cache_dir=self.workdir, fresh_for=0, **kwargs)
+        save = cache.save
+        def counting_save():
+            self.saves += 1
+            save()
+        cache.save = counting_save
+        return cache
+    
+    def test_key_locks_are_dropped(self):
+        session = FakeSession(delay=0.01)
+        cache = self.cache(session)
+        threads = [threading.Thread(target=cache.get, args=(f"http://img/{index % 3}",))
+                   for index in range(12)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        
+        self.assertEqual(cache.key_locks, {})
+        # Один адрес по-прежнему загружается не больше чем одним потоком
+        self.assertLessEqual(session.max_active, 3)
+        self.assertIsNotNone(cache.upload_once("telegram", "k", lambda: "file-id"))
+        self.assertEqual(cache.key_locks, {})
+    
+    def test_index_saved_only_on_change(self):
+        cache = self.cache(FakeSession())
+        self.assertIsNotNone(cache.get("http://img/a"))
+        self.assertEqual(self.saves, 1)
+        # Подтверждение 304 без вытеснения не переписывает index.json
+        self.assertIsNotNone(cache.get("http://img/a"))
+        self.assertEqual(self.saves, 1)
+    
+    def test_eviction_saves_index(self):
+        cache = self.cache(FakeSession(), max_bytes=1500)
+        cache.get("http://img/a")
+        cache.get("http://img/b")
+        self.assertEqual(self.saves, 2)
+        self.assertEqual(len(cache.index["files"]), 1)
+        self.assertNotIn("http://img/a", cache.index["urls"])
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,40 @@
+"""
+Очередь постов: python -m unittest discover tests
+"""
+
+import os
+import shutil
+import sqlite3
+import tempfile
+import unittest
+
+from outbox import Outbox
+
+class LockedEnqueueTest(unittest.TestCase):
+    """Ошибка внутри транзакции не должна оставлять соединение в открытой транзакции"""
+    
+    def setUp(self):
+        self.workdir = tempfile.mkdtemp()
+        path = os.path.join(self.workdir, "outbox.db")
+        self.outbox = Outbox(path)
+        self.outbox.conn.execute("PRAGMA busy_timeout=50")
+        self.blocker = sqlite3.connect(path, isolation_level=None)
+    
+    def tearDown(self):
+        self.blocker.close()
+        self.outbox.close()
+        shutil.rmtree(self.workdir)
+    
+    def test_enqueue_after_locked_database(self):
+        self.blocker.execute("BEGIN IMMEDIATE")
+        with self.assertRaises(sqlite3.OperationalError):
+            self.outbox.enqueue("s1", {"telegram": {"message": "a"}})
+        self.assertFalse(self.outbox.conn.in_transaction)
+        self.blocker.execute("ROLLBACK")
+        
+        self.assertEqual(self.outbox.enqueue("s1", {"telegram": {"message": "a"}}), 1)
+        items = self.outbox.claim()
+        self.assertEqual([item["destination"] for item in items], ["telegram"])
+
+if __name__ == "__main__":
+    unittest.main()
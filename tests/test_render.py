@@ -0,0 +1,30 @@
+"""
+Рендер сообщений под лимиты платформ: python -m unittest discover tests
+"""
+
+import unittest
+
+from render import TelegramHTMLRenderer, TelegramMarkdownV2Renderer, utf16_len
+
+TEMPLATES = {"message": "🎥 {title}\nhttps://twitch.tv/{login}"}
+
+class TitleShorteningTest(unittest.TestCase):
+    """Длинное название укорачивается до экранирования и не теряет текст после &"""
+    
+    def test_ampersand_in_long_html_title(self):
+        renderer = TelegramHTMLRenderer()
+        values = {"title": "Q&A_marathon_" + "x" * 200, "login": "streamer"}
+        message = renderer.render(TEMPLATES, values, limit=120)
+        self.assertLessEqual(utf16_len(message), 120)
+        self.assertIn("Q&amp;A_marathon_xxx", message)
+        self.assertIn("…\nhttps://twitch.tv/streamer", message)
+    
+    def test_backslash_in_long_markdown_title(self):
+        renderer = TelegramMarkdownV2Renderer()
+        values = {"title": "a\\" * 100, "login": "streamer"}
+        message = renderer.render(TEMPLATES, values, limit=120)
+        self.assertLessEqual(utf16_len(message), 120)
+        self.assertIn("https://twitch\\.tv/streamer", message)
+
+if __name__ == "__main__":
+    unittest.main()
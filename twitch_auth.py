@@ -0,0 +1,132 @@
+"""
+Менеджер токена приложения Twitch с кэшем на диске и автообновлением
+"""
+
+import os
+import json
+import time
+import threading
+from config import (
+    TWITCH_CLIENT_ID, TWITCH_CLIENT_SECRET, TWITCH_AUTH_URL,
+    TWITCH_TOKEN_CACHE, TWITCH_TOKEN_REFRESH_MARGIN, TWITCH_TOKEN_VALIDATE_INTERVAL
+)
+
+class TwitchTokenManager:
+    """Хранение, обновление и проверка client-credentials токена"""
+    
+    def __init__(self, session, cache_path=TWITCH_TOKEN_CACHE,
+                 refresh_margin=TWITCH_TOKEN_REFRESH_MARGIN,
+                 validate_interval=TWITCH_TOKEN_VALIDATE_INTERVAL):
+        self.session = session
+        self.cache_path = cache_path
+        self.refresh_margin = refresh_margin
+        self.validate_interval = validate_interval
+        self.access_token = None
+        self.expires_at = 0
+        self.validated_at = 0
+        self.last_error = None
+        self.lock = threading.Lock()
+        self.load()
+    
+    def load(self):
+        """Загрузка токена из кэша на диске"""
+        if not self.cache_path or not os.path.exists(self.cache_path):
+            return
+        try:
+            with open(self.cache_path, encoding='utf-8') as f:
+                cached = json.load(f)
+        except (OSError, ValueError):
+            return
+        
+        # Токен другого приложения нам не подходит
+        if cached.get("client_id") != TWITCH_CLIENT_ID:
+            return
+        self.access_token = cached.get("access_token")
+        self.expires_at = cached.get("expires_at", 0)
+        self.validated_at = cached.get("validated_at", 0)
+    
+    def save(self):
+        """Атомарное сохранение токена в кэш"""
+        if not self.cache_path:
+            return
+        data = {
+            "client_id": TWITCH_CLIENT_ID,
+            "access_token": self.access_token,
+            "expires_at": self.expires_at,
+            "validated_at": self.validated_at
+        }
+        tmp_path = f"{self.cache_path}.tmp"
+        try:
+            fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with os.fdopen(fd, 'w', encoding='utf-8') as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.cache_path)
+        except OSError as e:
+            self.last_error = f"не удалось сохранить кэш токена: {e}"
+    
+    def is_fresh(self, now=None):
+        """Действителен ли токен с учетом запаса до истечения"""
+        now = now or time.time()
+        return bool(self.access_token) and now < self.expires_at - self.refresh_margin
+    
+    def get_token(self):
+        """Токен из кэша или None, если его нужно получить заново"""
+        with self.lock:
+            now = time.time()
+            if not self.is_fresh(now):
+                return None
+            if now - self.validated_at >= self.validate_interval:
+                self.validate()
+            return self.access_token if self.is_fresh() else None
+    
+    def refresh(self):
+        """Получение нового токена через client credentials"""
+        with self.lock:
+            data = {
+                "client_id": TWITCH_CLIENT_ID,
+                "client_secret": TWITCH_CLIENT_SECRET,
+                "grant_type": "client_credentials"
+            }
+            response = self.session.post(f"{TWITCH_AUTH_URL}/token", data=data)
+            if response.status_code != 200:
+                self.last_error = response.status_code
+                return None
+            
+            payload = response.json()
+            now = time.time()
+            self.access_token = payload["access_token"]
+            self.expires_at = now + payload.get("expires_in", 0)
+            self.validated_at = now
+            self.last_error = None
+            self.save()
+            return self.access_token
+    
+    def validate(self):
+        """Периодическая проверка токена через /oauth2/validate"""
+        try:
+            response = self.session.get(
+                f"{TWITCH_AUTH_URL}/validate",
+                headers={"Authorization": f"OAuth {self.access_token}"}
+            )
+        except Exception as e:
+            # Сетевая ошибка не повод выбрасывать токен
+            self.last_error = e
+            return
+        
+        if response.status_code == 200:
+            self.validated_at = time.time()
+            expires_in = response.json().get("expires_in")
+            if expires_in is not None:
+                self.expires_at = self.validated_at + expires_in
+            self.save()
+        elif response.status_code == 401:
+            self.access_token = None
+            self.expires_at = 0
+            self.save()
+    
+    def invalidate(self):
+        """Сброс токена после ответа 401"""
+        with self.lock:
+            self.access_token = None
+            self.expires_at = 0
+            self.save()
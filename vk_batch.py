@@ -0,0 +1,90 @@
+"""
+Пакетная публикация в VK: до 25 вызовов wall.post в одном запросе execute (VKScript)
+"""
+
+import json
+import logging
+from config import VK_API_URL, VK_ACCESS_TOKEN, VK_API_VERSION, VK_BATCH_SIZE
+
+logger = logging.getLogger(__name__)
+
+# Больше 25 вызовов API в одном execute VK не выполняет
+EXECUTE_MAX_CALLS = 25
+
+# Ограничение на размер кода, чтобы длинные посты не превысили размер запроса
+EXECUTE_MAX_CODE = 60000
+
+def wall_post_call(group_id, message, attachments=None):
+    """Вызов API.wall.post в VKScript; параметры - JSON-объект, он же литерал VKScript"""
+    params = {"owner_id": -int(group_id), "message": message}
+    if attachments:
+        params["attachments"] = attachments
+    return f"API.wall.post({json.dumps(params, ensure_ascii=False)})"
+
+def build_code(calls):
+    """Код execute: массив результатов вызовов в исходном порядке"""
+    return "return [" + ",".join(calls) + "];"
+
+def chunk_calls(calls, size=VK_BATCH_SIZE, max_code=EXECUTE_MAX_CODE):
+    """Разбиение вызовов на пакеты по числу и по суммарному размеру кода"""
+    size = max(1, min(size, EXECUTE_MAX_CALLS))
+    chunk, length = [], 0
+    for index, call in enumerate(calls):
+        if chunk and (len(chunk) >= size or length + len(call) + 1 > max_code):
+            yield chunk
+            chunk, length = [], 0
+        chunk.append(index)
+        length += len(call) + 1
+    if chunk:
+        yield chunk
+
+class VKBatchPoster:
+    """Публикация одного поста во много групп пакетами execute"""
+    
+    def __init__(self, session, batch_size=VK_BATCH_SIZE):
+        self.session = session
+        self.batch_size = batch_size
+    
+    def post(self, posts):
+        """posts - [(group_id, message, attachments)]; возвращает [(post_id или None, ошибка)] в том же порядке"""
+        calls = [wall_post_call(*post) for post in posts]
+        results = [(None, "не отправлено")] * len(posts)
+        for chunk in chunk_calls(calls, self.batch_size):
+            for index, result in zip(chunk, self.execute([calls[i] for i in chunk])):
+                results[index] = result
+        return results
+    
+    def execute(self, calls):
+        """Один запрос execute; ошибка запроса целиком относится ко всем его вызовам"""
+        data = {"code": build_code(calls), "access_token": VK_ACCESS_TOKEN, "v": VK_API_VERSION}
+        try:
+            response = self.session.post(f"{VK_API_URL}/execute", data=data)
+        except Exception as e:
+            return [(None, str(e))] * len(calls)
+        if response.status_code != 200:
+            return [(None, f"HTTP {response.status_code}")] * len(calls)
+        try:
+            result = response.json()
+        except ValueError:
+            return [(None, "некорректный ответ")] * len(calls)
+        if "response" not in result:
+            error = result.get("error") or {}
+            return [(None, f"{error.get('error_code')}: {error.get('error_msg')}")] * len(calls)
+        return self.map_results(result["response"], result.get("execute_errors") or [], len(calls))
+    
+    @staticmethod
+    def map_results(responses, errors, count):
+        """Сопоставление ответа с вызовами: неудачный вызов дает false, а его ошибки
+        идут в execute_errors в том же порядке"""
+        if not isinstance(responses, list):
+            responses = []
+        errors = iter(errors)
+        results = []
+        for index in range(count):
+            value = responses[index] if index < len(responses) else False
+            if isinstance(value, dict) and value.get("post_id"):
+                results.append((value["post_id"], None))
+                continue
+            error = next(errors, None) or {}
+            results.append((None, f"{error.get('error_code')}: {error.get('error_msg')}" if error else "нет ответа"))
+        return results
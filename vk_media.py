@@ -0,0 +1,70 @@
+"""
+Загрузка фото для постов VK: photos.getWallUploadServer -> upload -> photos.saveWallPhoto
+"""
+
+import logging
+from config import VK_API_URL, VK_ACCESS_TOKEN, VK_API_VERSION
+
+logger = logging.getLogger(__name__)
+
+class VKPhotoUploader:
+    """Загружает картинку один раз и переиспользует вложение photo{owner}_{id} во всех группах"""
+    
+    def __init__(self, session, media, upload_session=None):
+        self.session = session
+        self.media = media
+        # Сервер загрузки - не метод API, квота VK на него не тратится
+        self.upload_session = upload_session or session
+    
+    def call(self, method, **params):
+        """Вызов метода VK API; None при ошибке"""
+        data = dict(params, access_token=VK_ACCESS_TOKEN, v=VK_API_VERSION)
+        response = self.session.post(f"{VK_API_URL}/{method}", data=data)
+        if response.status_code != 200:
+            logger.error(f"❌ Ошибка {method}: {response.status_code}")
+            return None
+        result = response.json()
+        if "response" not in result:
+            logger.error(f"❌ Ошибка {method}: {result.get('error')}")
+            return None
+        return result["response"]
+    
+    def upload(self, key, group_id):
+        """Загрузка картинки на стену группы; возвращает строку вложения"""
+        server = self.call("photos.getWallUploadServer", group_id=group_id)
+        if not server:
+            return None
+        
+        files = {"photo": ("thumbnail.jpg", self.media.read(key), "image/jpeg")}
+        response = self.upload_session.post(server["upload_url"], files=files)
+        if response.status_code != 200:
+            logger.error(f"❌ Ошибка загрузки фото в VK: {response.status_code}")
+            return None
+        uploaded = response.json()
+        if not uploaded.get("photo") or uploaded["photo"] == "[]":
+            logger.error(f"❌ VK не принял фото: {uploaded}")
+            return None
+        
+        saved = self.call(
+            "photos.saveWallPhoto",
+            group_id=group_id,
+            photo=uploaded["photo"],
+            server=uploaded["server"],
+            hash=uploaded["hash"]
+        )
+        if not saved:
+            return None
+        photo = saved[0]
+        attachment = f"photo{photo['owner_id']}_{photo['id']}"
+        if photo.get("access_key"):
+            attachment += f"_{photo['access_key']}"
+        return attachment
+    
+    def attachment(self, photo_url, group_id):
+        """Вложение для wall.post; None, если фото получить не удалось"""
+        photo = self.media.get(photo_url)
+        if photo is None:
+            return None
+        return self.media.upload_once(
+            "vk", photo["key"], lambda: self.upload(photo["key"], group_id)
+        )